@@ -4,7 +4,17 @@ from PIL import Image, ExifTags
 from PIL.PngImagePlugin import PngInfo
 from flask import request, jsonify
 from db import get_db_connection
-from image_utils import optimize_image_with_metadata, create_thumbnail_with_metadata
+from search import build_match_query, highlight_snippet, SNIPPET_SQL, RANK_SQL
+from gallery import fetch_artwork_page, serialize_artwork, InvalidCursor
+from palette import InvalidColor
+from config import GALLERY_PAGE_SIZE, GALLERY_MAX_PAGE_SIZE, SIMILAR_MAX_DISTANCE, SIMILAR_LIMIT
+from ordering import move_artwork, rebalancer, InvalidMove
+from jobs import get_job
+from image_utils import process_image, read_ai_metadata, parse_sd_parameters
+from revision import bump_revision, etag_on_revision
+from response_cache import cached_response, response_cache
+from fragments import tile_cache
+from similarity import find_similar, similar_artworks, near_duplicates, duplicate_warning
 
 # Remove duplicate functions - use ones from image_utils instead
 # preserve_metadata_resize, create_thumbnail_with_metadata - moved to image_utils
@@ -13,31 +23,15 @@ from image_utils import optimize_image_with_metadata, create_thumbnail_with_meta
 def process_uploaded_image(uploaded_file_path, save_path, thumbnail_path=None):
     """
     FIXED: Full upload processing pipeline that properly preserves metadata
+    The thumbnail is written to thumbnail_path, if given
     """
     try:
-        # If paths are the same, optimize in place
-        if uploaded_file_path == save_path:
-            # Read original file
-            with open(uploaded_file_path, 'rb') as f:
-                optimized_stream = optimize_image_with_metadata(f)
-                
-            # Write back optimized version
-            with open(save_path, 'wb') as out_f:
-                out_f.write(optimized_stream.read())
-        else:
-            # Different paths - copy with optimization
-            with open(uploaded_file_path, 'rb') as f:
-                optimized_stream = optimize_image_with_metadata(f)
-                with open(save_path, 'wb') as out_f:
-                    out_f.write(optimized_stream.read())
+        # One decode for the optimized file and its thumbnail
+        process_image(uploaded_file_path, save_path, thumb_path=thumbnail_path)
 
-        # Extract metadata AFTER optimization (from the final saved file)
+        # Extract metadata AFTER optimization (from the final saved file, headers only)
         original_metadata = extract_and_store_metadata_separately(save_path)
 
-        # Create thumbnail using the optimized image
-        if thumbnail_path:
-            create_thumbnail_with_metadata(save_path)
-
         print(f"✅ Image processed successfully: {save_path}")
         print(f"📊 Metadata keys preserved: {list(original_metadata.keys())}")
         
@@ -106,53 +100,14 @@ def extract_ai_metadata(image_path):
     Extract AI-generation-specific metadata from PNG/EXIF.
     """
     print(f"🔍 Extracting metadata from: {image_path}")
-    metadata = {}
     try:
-        img = Image.open(image_path)
-        print(f"📷 Opened: {img.format} {img.width}x{img.height}")
+        with Image.open(image_path) as img:
+            print(f"📷 Opened: {img.format} {img.width}x{img.height}")
+            metadata = read_ai_metadata(img)
 
-        # PNG parameters
-        if img.format == 'PNG' and img.info:
-            params = None
-            if 'parameters' in img.info:
-                params = img.info['parameters']
-            for key in ['prompt', 'Prompt', 'Description', 'Comment']:
-                if key in img.info:
-                    metadata['prompt'] = img.info[key]
-            # Try JSON parse first
-            if params:
-                try:
-                    data = json.loads(params)
-                    sui = data.get('sui_image_params')
-                    if sui:
-                        metadata.update({
-                            'prompt': sui.get('prompt',''),
-                            'negative_prompt': sui.get('negativeprompt',''),
-                            'model': sui.get('model',''),
-                            'seed': str(sui.get('seed','')),
-                            'steps': str(sui.get('steps','')),
-                            'cfg_scale': str(sui.get('cfgscale','')),
-                            'sampler': sui.get('sampler','')
-                        })
-                        if 'width' in sui and 'height' in sui:
-                            metadata['generation_size'] = f"{sui['width']}x{sui['height']}"
-                except json.JSONDecodeError:
-                    metadata.update(parse_sd_parameters(params))
-
-        # EXIF tags
-        try:
-            exif_obj = img.getexif()
-            for tid, val in exif_obj.items():
-                tag = ExifTags.TAGS.get(tid, tid)
-                if tag in ('ImageDescription','UserComment'):
-                    text = val.decode('utf-8',errors='ignore') if isinstance(val, bytes) else str(val)
-                    metadata.update(parse_sd_parameters(text))
-        except:
-            pass
-
-        # Always include format/size
-        metadata['format'] = img.format
-        metadata['size'] = f"{img.width}x{img.height}"
+            # Always include format/size
+            metadata['format'] = img.format
+            metadata['size'] = f"{img.width}x{img.height}"
 
         print(f"✅ Final metadata keys: {list(metadata.keys())}")
         return metadata
@@ -160,46 +115,40 @@ def extract_ai_metadata(image_path):
         print(f"❌ Error extracting AI metadata: {e}")
         return {}
 
-def parse_sd_parameters(params_text):
+# Columns of the artwork_metadata table, in the order extract_ai_metadata fills them
+AI_METADATA_FIELDS = (
+    'prompt', 'negative_prompt', 'model', 'seed', 'steps',
+    'cfg_scale', 'sampler', 'generation_size', 'format', 'size'
+)
+
+def store_ai_metadata(conn, artwork_id, metadata):
     """
-    Parse SD WebUI parameter strings into a dict of keys.
+    Persist extracted AI metadata for an artwork (replaces any previous row).
+    Caller is responsible for committing.
     """
-    metadata = {}
-    if not params_text or not isinstance(params_text, str):
-        return metadata
+    values = [metadata.get(field) or None for field in AI_METADATA_FIELDS]
+    conn.execute(
+        f"INSERT OR REPLACE INTO artwork_metadata (artwork_id, {', '.join(AI_METADATA_FIELDS)}) "
+        f"VALUES (?, {', '.join('?' * len(AI_METADATA_FIELDS))})",
+        [artwork_id] + values
+    )
 
-    lines = params_text.strip().split('\n')
-    # Prompt before 'Negative prompt:'
-    neg = params_text.find('Negative prompt:')
-    if neg > 0:
-        metadata['prompt'] = params_text[:neg].strip()
-    elif lines:
-        metadata['prompt'] = lines[0].strip()
-
-    # Negative prompt
-    if 'Negative prompt:' in params_text:
-        neg_start = neg + len('Negative prompt:')
-        neg_end = params_text.find('\n', neg_start) or len(params_text)
-        metadata['negative_prompt'] = params_text[neg_start:neg_end].strip()
-
-    # Parameter regex
-    import re
-    patterns = [
-        (r'Steps:\s*(\d+)', 'steps'),
-        (r'Sampler:\s*([^,\n]+)', 'sampler'),
-        (r'CFG [Ss]cale:\s*([\d.]+)', 'cfg_scale'),
-        (r'Seed:\s*(\d+)', 'seed'),
-        (r'Model:\s*([^,\n]+)', 'model'),
-        (r'Size:\s*(\d+x\d+)', 'generation_size'),
-    ]
-    for pat, key in patterns:
-        m = re.search(pat, params_text)
-        if m:
-            metadata[key] = m.group(1).strip()
-    return metadata
+def load_ai_metadata(conn, artwork_id):
+    """
+    Return stored AI metadata as a dict of non-empty fields,
+    or None if the artwork has never been extracted.
+    """
+    row = conn.execute(
+        f"SELECT {', '.join(AI_METADATA_FIELDS)} FROM artwork_metadata WHERE artwork_id = ?",
+        (artwork_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {field: row[field] for field in AI_METADATA_FIELDS if row[field]}
 
 def register_api_routes(app):
     @app.route('/get_description/<int:id>')
+    @etag_on_revision
     def get_description(id):
         try:
             conn = get_db_connection()
@@ -221,77 +170,172 @@ def register_api_routes(app):
             data = request.get_json()
             order = data.get('order', [])
             conn = get_db_connection()
-            for itm in order:
-                conn.execute('UPDATE artworks SET position=? WHERE id=?',
-                             (itm['position'], itm['id']))
+            # One transaction, one prepared statement for the whole batch
+            conn.executemany('UPDATE artworks SET position=? WHERE id=?',
+                             ((itm['position'], itm['id']) for itm in order))
             conn.commit()
             conn.close()
+            bump_revision()
             return jsonify({'success':True,'message':'Order updated'})
         except Exception as e:
             return jsonify({'success':False,'message':str(e)}),500
 
+    @app.route('/api/artworks/reorder', methods=['POST'])
+    def reorder_artworks():
+        """
+        Move artworks between neighbours, writing only the moved rows.
+        Body: {id, before_id, after_id} or {moves: [{id, before_id, after_id}, ...]}
+        before_id is the tile displayed just before the new spot, after_id just after.
+        A move with to: 'top' or 'bottom' goes past every artwork, loaded or not.
+        Moves are applied in order, in one transaction.
+        """
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success':False,'message':'Expected a JSON object'}),400
+        moves = data.get('moves') if 'moves' in data else [data]
+        if not isinstance(moves, list) or not moves:
+            return jsonify({'success':False,'message':'moves must be a non-empty list'}),400
+        if not all(isinstance(mv, dict) for mv in moves):
+            return jsonify({'success':False,'message':'Each move must be an object'}),400
+        conn = get_db_connection()
+        try:
+            results = []
+            tight = False
+            for mv in moves:
+                new_pos, mv_tight = move_artwork(conn, mv.get('id'), mv.get('before_id'), mv.get('after_id'),
+                                                 mv.get('to'))
+                results.append({'id': int(mv['id']), 'position': new_pos})
+                tight = tight or mv_tight
+            conn.commit()
+            bump_revision()
+        except InvalidMove as e:
+            conn.rollback()
+            return jsonify({'success':False,'message':str(e)}),400
+        except Exception as e:
+            conn.rollback()
+            return jsonify({'success':False,'message':str(e)}),500
+        if tight:
+            rebalancer.request()
+        return jsonify({'success':True,'message':'Order updated','positions':results})
+
     @app.route('/api/search')
+    @etag_on_revision
+    @cached_response
     def search_artworks():
         q = request.args.get('q','').strip()
         if not q:
             return jsonify({'success':False,'message':'Query required'}),400
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        match = build_match_query(q)
+        if not match:
+            return jsonify({'success':True,'count':0,'artworks':[],'query':q})
         conn = get_db_connection()
         rows = conn.execute(
-            """
-            SELECT * FROM artworks
-            WHERE title LIKE ? OR description LIKE ?
-            ORDER BY position DESC
-            """, (f'%{q}%',f'%{q}%')
+            f"""
+            SELECT a.*, {SNIPPET_SQL} AS snippet
+            FROM artworks_fts JOIN artworks a ON a.id = artworks_fts.rowid
+            WHERE artworks_fts MATCH ?
+            ORDER BY {RANK_SQL}
+            LIMIT ?
+            """, (match, limit)
         ).fetchall()
         conn.close()
         arts=[]
         for r in rows:
-            d=dict(r)
-            fn=os.path.basename(d['image_path'])
-            d['thumbnail_path'] = f"/thumbnail/{fn}"
+            d=serialize_artwork(r)
+            d['snippet'] = highlight_snippet(d['snippet'])
             arts.append(d)
         return jsonify({'success':True,'count':len(arts),'artworks':arts,'query':q})
 
+    @app.route('/api/jobs/<int:job_id>')
+    def get_job_status(job_id):
+        conn = get_db_connection()
+        job = get_job(conn, job_id)
+        # Near-duplicates are only known once the job has hashed the image
+        similar = near_duplicates(conn, job['artwork_id']) if job and job['status'] == 'done' and job['artwork_id'] else []
+        conn.close()
+        if not job:
+            return jsonify({'success':False,'message':'Job not found'}),404
+        return jsonify({'success':True,'similar':similar,'warning':duplicate_warning(similar),'job':{
+            'id': job['id'],
+            'artwork_id': job['artwork_id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'attempts': job['attempts'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }})
+
     @app.route('/api/health')
     def health_check():
         return jsonify({'status':'healthy','service':'art-gallery'})
 
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        return jsonify({'success':True,'response_cache':response_cache.stats(),'tile_cache':tile_cache.stats()})
+
     @app.route('/api/artworks')
+    @etag_on_revision
+    @cached_response
     def get_filtered_artworks():
-        q=request.args.get('q','').lower().strip()
+        q=request.args.get('q','').strip()
+        color=request.args.get('color','').strip()
         sort=request.args.get('sort','newest')
-        sql='SELECT * FROM artworks WHERE 1=1'
-        params=[]
-        if q:
-            sql+=" AND (LOWER(title) LIKE ? OR LOWER(description) LIKE ?)"
-            params.extend([f'%{q}%',f'%{q}%'])
-        if sort=='newest': sql+=' ORDER BY created_at DESC, id DESC'
-        elif sort=='oldest': sql+=' ORDER BY created_at ASC, id ASC'
-        elif sort=='a-z': sql+=' ORDER BY CASE WHEN title IS NULL OR title="" THEN 1 ELSE 0 END, LOWER(title)'
-        elif sort=='z-a': sql+=' ORDER BY CASE WHEN title IS NULL OR title="" THEN 1 ELSE 0 END, LOWER(title) DESC'
+        cursor=request.args.get('cursor')
+        limit=request.args.get('limit',GALLERY_PAGE_SIZE,type=int)
+        min_width=request.args.get('min_width',type=int)
+        min_height=request.args.get('min_height',type=int)
+        orientation=request.args.get('orientation')
         conn=get_db_connection()
-        rows=conn.execute(sql,params).fetchall()
-        conn.close()
-        arts=[]
-        for r in rows:
-            d=dict(r)
-            fn=os.path.basename(d['image_path'])
-            d['thumbnail_path']=f"/thumbnail/{fn}"
-            arts.append(d)
-        return jsonify({'success':True,'count':len(arts),'query':q,'sort':sort,'artworks':arts})
+        try:
+            arts,next_cursor=fetch_artwork_page(conn,sort=sort,cursor=cursor,limit=limit,q=q,color=color,
+                                                min_width=min_width,min_height=min_height,orientation=orientation)
+        except (InvalidCursor,InvalidColor) as e:
+            return jsonify({'success':False,'message':str(e)}),400
+        finally:
+            conn.close()
+        return jsonify({'success':True,'count':len(arts),'query':q,'color':color or None,'sort':sort,
+                        'artworks':arts,'next':next_cursor})
+
+    @app.route('/api/artwork/<int:artwork_id>/similar')
+    @etag_on_revision
+    def get_similar_artworks(artwork_id):
+        """Artworks whose dHash is within max_distance bits of this one's, closest first"""
+        max_distance=min(max(request.args.get('max_distance',SIMILAR_MAX_DISTANCE,type=int),0),64)
+        limit=min(max(request.args.get('limit',SIMILAR_LIMIT,type=int),1),GALLERY_MAX_PAGE_SIZE)
+        conn=get_db_connection()
+        row=conn.execute('SELECT dhash FROM artworks WHERE id=?',(artwork_id,)).fetchone()
+        if not row:
+            return jsonify({'success':False,'message':'Not found'}),404
+        # Hashed by the upload job; nothing to compare against until then
+        matches=find_similar(conn,row['dhash'],max_distance,limit,exclude=artwork_id)
+        return jsonify({'success':True,'artwork_id':artwork_id,'hashed':row['dhash'] is not None,
+                        'max_distance':max_distance,'similar':similar_artworks(conn,matches)})
 
     @app.route('/api/metadata/<int:id>')
+    @etag_on_revision
     def get_image_metadata(id):
         try:
             conn=get_db_connection()
+            meta=load_ai_metadata(conn,id)
+            if meta is not None:
+                conn.close()
+                return jsonify({'success':True,'metadata':meta})
+
+            # Not extracted yet (artwork predates the metadata table) - extract once and store
             row=conn.execute('SELECT image_path FROM artworks WHERE id=?',(id,)).fetchone()
-            conn.close()
             if not row:
+                conn.close()
                 return jsonify({'success':False,'message':'Not found'}),404
             path=row['image_path']
             if not os.path.exists(path):
+                conn.close()
                 return jsonify({'success':False,'message':'File missing'}),404
-            meta=extract_ai_metadata(path)
+            store_ai_metadata(conn,id,extract_ai_metadata(path))
+            conn.commit()
+            meta=load_ai_metadata(conn,id)
+            conn.close()
             return jsonify({'success':True,'metadata':meta})
         except Exception as e:
             return jsonify({'success':False,'message':str(e)}),500
\ No newline at end of file
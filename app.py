@@ -1,11 +1,22 @@
 # app.py - Updated to include lightbox API routes
 
+import multiprocessing
 from flask import Flask, request, jsonify
-from config import SECRET_KEY
-from db import init_db, get_db_connection
+from config import SECRET_KEY, MAX_CONTENT_LENGTH
+from intake import SpooledRequest
+from db import init_db, get_db_connection, init_app as init_db_app
 from routes import register_routes
 from api import register_api_routes
+from export import register_export_routes
+from commands import register_commands
+from ordering import rebalancer
+from jobs import job_queue
 from utils import ensure_directories
+from revision import bump_revision, etag_on_revision
+from metrics import init_app as init_metrics
+from assets import init_app as init_assets
+from offline import init_app as init_offline
+from fragments import init_app as init_fragments
 
 # Create lightbox API routes inline since we're adding to existing file
 def register_lightbox_api_routes(app):
@@ -91,6 +102,7 @@ def register_lightbox_api_routes(app):
             
             cursor = conn.execute(update_query, update_values)
             conn.commit()
+            bump_revision()
             
             # Get updated artwork data
             updated_artwork = conn.execute(
@@ -125,6 +137,7 @@ def register_lightbox_api_routes(app):
             }), 500
     
     @app.route('/api/artwork/<int:artwork_id>/info', methods=['GET'])  
+    @etag_on_revision
     def get_artwork_info(artwork_id):
         """
         Get basic artwork information (title, description)
@@ -198,6 +211,13 @@ def register_patch_middleware(app):
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+app.request_class = SpooledRequest              # uploads spill to disk, not RAM
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+init_metrics(app)                     # first, so its timer wraps every other hook
+init_db_app(app)
+init_assets(app)                      # bundles CSS/JS unless already up to date
+init_offline(app)                     # /sw.js and its precache manifest
+init_fragments(app)                   # cached gallery tiles for index.html
 
 # Ensure directories exist
 ensure_directories()
@@ -206,7 +226,17 @@ ensure_directories()
 register_routes(app)
 register_api_routes(app)
 register_lightbox_api_routes(app)  # ✅ NEW: Lightbox-specific API routes
+register_export_routes(app)        # Streaming NDJSON/CSV and zip export
 register_patch_middleware(app)     # ✅ NEW: Enhanced error handling for PATCH
+register_commands(app)             # Maintenance CLI (flask --app app <command>)
+
+# Spawned job and backfill workers re-import __main__ under `python app.py`;
+# only the serving process sets up the schema and runs background threads,
+# schema first since the job dispatcher claims from it straight away
+if multiprocessing.parent_process() is None:
+    init_db()
+    rebalancer.start()             # Background renumbering of sparse positions
+    job_queue.start()              # Image processing jobs (resumes anything left queued)
 
 # Security headers
 @app.after_request
@@ -233,11 +263,8 @@ def artwork_update_text_preflight(artwork_id):
     return response
 
 if __name__ == '__main__':
-    init_db()
-    
-    # Generate thumbnails for existing images
-    from image_utils import ensure_thumbnails_exist
-    ensure_thumbnails_exist()
+    # Missing thumbnails are created on request; regenerate in bulk with
+    # `python backfill.py` instead of blocking startup
     
     print("🎨 Art Gallery starting...")
     print("✅ Standard routes registered")
@@ -0,0 +1,474 @@
+"""
+Static asset pipeline: bundled, minified, fingerprinted, precompressed.
+
+    python assets.py [--force]
+    flask --app app assets [--force]
+
+Also runs at app startup (ASSETS_BUILD_ON_STARTUP); the build is skipped
+when no source under static/css or static/js changed since the last one.
+
+- Stylesheets and classic scripts listed in BUNDLES are concatenated in
+  order into one file each. CSS @imports are inlined (url()s rewritten for
+  the new location); a sheet included twice keeps only its last copy,
+  which leaves the cascade unchanged.
+- ES module entry points keep their import graph, since merging modules
+  would mean renaming clashing top-level names. Each module is fingerprinted
+  and its relative imports are rewritten to the fingerprinted names, so the
+  whole graph is immutable; templates preload it with <link rel=modulepreload>.
+- Every output is named <name>.<content hash>.<ext> under ASSET_DIST_FOLDER
+  with .gz (and .br when the brotli package is installed) next to it, and
+  served with the best encoding the client accepts.
+
+Templates call asset_urls(name) / modulepreload_urls(entry). Without a build
+they return the original source files, so the page still works.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+import mimetypes
+import posixpath
+import multiprocessing
+from flask import request, send_file, url_for, abort
+from config import ASSET_DIST_FOLDER, ASSETS_BUILD_ON_STARTUP, IMMUTABLE_MAX_AGE
+
+try:
+    import brotli
+except ImportError:     # optional: gzip sidecars only
+    brotli = None
+
+STATIC_FOLDER = 'static'
+MANIFEST_NAME = 'manifest.json'
+# Paths are relative to static/, in the order index.html loaded them
+BUNDLES = {
+    'gallery.css': [
+        'css/fonts.css',
+        'css/style.css',
+        'css/animations.css',
+        'css/all.min.css',
+        'css/dark-mode.css',
+        'css/edit-mode.css',
+        'css/lightbox/lightbox.css',
+    ],
+    'gallery.js': [
+        'js/Sortable.min.js',
+        'js/theme.js',
+        'js/search-sort.js',
+        'js/lightbox/lightbox-debug.js',
+        'js/edit-mode.js',
+    ],
+}
+MODULE_ENTRIES = ['js/script.js', 'js/lightbox/lightbox-manager.js']
+SOURCE_DIRS = ('css', 'js')
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg')
+# Bump when the build itself changes in a way that alters its output
+PIPELINE_VERSION = 1
+
+# --- minification -----------------------------------------------------------
+
+_CSS_TOKENS = re.compile(r'''
+    (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<comment>/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<other>[^"'/\s]+|/)
+''', re.S | re.X)
+_CSS_TIGHT = set('{};,')
+
+def minify_css(source):
+    """Drop comments (keeping /*! notices) and collapse whitespace; strings are left alone"""
+    out = []
+    pending_space = False
+    for m in _CSS_TOKENS.finditer(source):
+        kind, text = m.lastgroup, m.group()
+        if kind == 'space' or (kind == 'comment' and not text.startswith('/*!')):
+            pending_space = True
+            continue
+        if pending_space and out and out[-1][-1] not in _CSS_TIGHT and text[0] not in _CSS_TIGHT:
+            out.append(' ')
+        pending_space = False
+        if text.startswith('}') and out and out[-1].endswith(';'):
+            out[-1] = out[-1][:-1]
+        out.append(text)
+    return ''.join(out).strip()
+
+_JS_SPACE = ' \t\r\n\f\v\ufeff'
+_JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+                      'throw', 'case', 'do', 'else', 'yield', 'await'}
+
+def _is_word_char(c):
+    return c.isalnum() or c in '_$\\' or ord(c) > 127
+
+def _scan_string(source, i):
+    """Index just past the string literal starting at i"""
+    quote = source[i]
+    i += 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+def _scan_template(source, i):
+    """From inside a template literal to just past its end (True) or its next ${ (False)"""
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1, True
+        elif source.startswith('${', i):
+            return i + 2, False
+        else:
+            i += 1
+    return i, True
+
+def _scan_regex(source, i):
+    """Index just past the regex literal at i (flags included), or None if it is not one"""
+    j = i + 1
+    in_class = False
+    while j < len(source):
+        c = source[j]
+        if c == '\n':
+            return None
+        if c == '\\':
+            j += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            j += 1
+            while j < len(source) and _is_word_char(source[j]):
+                j += 1
+            return j
+        j += 1
+    return None
+
+def minify_js(source):
+    """
+    Whitespace and comment stripping for JavaScript. Line breaks are kept
+    (one per run), so automatic semicolon insertion behaves as before;
+    strings, template literals and regexes are copied verbatim.
+    """
+    out = []
+    i, n = 0, len(source)
+    last = ''           # previous significant token, to tell a regex from a division
+    pending = None      # whitespace seen since the last token: ' ' or '\n'
+    braces = []         # True for a brace that opened a template ${ } expression
+
+    def emit(text):
+        nonlocal pending
+        if pending and out:
+            prev = out[-1][-1]
+            if pending == '\n':
+                out.append('\n')
+            elif ((_is_word_char(prev) and _is_word_char(text[0]))
+                  or (prev in '+-/' and text[0] in '+-/')
+                  or (prev.isdigit() and text[0] == '.')):
+                out.append(' ')
+        pending = None
+        out.append(text)
+
+    while i < n:
+        c = source[i]
+        if c in _JS_SPACE:
+            j = i
+            while j < n and source[j] in _JS_SPACE:
+                j += 1
+            pending = '\n' if '\n' in source[i:j] or pending == '\n' else (pending or ' ')
+            i = j
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j == -1 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            j = n if j == -1 else j + 2
+            if source.startswith('/*!', i):
+                emit(source[i:j])
+            elif '\n' in source[i:j]:
+                pending = '\n'
+            else:
+                pending = pending or ' '
+            i = j
+        elif c in '"\'':
+            j = _scan_string(source, i)
+            emit(source[i:j])
+            last, i = '"', j
+        elif c == '`':
+            j, closed = _scan_template(source, i + 1)
+            emit(source[i:j])
+            if not closed:
+                braces.append(True)
+            last, i = '`' if closed else '{', j
+        elif c == '/' and (not last or last in _JS_REGEX_AFTER or last in _JS_REGEX_KEYWORDS) \
+                and (j := _scan_regex(source, i)) is not None:
+            emit(source[i:j])
+            last, i = '/re/', j
+        elif _is_word_char(c):
+            j = i
+            while j < n and (_is_word_char(source[j]) or (source[j] == '.' and source[i].isdigit())):
+                j += 1
+            emit(source[i:j])
+            last, i = source[i:j], j
+        elif c == '{':
+            braces.append(False)
+            emit(c)
+            last, i = c, i + 1
+        elif c == '}' and braces and braces[-1]:
+            # End of a ${ } expression: continue the template literal
+            braces.pop()
+            j, closed = _scan_template(source, i + 1)
+            emit(source[i:j])
+            if not closed:
+                braces.append(True)
+            last, i = '`' if closed else '{', j
+        else:
+            if c == '}' and braces:
+                braces.pop()
+            emit(c)
+            last, i = c, i + 1
+    return ''.join(out).strip() + '\n'
+
+def minify(name, text):
+    # Vendor files ship minified already
+    if '.min.' in name:
+        return text.strip() + '\n'
+    return minify_css(text) if name.endswith('.css') else minify_js(text)
+
+# --- bundling ---------------------------------------------------------------
+
+_CSS_IMPORT = re.compile(r'''@import\s+(?:url\(\s*)?(['"])([^'"]+)\1\s*\)?\s*([^;]*);''')
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_JS_IMPORT = re.compile(r'''((?:\bimport|\bexport)\s*(?:[\w*{}\s,$]+\s*from\s*)?)(['"])(\.{1,2}/[^'"]+)\2''')
+
+def _read(path):
+    with open(os.path.join(STATIC_FOLDER, path), encoding='utf-8') as f:
+        return f.read()
+
+def _rebase_urls(css, source, target_dir):
+    """Point relative url()s in `source` (a static/ path) at the same files from target_dir"""
+    def rebase(m):
+        quote, url = m.group(1), m.group(2).strip()
+        if re.match(r'^(?:[a-z]+:|/|#)', url, re.I):
+            return m.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        return f"url({quote}{posixpath.relpath(resolved, target_dir)}{suffix}{quote})"
+    return _CSS_URL.sub(rebase, css)
+
+def _flatten_css(path, target_dir, stack=()):
+    """[(path, css)] for path and everything it @imports, imports first"""
+    if path in stack:
+        raise ValueError(f"Circular @import: {' -> '.join(stack + (path,))}")
+    parts = []
+
+    def inline(m):
+        imported = posixpath.normpath(posixpath.join(posixpath.dirname(path), m.group(2)))
+        media = m.group(3).strip()
+        for name, css in _flatten_css(imported, target_dir, stack + (path,)):
+            parts.append((name, f"@media {media}{{{css}}}" if media else css))
+        return ''
+
+    body = _CSS_IMPORT.sub(inline, _read(path))
+    parts.append((path, _rebase_urls(body, path, target_dir)))
+    return parts
+
+def build_css_bundle(sources, target_dir):
+    parts = []
+    for source in sources:
+        parts.extend(_flatten_css(source, target_dir))
+    # A sheet included again later overrides its earlier copy anyway
+    last_index = {name: index for index, (name, _) in enumerate(parts)}
+    return '\n'.join(minify(name, css) for index, (name, css) in enumerate(parts) if last_index[name] == index)
+
+def build_js_bundle(sources):
+    # Classic scripts share one global scope, so concatenating them changes nothing
+    return ';\n'.join(minify(source, _read(source)) for source in sources)
+
+def _module_imports(path, text):
+    return [posixpath.normpath(posixpath.join(posixpath.dirname(path), m.group(3))) for m in _JS_IMPORT.finditer(text)]
+
+# --- output -----------------------------------------------------------------
+
+def _fingerprint(name, content):
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]}{ext}"
+
+def _write(dist, name, content):
+    """Write an output and its precompressed variants, skipping those already there (same name, same bytes)"""
+    path = os.path.join(dist, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = content.encode('utf-8')
+    variants = [('', lambda: data)]
+    if name.endswith(COMPRESSIBLE):
+        variants.append(('.gz', lambda: gzip.compress(data, 9, mtime=0)))
+        if brotli is not None:
+            variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    for suffix, encode in variants:
+        if os.path.exists(path + suffix):
+            continue
+        payload = encode()
+        if suffix and len(payload) >= len(data):
+            continue
+        tmp_path = f"{path}{suffix}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path + suffix)
+
+def _source_signature():
+    digest = hashlib.sha256(f"{PIPELINE_VERSION}:{brotli is not None}".encode())
+    for folder in SOURCE_DIRS:
+        for root, _, files in sorted(os.walk(os.path.join(STATIC_FOLDER, folder))):
+            for name in sorted(files):
+                st = os.stat(os.path.join(root, name))
+                digest.update(f"{root}/{name}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return digest.hexdigest()
+
+def load_manifest(dist=ASSET_DIST_FOLDER):
+    try:
+        with open(os.path.join(dist, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def build_assets(force=False, dist=ASSET_DIST_FOLDER):
+    """Build every bundle and module graph unless the sources are unchanged. Returns the manifest"""
+    signature = _source_signature()
+    previous = load_manifest(dist)
+    if not force and previous and previous.get('signature') == signature and all(
+            os.path.exists(os.path.join(dist, name)) for name in previous['files'].values()):
+        return previous
+
+    os.makedirs(dist, exist_ok=True)
+    target_dir = posixpath.relpath(dist.replace(os.sep, '/'), STATIC_FOLDER)
+    files = {}
+    for name, sources in BUNDLES.items():
+        content = build_css_bundle(sources, target_dir) if name.endswith('.css') else build_js_bundle(sources)
+        files[name] = _fingerprint(name, content)
+        _write(dist, files[name], content)
+
+    # Modules are emitted dependencies first, so every import can name its fingerprinted target
+    graph = {}
+    preload = {}
+
+    def visit(path, stack=()):
+        if path in files:
+            return
+        if path in stack:
+            raise ValueError(f"Circular import: {' -> '.join(stack + (path,))}")
+        text = _read(path)
+        graph[path] = _module_imports(path, text)
+        for dep in graph[path]:
+            visit(dep, stack + (path,))
+
+        def rewrite(m):
+            dep = posixpath.normpath(posixpath.join(posixpath.dirname(path), m.group(3)))
+            relative = posixpath.relpath(files[dep], posixpath.dirname(path))
+            return f"{m.group(1)}{m.group(2)}{relative if relative.startswith('.') else './' + relative}{m.group(2)}"
+
+        content = minify(path, _JS_IMPORT.sub(rewrite, text))
+        files[path] = _fingerprint(path, content)
+        _write(dist, files[path], content)
+
+    def closure(path, seen):
+        for dep in graph[path]:
+            if dep not in seen:
+                seen.append(dep)
+                closure(dep, seen)
+        return seen
+
+    for entry in MODULE_ENTRIES:
+        visit(entry)
+        preload[entry] = closure(entry, [])
+
+    manifest = {'signature': signature, 'files': files, 'preload': preload}
+    tmp_path = os.path.join(dist, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist, MANIFEST_NAME))
+
+    # Keep the previous build too: pages rendered before a deploy still reference it
+    keep = {MANIFEST_NAME, *files.values(), *(previous or {}).get('files', {}).values()}
+    _prune(dist, keep)
+    print(f"✅ Assets built: {len(files)} files in {dist}" + ('' if brotli else ' (gzip only, brotli not installed)'))
+    return manifest
+
+def _prune(dist, keep):
+    for root, _, names in os.walk(dist):
+        for name in names:
+            rel = posixpath.relpath(os.path.join(root, name).replace(os.sep, '/'), dist.replace(os.sep, '/'))
+            base = re.sub(r'\.(gz|br)$', '', rel)
+            # .tmp files may be another worker's build in progress
+            if base not in keep and not name.endswith('.tmp'):
+                os.remove(os.path.join(root, name))
+
+# --- serving ----------------------------------------------------------------
+
+_manifest = None
+
+def _dist_url(name):
+    return url_for('static', filename=f"{posixpath.relpath(ASSET_DIST_FOLDER, STATIC_FOLDER)}/{name}")
+
+def asset_urls(name):
+    """URLs to load for a bundle or module entry: the built file, or its sources without a build"""
+    if _manifest and name in _manifest['files']:
+        return [_dist_url(_manifest['files'][name])]
+    return [url_for('static', filename=source) for source in BUNDLES.get(name, [name])]
+
+def modulepreload_urls(entry):
+    """Fingerprinted modules `entry` imports, directly or not, for <link rel=modulepreload>"""
+    if not _manifest:
+        return []
+    return [_dist_url(_manifest['files'][dep]) for dep in _manifest['preload'].get(entry, [])]
+
+def init_app(app):
+    global _manifest
+
+    # Spawned job and backfill workers re-import the app; only the serving process builds
+    if ASSETS_BUILD_ON_STARTUP and multiprocessing.parent_process() is None:
+        try:
+            _manifest = build_assets()
+        except Exception as e:
+            print(f"❌ Asset build failed, serving unbundled sources: {e}")
+    else:
+        _manifest = load_manifest()
+
+    app.add_template_global(asset_urls)
+    app.add_template_global(modulepreload_urls)
+
+    dist_prefix = posixpath.relpath(ASSET_DIST_FOLDER, STATIC_FOLDER)
+
+    # More specific than /static/<path:filename>, so it takes these URLs
+    @app.route(f"/static/{dist_prefix}/<path:filename>")
+    def serve_asset(filename):
+        """Fingerprinted asset, precompressed when the client accepts it"""
+        path = os.path.join(ASSET_DIST_FOLDER, filename)
+        if '..' in filename.split('/') or filename == MANIFEST_NAME or not os.path.isfile(path):
+            abort(404)
+        encoding = None
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                encoding, path = name, path + suffix
+                break
+        # mimetype from the original name, not the .br/.gz sidecar
+        response = send_file(os.path.abspath(path), mimetype=mimetypes.guess_type(filename)[0],
+                             max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bundle, minify, fingerprint and precompress static assets')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if no source changed')
+    args = parser.parse_args(argv)
+    build_assets(force=args.force)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Parallel, resumable regeneration of thumbnails, responsive derivatives,
+perceptual hashes, colour palettes and blurred placeholders.
+
+    python backfill.py [--only thumbnails|derivatives|hashes|palettes|placeholders] [--workers N] [--force]
+    flask --app app backfill [same options]
+
+A manifest (BACKFILL_MANIFEST_PATH) records the mtime and size of every
+source already handled, per output kind, together with the settings it was
+built with. Reruns only process new or changed files; changing
+THUMBNAIL_SIZE, DERIVATIVE_WIDTHS, DHASH_SIZE, the PALETTE_* or LQIP_*
+settings invalidates the matching section.
+Ctrl+C saves the manifest, so the next run resumes where this one stopped.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (UPLOAD_FOLDER, THUMBNAIL_FOLDER, THUMBNAIL_SIZE, DERIVATIVE_WIDTHS,
+                    DERIVATIVE_QUALITY, BACKFILL_MANIFEST_PATH, PALETTE_COLORS, PALETTE_SAMPLE_SIZE,
+                    PALETTE_BUCKET_SIZE, LQIP_SIZE, LQIP_QUALITY, DIMENSION_BACKFILL_WORKERS)
+
+KINDS = ('thumbnails', 'derivatives', 'hashes', 'palettes', 'placeholders')
+MANIFEST_SAVE_INTERVAL = 10     # seconds between manifest checkpoints
+PROGRESS_INTERVAL = 1           # seconds between progress lines
+# Kinds stored on the artwork row; a NULL there makes the file stale whatever the manifest says
+KIND_COLUMNS = {'hashes': 'dhash', 'palettes': 'palette', 'placeholders': 'lqip'}
+
+def _signatures():
+    """Settings each output kind depends on; a change means everything is stale"""
+    from image_utils import RENDITION_SIGNATURES, DHASH_SIZE
+    return {
+        **RENDITION_SIGNATURES,
+        'hashes': [DHASH_SIZE],
+        'palettes': [PALETTE_COLORS, PALETTE_SAMPLE_SIZE, PALETTE_BUCKET_SIZE],
+        'placeholders': [LQIP_SIZE, LQIP_QUALITY],
+    }
+
+def load_manifest(path=BACKFILL_MANIFEST_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(manifest, path=BACKFILL_MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def scan_sources(skip=()):
+    """(path, [mtime_ns, size]) for every processable upload"""
+    with os.scandir(UPLOAD_FOLDER) as entries:
+        for entry in entries:
+            # Dot files are in-flight uploads (storage.py), SVGs have nothing to render
+            if entry.name.startswith('.') or entry.name.lower().endswith('.svg') or not entry.is_file():
+                continue
+            path = f"{UPLOAD_FOLDER}/{entry.name}"
+            if path in skip:
+                continue
+            st = entry.stat()
+            yield path, [st.st_mtime_ns, st.st_size]
+
+def backfill_file(path, kinds):
+    """Worker: regenerate the requested outputs for one upload. Returns {kind: result or None}"""
+    from image_utils import (create_thumbnail_with_metadata, create_derivatives, image_dhash, image_palette,
+                             image_lqip, image_dimensions)
+
+    results = {}
+    if 'thumbnails' in kinds:
+        # The new thumbnail's size goes back onto the row (thumb_width/thumb_height)
+        thumb_path = create_thumbnail_with_metadata(path, overwrite=True)
+        results['thumbnails'] = image_dimensions(path, thumb_path) if thumb_path else None
+    if 'derivatives' in kinds:
+        results['derivatives'] = create_derivatives(path)
+    if 'hashes' in kinds:
+        results['hashes'] = image_dhash(path)
+    if 'palettes' in kinds:
+        results['palettes'] = image_palette(path)
+    if 'placeholders' in kinds:
+        results['placeholders'] = image_lqip(path)
+    return results
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def run_backfill(kinds=KINDS, workers=None, force=False, manifest_path=BACKFILL_MANIFEST_PATH):
+    """
+    Regenerate outputs of `kinds` for every upload that is new or changed
+    since the last run. Returns (processed, failed).
+    """
+    from db import init_db, get_db_connection
+    from gallery import format_derivatives, store_dimensions
+    from revision import bump_revision
+
+    init_db()
+    conn = get_db_connection()
+    # The job queue owns uploads that are still being processed
+    processing = {row['image_path'] for row in conn.execute(
+        "SELECT image_path FROM artworks WHERE status = 'processing'"
+    )}
+    # Uploaded before the column existed, or copied over from another gallery
+    missing = {kind: {row['image_path'] for row in conn.execute(
+        f'SELECT image_path FROM artworks WHERE {column} IS NULL'
+    )} for kind, column in KIND_COLUMNS.items() if kind in kinds}
+
+    manifest = {} if force else load_manifest(manifest_path)
+    signatures = _signatures()
+    for kind in KINDS:
+        if manifest.get('signatures', {}).get(kind) != signatures[kind]:
+            manifest.setdefault('signatures', {})[kind] = signatures[kind]
+            manifest[kind] = {}
+
+    # Work list: each source with the kinds that are missing or stale
+    todo = []
+    for path, stamp in scan_sources(skip=processing):
+        stale = [kind for kind in kinds if manifest[kind].get(path) != stamp]
+        if 'thumbnails' not in stale and 'thumbnails' in kinds:
+            # Restored from backup without thumbnails: the manifest alone is not enough
+            if not os.path.exists(path.replace(UPLOAD_FOLDER, THUMBNAIL_FOLDER, 1)):
+                stale.append('thumbnails')
+        stale += [kind for kind, paths in missing.items() if kind not in stale and path in paths]
+        if stale:
+            todo.append((path, stamp, tuple(stale)))
+
+    total = len(todo)
+    print(f"🖼️ Backfill: {total} files to process ({', '.join(kinds)})")
+    if not total:
+        save_manifest(manifest, manifest_path)
+        return 0, 0
+
+    workers = workers or os.cpu_count() or 1
+    processed = failed = 0
+    started = last_progress = last_save = time.monotonic()
+    pending = {}
+    work = iter(todo)
+
+    # spawn: the web app may have imported this module with threads running
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        while True:
+            # Keep a bounded number of files in flight instead of queueing everything
+            while len(pending) < workers * 4:
+                item = next(work, None)
+                if item is None:
+                    break
+                pending[pool.submit(backfill_file, item[0], item[2])] = item
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, stamp, stale = pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"❌ Backfill failed for {path}: {e}")
+                    failed += 1
+                    continue
+                ok = True
+                for kind in stale:
+                    if results.get(kind) is None:
+                        ok = False  # not recorded, so the next run retries it
+                        continue
+                    manifest[kind][path] = stamp
+                    if kind == 'derivatives':
+                        conn.execute(
+                            'UPDATE artworks SET derivatives = ? WHERE image_path = ?',
+                            (format_derivatives(results[kind]), path)
+                        )
+                    elif kind == 'thumbnails':
+                        store_dimensions(conn, path, results[kind])
+                    elif kind in KIND_COLUMNS:
+                        conn.execute(
+                            f'UPDATE artworks SET {KIND_COLUMNS[kind]} = ? WHERE image_path = ?',
+                            (results[kind], path)
+                        )
+                if ok:
+                    processed += 1
+                else:
+                    failed += 1
+
+            now = time.monotonic()
+            if now - last_save >= MANIFEST_SAVE_INTERVAL:
+                conn.commit()
+                save_manifest(manifest, manifest_path)
+                last_save = now
+            if now - last_progress >= PROGRESS_INTERVAL:
+                finished = processed + failed
+                rate = finished / (now - started)
+                eta = _format_eta((total - finished) / rate) if rate else '?'
+                print(f"⏳ {finished}/{total} ({finished * 100 // total}%) {rate:.1f} files/s, ETA {eta}", flush=True)
+                last_progress = now
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted - saving progress, rerun to resume")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        conn.commit()
+        save_manifest(manifest, manifest_path)
+        pool.shutdown(wait=True, cancel_futures=True)
+        bump_revision()
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Backfill done: {processed} processed, {failed} failed in {_format_eta(elapsed)}")
+    return processed, failed
+
+def backfill_dimensions(conn, workers=DIMENSION_BACKFILL_WORKERS):
+    """
+    Fill the dimension columns of artworks that predate them, reading only
+    file headers on a thread pool. Run by init_db on every start; rows whose
+    file is missing stay NULL and are retried next time. Returns the number
+    of images filled in.
+    """
+    from image_utils import image_dimensions
+    from gallery import store_dimensions
+
+    # The job queue fills in uploads that are still being processed
+    paths = [row['image_path'] for row in conn.execute(
+        "SELECT DISTINCT image_path FROM artworks WHERE file_size IS NULL AND status != 'processing'"
+    )]
+    if not paths:
+        return 0
+
+    print(f"📐 Reading dimensions of {len(paths)} images")
+    filled = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            lambda path: image_dimensions(path, path.replace(UPLOAD_FOLDER, THUMBNAIL_FOLDER, 1)), paths
+        )
+        for path, dimensions in zip(paths, results):
+            if dimensions:
+                store_dimensions(conn, path, dimensions)
+                filled += 1
+    conn.commit()
+    print(f"✅ Dimensions stored for {filled}/{len(paths)} images")
+    return filled
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regenerate thumbnails, derivatives, hashes, palettes and placeholders in parallel')
+    parser.add_argument('--only', choices=KINDS, help='Only regenerate this kind of output')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Ignore the manifest and redo every file')
+    args = parser.parse_args(argv)
+    kinds = (args.only,) if args.only else KINDS
+    try:
+        _, failed = run_backfill(kinds, workers=args.workers, force=args.force)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
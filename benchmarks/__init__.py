@@ -0,0 +1,10 @@
+"""
+Benchmark suite for the gallery.
+
+    python -m benchmarks [--artworks N] [--seed S] [--only micro|load] [--output FILE] [--compare OLD.json]
+
+Builds a synthetic library (synthetic.py) in a scratch directory, times the
+image pipeline and metadata extraction (micro.py), load-tests the Flask
+endpoints through the test client (load.py) and writes the results as JSON,
+so two commits can be compared with --compare.
+"""
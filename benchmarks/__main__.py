@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment(args):
+    """What a result depends on besides the code: recorded so runs can be compared fairly"""
+    import PIL
+    from PIL import features
+
+    commit = _git('rev-parse', '--short', 'HEAD')
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')) if commit else None,
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'avif': features.check('avif'),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': vars(args),
+    }
+
+def compare(old, new):
+    """Print the median of every benchmark present in both result files"""
+    print(f"\n{'benchmark':<58} {'old ms':>10} {'new ms':>10} {'change':>8}")
+    for section in ('micro', 'load'):
+        for name, result in new.get(section, {}).items():
+            before = old.get(section, {}).get(name)
+            if not before:
+                continue
+            change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+            print(f"{section + ' ' + name:<58} {before['median_ms']:>10.3f} {result['median_ms']:>10.3f} {change:>+7.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark the image pipeline and HTTP endpoints on a synthetic gallery')
+    parser.add_argument('--artworks', type=int, default=200, help='Synthetic library size (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Library seed; same seed, same images')
+    parser.add_argument('--only', choices=('micro', 'load'), help='Run only one part of the suite')
+    parser.add_argument('--iterations', type=int, default=10, help='Rounds per image micro-benchmark')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint in the load test')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads in the load test')
+    parser.add_argument('--uploads', type=int, default=20, help='POST /add requests in the load test')
+    parser.add_argument('--derivatives', action='store_true', help='Also build responsive derivatives for the library')
+    parser.add_argument('--workdir', help='Keep the library here and reuse it next time (default: a temp dir)')
+    parser.add_argument('--output', default='benchmark.json', help='Result file (default: %(default)s)')
+    parser.add_argument('--compare', metavar='OLD_JSON', help='Print the change against an earlier result file')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='gallery-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = {'meta': environment(args)}
+
+    # config.py resolves the database and static folders when first imported,
+    # so point them at the scratch library before anything imports it
+    cwd = os.getcwd()
+    os.environ['GALLERY_DATABASE'] = os.path.join(workdir, 'database.db')
+    os.chdir(workdir)
+    try:
+        from benchmarks.synthetic import populate_library
+        results['meta']['artworks'] = populate_library(args.artworks, args.seed, args.derivatives)
+
+        if args.only in (None, 'micro'):
+            from benchmarks.micro import run_micro
+            results['micro'] = run_micro(args.seed, args.iterations)
+        if args.only in (None, 'load'):
+            from benchmarks.load import run_load
+            results['load'] = run_load(args.seed, args.requests, args.concurrency, args.uploads)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"📊 Results written to {output}")
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            compare(json.load(f), results)
+    return 0
+
+# Guarded: the spawn worker pools re-import this module
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import math
+import time
+import statistics
+from contextlib import redirect_stdout
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of already sorted samples"""
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+def summarize(samples):
+    """Seconds -> millisecond statistics, the shape every benchmark reports"""
+    ordered = sorted(samples)
+    return {
+        'iterations': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'median_ms': round(statistics.median(ordered) * 1000, 4),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+def measure(fn, iterations, setup=None, warmup=1):
+    """
+    Time fn(*setup()) `iterations` times after `warmup` untimed runs.
+    setup runs outside the timed region (fresh copies of inputs and so on).
+    """
+    samples = []
+    # The pipeline reports every file it writes; keep that out of the results
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for i in range(warmup + iterations):
+            args = setup() if setup else ()
+            started = time.perf_counter()
+            fn(*args)
+            elapsed = time.perf_counter() - started
+            if i >= warmup:
+                samples.append(elapsed)
+    return summarize(samples)
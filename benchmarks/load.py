@@ -0,0 +1,133 @@
+"""HTTP load test through the Flask test client: latency percentiles and throughput per endpoint"""
+import io
+import os
+import time
+import itertools
+import threading
+from contextlib import redirect_stdout
+from benchmarks.harness import summarize
+from benchmarks.synthetic import SUBJECTS, item_rng, synthetic_image
+
+WARMUP_REQUESTS = 3
+JOB_DRAIN_TIMEOUT = 600     # seconds to wait for the upload jobs queued by /add
+
+def wait_for_jobs(timeout=JOB_DRAIN_TIMEOUT):
+    """Block until the job queue is empty; returns the seconds waited"""
+    from db import get_db_connection
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    while time.perf_counter() - started < timeout:
+        pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+        if not pending:
+            break
+        time.sleep(0.1)
+    return round(time.perf_counter() - started, 3)
+
+def _scenarios(image_paths, uploads):
+    """(name, request kwargs for the i-th request, served through response_cache)"""
+    thumbnails = [os.path.basename(path) for path in image_paths]
+
+    def upload(i):
+        data, ext = uploads[i]
+        return {'path': '/add', 'method': 'POST', 'content_type': 'multipart/form-data',
+                'data': {'title': f'Bench upload {i}', 'description': 'load test',
+                         'image': (io.BytesIO(data), f'upload.{ext}')}}
+
+    return [
+        ('index', lambda i: {'path': '/'}, True),
+        ('api_artworks', lambda i: {'path': '/api/artworks'}, True),
+        ('api_artworks?sort=a-z', lambda i: {'path': '/api/artworks?sort=a-z'}, True),
+        ('api_search', lambda i: {'path': f'/api/search?q={SUBJECTS[i % len(SUBJECTS)]}'}, True),
+        ('thumbnail', lambda i: {'path': f'/thumbnail/{thumbnails[i % len(thumbnails)]}'}, False),
+        # Last: every upload queues a background job that competes for the CPU
+        ('add', upload, False),
+    ]
+
+def run_scenario(app, make_request, count, concurrency):
+    latencies = []
+    sizes = []
+    errors = 0
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal errors
+        client = app.test_client()
+        while True:
+            i = next(counter)
+            if i >= count:
+                return
+            kwargs = make_request(i)
+            started = time.perf_counter()
+            response = client.open(**kwargs)
+            body = response.get_data()
+            elapsed = time.perf_counter() - started
+            response.close()
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(len(body))
+                if response.status_code >= 400:
+                    errors += 1
+
+    # Past the measured indices, so warmup uploads are not repeated as duplicates
+    client = app.test_client()
+    for i in range(count, count + WARMUP_REQUESTS):
+        client.open(**make_request(i)).close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result.update({
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': round(count / wall, 2),
+        'mean_bytes': round(sum(sizes) / len(sizes)),
+    })
+    return result
+
+def run_load(seed=0, requests=200, concurrency=1, uploads=20):
+    from app import app
+    from db import get_db_connection
+    from response_cache import response_cache
+
+    # Serve the scratch library: send_file() resolves relative paths against the app root
+    app.template_folder = os.path.join(app.root_path, 'templates')
+    app.root_path = os.getcwd()
+
+    print(f"⏱️ Load test: {requests} requests per endpoint, concurrency {concurrency}", flush=True)
+    image_paths = [row['image_path'] for row in get_db_connection().execute(
+        'SELECT image_path FROM artworks ORDER BY id'
+    )]
+    # Distinct bytes per upload, so none is deduplicated against an earlier one
+    payloads = []
+    for i in range(uploads + WARMUP_REQUESTS):
+        data, ext, _ = synthetic_image(item_rng(f"load-{seed}", i), size=(768, 768))
+        payloads.append((data, ext))
+
+    results = {}
+    max_bytes = response_cache.max_bytes
+    with open(os.devnull, 'w') as devnull:
+        for name, make_request, cacheable in _scenarios(image_paths, payloads):
+            count = uploads if name == 'add' else requests
+            # Measure the real work first: a zero byte budget stores nothing
+            response_cache.max_bytes = 0
+            with redirect_stdout(devnull):
+                results[name] = run_scenario(app, make_request, count, concurrency)
+            response_cache.max_bytes = max_bytes
+            if cacheable:
+                with redirect_stdout(devnull):
+                    results[f'{name} (cached)'] = run_scenario(app, make_request, count, concurrency)
+            if name == 'add':
+                # Processing happens after the response; time the backlog it left too
+                with redirect_stdout(devnull):
+                    results[name]['jobs_drained_s'] = wait_for_jobs()
+            print(f"✅ {name}: median {results[name]['median_ms']} ms, "
+                  f"{results[name]['throughput_rps']} req/s", flush=True)
+    return results
@@ -0,0 +1,72 @@
+"""Image pipeline and metadata micro-benchmarks on fixed synthetic inputs"""
+import io
+import os
+import shutil
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from benchmarks.harness import measure
+from benchmarks.synthetic import item_rng, synthetic_image, sd_parameters
+
+# name -> (ext, size): an SD render, an SDXL render, and a photo big enough for JPEG draft mode
+SAMPLES = {
+    'png_1024': ('png', (1024, 1024)),
+    'jpeg_1216': ('jpg', (1216, 832)),
+    'jpeg_4000': ('jpg', (4000, 3000)),
+}
+
+def make_samples(seed):
+    samples = {}
+    for offset, (name, (ext, size)) in enumerate(SAMPLES.items()):
+        data, _, _ = synthetic_image(item_rng(f"micro-{seed}", offset), ext=ext, size=size)
+        samples[name] = (data, ext)
+    return samples
+
+def run_micro(seed=0, iterations=10):
+    from image_utils import (read_ai_metadata, parse_sd_parameters, optimize_image_with_metadata,
+                             create_thumbnail_with_metadata, process_image, derivative_dir)
+    from utils import validate_image_file
+
+    print("⏱️ Micro-benchmarks", flush=True)
+    samples = make_samples(seed)
+    parameters, _ = sd_parameters(item_rng(f"micro-{seed}", 'params'), (1024, 1024))
+    scratch = os.path.abspath('bench-scratch')
+    os.makedirs(os.path.join(scratch, 'uploads'), exist_ok=True)
+    os.makedirs(os.path.join(scratch, 'thumbnails'), exist_ok=True)
+
+    results = {}
+    results['parse_sd_parameters'] = measure(lambda: parse_sd_parameters(parameters), iterations * 200)
+
+    for name, (data, ext) in samples.items():
+        source = os.path.join(scratch, f"source-{name}.{ext}")
+        with open(source, 'wb') as f:
+            f.write(data)
+        upload = os.path.join(scratch, 'uploads', f"{name}.{ext}")
+        thumb = upload.replace('/uploads/', '/thumbnails/')
+
+        def fresh_upload():
+            shutil.copyfile(source, upload)
+            return ()
+
+        def read_metadata():
+            with Image.open(io.BytesIO(data)) as img:
+                read_ai_metadata(img)
+
+        results[f'validate_image_file[{name}]'] = measure(
+            lambda: validate_image_file(FileStorage(io.BytesIO(data), filename=f"upload.{ext}")),
+            iterations * 10)
+        results[f'read_ai_metadata[{name}]'] = measure(read_metadata, iterations * 5)
+        results[f'optimize_image_with_metadata[{name}]'] = measure(
+            lambda: optimize_image_with_metadata(io.BytesIO(data)), iterations)
+        results[f'create_thumbnail_with_metadata[{name}]'] = measure(
+            lambda: create_thumbnail_with_metadata(upload, overwrite=True), iterations, setup=fresh_upload)
+        results[f'process_image[{name}]'] = measure(
+            lambda: process_image(upload, thumb_path=thumb), iterations, setup=fresh_upload)
+        # The full upload job; AVIF encoding dominates, so fewer rounds
+        results[f'process_image+derivatives[{name}]'] = measure(
+            lambda: process_image(upload, thumb_path=thumb, derivatives_dir=derivative_dir(upload)),
+            max(1, iterations // 5), setup=fresh_upload)
+        shutil.rmtree(derivative_dir(upload), ignore_errors=True)
+        print(f"✅ {name} done", flush=True)
+
+    shutil.rmtree(scratch, ignore_errors=True)
+    return results
@@ -0,0 +1,135 @@
+"""
+Deterministic synthetic gallery: Stable Diffusion style images with a
+generation `parameters` chunk (PNG) or ImageDescription (JPEG), ingested
+the way an upload is (content-hashed blob, artwork row, process_image).
+The same count and seed always produce the same library.
+"""
+import io
+import os
+import random
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFilter
+from PIL.PngImagePlugin import PngInfo
+
+SUBJECTS = ['cat', 'castle', 'forest', 'astronaut', 'dragon', 'lighthouse', 'robot', 'city',
+            'mountain', 'portrait', 'ocean', 'garden', 'library', 'train', 'fox', 'temple']
+STYLES = ['oil painting', 'watercolor', 'concept art', 'photograph', 'pixel art', 'ink sketch',
+          'cinematic lighting', 'studio ghibli style', 'isometric', 'art nouveau']
+DETAILS = ['highly detailed', 'golden hour', 'misty', '8k', 'volumetric light', 'pastel colors',
+           'dramatic shadows', 'soft focus', 'intricate', 'night']
+MODELS = ['sd_xl_base_1.0', 'dreamshaper_8', 'realisticVision_v51', 'juggernautXL_v9']
+SAMPLERS = ['Euler a', 'DPM++ 2M Karras', 'DPM++ SDE Karras', 'DDIM']
+NEGATIVE_PROMPT = 'lowres, bad anatomy, blurry, watermark, jpeg artifacts'
+# Native SD/SDXL output sizes
+SD_SIZES = [(512, 512), (512, 768), (768, 512), (768, 768), (832, 1216), (1216, 832), (1024, 1024)]
+PNG_SHARE = 0.6
+
+def item_rng(seed, index):
+    """Independent, reproducible stream per item, so workers can generate in any order"""
+    return random.Random(f"{seed}:{index}")
+
+def sd_parameters(rng, size):
+    """(A1111-style parameters text, prompt)"""
+    prompt = ', '.join([f"a {rng.choice(SUBJECTS)}", rng.choice(STYLES)] + rng.sample(DETAILS, 3))
+    parameters = (
+        f"{prompt}\nNegative prompt: {NEGATIVE_PROMPT}\n"
+        f"Steps: {rng.randint(20, 50)}, Sampler: {rng.choice(SAMPLERS)}, "
+        f"CFG scale: {rng.choice((5, 6, 7, 7.5, 9))}, Seed: {rng.randrange(2 ** 32)}, "
+        f"Size: {size[0]}x{size[1]}, Model: {rng.choice(MODELS)}"
+    )
+    return parameters, prompt
+
+def render(rng, size):
+    """Gradients, flat shapes and blurred grain: compresses like a real render, not like noise or a flat fill"""
+    width, height = size
+    gradient = Image.linear_gradient('L')
+    img = Image.merge('RGB', [gradient.rotate(rng.choice((0, 90, 180, 270))).resize(size) for _ in range(3)])
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(8, 24)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randint(width // 16, width // 3), y0 + rng.randint(height // 16, height // 3)
+        fill = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x0, y0, x1, y1], fill=fill)
+    grain = Image.frombytes('L', size, rng.randbytes(width * height)).filter(ImageFilter.GaussianBlur(1))
+    return Image.blend(img, Image.merge('RGB', [grain] * 3), 0.12)
+
+def encode(img, ext, parameters):
+    buf = io.BytesIO()
+    if ext == 'png':
+        info = PngInfo()
+        info.add_text('parameters', parameters)
+        img.save(buf, 'PNG', pnginfo=info)
+    else:
+        exif = Image.Exif()
+        exif[0x010E] = parameters   # ImageDescription, read by read_ai_metadata()
+        img.save(buf, 'JPEG', quality=92, exif=exif)
+    return buf.getvalue()
+
+def synthetic_image(rng, ext=None, size=None):
+    """One image as (bytes, ext, prompt); ext is 'png' or 'jpg' like sniff_image_format()"""
+    ext = ext or ('png' if rng.random() < PNG_SHARE else 'jpg')
+    size = size or rng.choice(SD_SIZES)
+    parameters, prompt = sd_parameters(rng, size)
+    return encode(render(rng, size), ext, parameters), ext, prompt
+
+def _ingest(seed, index, derivatives):
+    """Worker: generate one image, store it under its hash and run the upload pipeline on it"""
+    from config import UPLOAD_FOLDER
+    from image_utils import process_image, derivative_dir
+
+    rng = item_rng(seed, index)
+    data, ext, prompt = synthetic_image(rng)
+    digest = hashlib.sha256(data).hexdigest()
+    image_path = f"{UPLOAD_FOLDER}/{digest}.{ext}"
+    with open(image_path, 'wb') as f:
+        f.write(data)
+    result = process_image(
+        image_path, thumb_path=image_path.replace('/uploads/', '/thumbnails/'),
+        derivatives_dir=derivative_dir(image_path) if derivatives else None
+    )
+    title = None if rng.random() < 0.1 else f"{prompt.split(',')[0][2:].title()} #{index}"
+    return index, digest, image_path, title, prompt, result
+
+def populate_library(count, seed=0, derivatives=False, workers=None):
+    """
+    Make sure the gallery in the current directory holds `count` synthetic
+    artworks; only the missing ones are generated. Returns the artwork count.
+    """
+    from db import init_db, get_db_connection
+    from api import store_ai_metadata
+    from gallery import format_derivatives
+    from ordering import next_position
+    from revision import bump_revision
+
+    init_db()
+    conn = get_db_connection()
+    existing = conn.execute('SELECT COUNT(*) FROM artworks').fetchone()[0]
+    if existing >= count:
+        return existing
+
+    print(f"🎨 Generating {count - existing} synthetic artworks (seed {seed})", flush=True)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(_ingest, seed, i, derivatives) for i in range(existing, count)]
+        # Insert in index order so positions and ids are reproducible
+        for future in futures:
+            index, digest, image_path, title, prompt, result = future.result()
+            conn.execute(
+                'INSERT OR IGNORE INTO blobs (hash, path, refcount) VALUES (?, ?, 1)',
+                (digest, image_path)
+            )
+            cursor = conn.execute(
+                "INSERT INTO artworks (title, description, image_path, position, status, derivatives) "
+                "VALUES (?, ?, ?, ?, 'ready', ?)",
+                (title, prompt.capitalize(), image_path, next_position(conn),
+                 format_derivatives(result['derivatives']))
+            )
+            store_ai_metadata(conn, cursor.lastrowid, result['ai_metadata'])
+            if (index + 1) % 50 == 0:
+                conn.commit()
+                print(f"⏳ {index + 1}/{count}", flush=True)
+    conn.commit()
+    bump_revision()
+    return count
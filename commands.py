@@ -0,0 +1,84 @@
+import os
+import click
+from db import init_db, get_db_connection
+from api import extract_ai_metadata, store_ai_metadata
+from ordering import rebalance_positions
+from backfill import run_backfill, KINDS
+from revision import bump_revision
+from storage_gc import collect_garbage
+from assets import build_assets
+from config import GC_GRACE_SECONDS, GC_BATCH_SIZE
+
+def register_commands(app):
+    """
+    Register maintenance commands on the Flask CLI
+    Usage: flask --app app <command>
+    """
+
+    @app.cli.command('backfill-metadata')
+    @click.option('--force', is_flag=True, help='Re-extract artworks that already have stored metadata')
+    def backfill_metadata(force):
+        """Extract AI metadata for existing artworks into artwork_metadata (one-shot)"""
+        init_db()
+        conn = get_db_connection()
+
+        if force:
+            rows = conn.execute('SELECT id, image_path FROM artworks').fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT a.id, a.image_path FROM artworks a
+                LEFT JOIN artwork_metadata m ON m.artwork_id = a.id
+                WHERE m.artwork_id IS NULL
+            ''').fetchall()
+
+        processed = 0
+        missing = 0
+        for row in rows:
+            if not os.path.exists(row['image_path']):
+                missing += 1
+                continue
+            store_ai_metadata(conn, row['id'], extract_ai_metadata(row['image_path']))
+            processed += 1
+            # Commit in batches so an interrupted run keeps its progress
+            if processed % 100 == 0:
+                conn.commit()
+
+        conn.commit()
+        conn.close()
+        bump_revision()
+        print(f"✅ Metadata backfill done: {processed} extracted, {missing} missing files")
+
+    @app.cli.command('rebalance-positions')
+    def rebalance_positions_command():
+        """Renumber artwork positions evenly, keeping the current order"""
+        init_db()
+        conn = get_db_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        rebalance_positions(conn)
+        conn.commit()
+        conn.close()
+        bump_revision()
+
+    @app.cli.command('backfill')
+    @click.option('--only', type=click.Choice(KINDS), help='Only regenerate this kind of output')
+    @click.option('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    @click.option('--force', is_flag=True, help='Ignore the manifest and redo every file')
+    def backfill(only, workers, force):
+        """Regenerate thumbnails and derivatives in parallel (resumable)"""
+        run_backfill((only,) if only else KINDS, workers=workers, force=force)
+
+    @app.cli.command('gc')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+    @click.option('--grace', type=int, default=GC_GRACE_SECONDS, show_default=True,
+                  help='Skip files modified in the last SECONDS')
+    @click.option('--batch', type=int, default=GC_BATCH_SIZE, show_default=True, help='Directory entries per batch')
+    def gc(dry_run, grace, batch):
+        """Remove uploads, thumbnails and derivatives no artwork references"""
+        init_db()
+        collect_garbage(dry_run=dry_run, grace_seconds=grace, batch_size=batch)
+
+    @app.cli.command('assets')
+    @click.option('--force', is_flag=True, help='Rebuild even if no source changed')
+    def assets(force):
+        """Bundle, minify, fingerprint and precompress CSS and JavaScript"""
+        build_assets(force=force)
@@ -1,6 +1,15 @@
 import os
 
 SECRET_KEY = 'art_gallery_secret_key'
+
+# SQLite
+DATABASE_PATH = os.environ.get('GALLERY_DATABASE', 'database.db')
+DB_BUSY_TIMEOUT = 10            # seconds to wait on a locked database
+DB_CACHE_SIZE_KIB = 64 * 1024   # page cache per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_STATEMENT_CACHE_SIZE = 256   # prepared statements kept per connection
+# Touched on every gallery write; its mtime is the ETag revision (see revision.py)
+GALLERY_REVISION_PATH = os.environ.get('GALLERY_REVISION', DATABASE_PATH + '.rev')
 UPLOAD_FOLDER = 'static/uploads'
 THUMBNAIL_FOLDER = 'static/thumbnails'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg'}
@@ -8,6 +17,88 @@ MAX_IMAGE_SIZE = (1920, 1080)
 THUMBNAIL_SIZE = (400, 400)
 IMAGE_QUALITY = 85
 
+# Upload intake (see intake.py): the body is capped while it is read, files
+# larger than UPLOAD_SPOOL_SIZE spill to a temp file instead of RAM, and
+# images are rejected from their header before any pixels are decoded
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 1024 * 1024   # room for the other form fields
+UPLOAD_SPOOL_SIZE = 512 * 1024
+MAX_IMAGE_PIXELS = 50_000_000   # ~200MB RGBA once decoded
+# /api/artworks/batch: files per request and the body limit it gets instead of MAX_CONTENT_LENGTH
+BATCH_MAX_FILES = 100
+BATCH_MAX_CONTENT_LENGTH = 512 * 1024 * 1024
+BATCH_STREAM_TIMEOUT = 900      # seconds the response keeps reporting job progress
+
+# Responsive derivatives: each upload is also stored at these widths
+# (never upscaled) in every supported modern format plus a JPEG/PNG fallback
+DERIVATIVE_FOLDER = 'static/derivatives'
+DERIVATIVE_WIDTHS = (200, 400, 800, 1600)
+DERIVATIVE_QUALITY = {'avif': 55, 'webp': 80, 'jpeg': 82}
+DERIVATIVE_AVIF_SPEED = 6       # 0 (smallest, slowest) .. 10 (fastest)
+# Blurred placeholder shown until the thumbnail arrives: a WebP of at most
+# LQIP_SIZE px a side, inlined in the page and API as a data: URI (~200 bytes)
+LQIP_SIZE = 16
+LQIP_QUALITY = 40
+# Content-hashed image URLs never change, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 31536000
+
+# Bundled, fingerprinted CSS/JS (assets.py); rebuilt at startup when sources change
+ASSET_DIST_FOLDER = 'static/dist'
+ASSETS_BUILD_ON_STARTUP = True
+# Service worker (offline.py) runtime caches, in entries; least recently used go first
+SW_IMAGE_CACHE_ENTRIES = 500
+SW_API_CACHE_ENTRIES = 40
+GALLERY_PAGE_SIZE = 60
+# Tiles rendered into the page itself: about one screen on a wide display
+GALLERY_FIRST_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 200
+
+# In-process cache of listing/search response bodies (response_cache.py)
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+# Rendered gallery tiles, one per artwork (fragments.py)
+TILE_CACHE_MAX_ENTRIES = 10000
+
+# Near-duplicates by dHash Hamming distance (similarity.py), out of 64 bits
+SIMILAR_MAX_DISTANCE = 10
+SIMILAR_LIMIT = 24
+DUPLICATE_WARN_DISTANCE = 4     # /add warns when an existing artwork is this close
+
+# Dominant colours (palette.py): colours per artwork, extracted from a
+# PALETTE_SAMPLE_SIZE square downsample and indexed in CIELAB cells
+PALETTE_COLORS = 5
+PALETTE_SAMPLE_SIZE = 64
+PALETTE_BUCKET_SIZE = 10        # cell edge in Lab units
+COLOR_MATCH_DISTANCE = 20       # ?color= matches palette colours within this ΔE
+COLOR_MIN_SHARE = 0.1           # ...covering at least this fraction of the image
+
+# Streaming export (export.py): file read size for the zip, rows per listing chunk
+EXPORT_READ_SIZE = 1024 * 1024
+EXPORT_ROWS_PER_CHUNK = 500
+
+# Sparse ordering: new artworks are spaced POSITION_STEP apart and a move
+# takes the midpoint of its neighbours. Gaps below MIN_POSITION_GAP trigger
+# a renumbering in the background.
+POSITION_STEP = 1024.0
+MIN_POSITION_GAP = 1e-6
+REBALANCE_INTERVAL = 3600       # seconds between background gap checks
+
+# Thumbnail/derivative backfill (backfill.py): what was already done per source file
+BACKFILL_MANIFEST_PATH = os.environ.get('GALLERY_BACKFILL_MANIFEST', DATABASE_PATH + '.backfill.json')
+# Threads reading image headers when init_db fills the dimension columns (I/O bound)
+DIMENSION_BACKFILL_WORKERS = 16
+
+# Orphaned file collection (storage_gc.py)
+GC_GRACE_SECONDS = 3600         # never touch files younger than this (uploads in flight)
+GC_BATCH_SIZE = 1000            # directory entries checked against SQLite per batch
+
+# Background image processing (jobs.py)
+JOB_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+JOB_MAX_ATTEMPTS = 3
+JOB_LEASE_SECONDS = 600         # a running job older than this is assumed lost
+JOB_POLL_INTERVAL = 5           # seconds between queue checks when idle
+
 # Ensure upload and thumbnail directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
\ No newline at end of file
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+os.makedirs(DERIVATIVE_FOLDER, exist_ok=True)
\ No newline at end of file
@@ -1,10 +1,97 @@
+import os
+import time
 import sqlite3
+import threading
+import config
+from metrics import observe_query
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
+_local = threading.local()
+
+class GalleryConnection(sqlite3.Connection):
+    """
+    Connection shared by everything running on one thread.
+    close() is a no-op so existing call sites can keep calling it;
+    the connection (with its page and prepared-statement caches) lives
+    as long as the thread.
+    """
+    shared = False
+
+    def close(self):
+        if not self.shared:
+            super().close()
+
+    def release(self):
+        super().close()
+
+    # Statement timings for /api/metrics. Lazy SELECTs are timed up to their
+    # first row, which is where SQLite does the sorting and index work.
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            observe_query(sql, time.perf_counter() - started)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            observe_query(script, time.perf_counter() - started)
+
+def connect(path=None):
+    """Open a new tuned connection (WAL, NORMAL sync, mmap, page cache)"""
+    conn = sqlite3.connect(
+        path or config.DATABASE_PATH,
+        timeout=config.DB_BUSY_TIMEOUT,
+        cached_statements=config.DB_STATEMENT_CACHE_SIZE,
+        factory=GalleryConnection
+    )
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run while /update-order or an upload is writing
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA mmap_size={int(config.DB_MMAP_SIZE)}')
+    conn.execute(f'PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KIB)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
+def get_db_connection():
+    """
+    Return this thread's connection, opening it on first use.
+    Reconnects after a fork (Gunicorn workers) or a DATABASE_PATH change.
+    """
+    conn = getattr(_local, 'conn', None)
+    key = (os.getpid(), config.DATABASE_PATH)
+    if conn is None or _local.key != key:
+        conn = connect()
+        conn.shared = True
+        _local.conn = conn
+        _local.key = key
+    return conn
+
+def close_db_connection():
+    """Really close this thread's connection"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.release()
+
+def init_app(app):
+    """Roll back anything a failed request left uncommitted on its thread's connection"""
+    @app.teardown_appcontext
+    def reset_db_connection(exc):
+        conn = getattr(_local, 'conn', None)
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
 def init_db():
     conn = get_db_connection()
     # Create artworks table if not exists
@@ -27,9 +114,243 @@ def init_db():
         conn.execute('ALTER TABLE artworks ADD COLUMN position INTEGER')
         conn.execute('UPDATE artworks SET position = id')
         conn.commit()
+    # 'processing' while the upload waits for its image job, 'failed' if it gave up
+    if 'status' not in cols:
+        conn.execute("ALTER TABLE artworks ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'")
+        conn.commit()
+    # Comma-separated widths under static/derivatives/<stem>/, NULL until generated
+    if 'derivatives' not in cols:
+        conn.execute('ALTER TABLE artworks ADD COLUMN derivatives TEXT')
+        conn.commit()
+    # 64-bit perceptual hash (image_utils.compute_dhash), NULL until computed
+    if 'dhash' not in cols:
+        conn.execute('ALTER TABLE artworks ADD COLUMN dhash INTEGER')
+        conn.commit()
+    # Dominant colours as JSON (palette.py), NULL until extracted; indexed in artwork_colors
+    if 'palette' not in cols:
+        conn.execute('ALTER TABLE artworks ADD COLUMN palette TEXT')
+        conn.commit()
+    # Blurred placeholder as a data: URI (image_utils.compute_lqip), NULL until generated
+    if 'lqip' not in cols:
+        conn.execute('ALTER TABLE artworks ADD COLUMN lqip TEXT')
+        conn.commit()
+    # Image facts for layout, sorting and filtering (gallery.DIMENSION_COLUMNS);
+    # rows that predate them are filled in by backfill_dimensions() below
+    for column, column_type in (('width', 'INTEGER'), ('height', 'INTEGER'), ('aspect_ratio', 'REAL'),
+                                ('file_size', 'INTEGER'), ('format', 'TEXT'),
+                                ('thumb_width', 'INTEGER'), ('thumb_height', 'INTEGER')):
+        if column not in cols:
+            conn.execute(f'ALTER TABLE artworks ADD COLUMN {column} {column_type}')
+            conn.commit()
+    # Bumped whenever a column a gallery tile shows changes (fragments.py caches tiles by it)
+    if 'revision' not in cols:
+        conn.execute('ALTER TABLE artworks ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+        conn.commit()
+    # Recreated every start so the column list always matches the tile template.
+    # position is left out: it is rendered outside the cached fragment, and a
+    # rebalance would otherwise invalidate every tile at once.
+    conn.executescript('''
+    DROP TRIGGER IF EXISTS artworks_revision;
+    CREATE TRIGGER artworks_revision
+    AFTER UPDATE OF title, description, image_path, derivatives, lqip, thumb_width, thumb_height ON artworks BEGIN
+        UPDATE artworks SET revision = old.revision + 1 WHERE id = new.id;
+    END;
+    ''')
     
     # Add indexes for better performance
     conn.execute('CREATE INDEX IF NOT EXISTS idx_position ON artworks(position)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON artworks(created_at)')
+    # Expression indexes for keyset pagination by title (see gallery.SORT_KEYS)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title_az ON artworks(LOWER(COALESCE(NULLIF(title, ''), char(1114111))))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title_za ON artworks(LOWER(COALESCE(title, '')))")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_image_path ON artworks(image_path)')
+    # Resolution sorts (see gallery.SORT_KEYS)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pixels_desc ON artworks(COALESCE(width * height, -1))')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pixels_asc ON artworks(COALESCE(width * height, 9223372036854775807))')
+    conn.commit()
+
+    # AI generation metadata extracted once at ingest (one row per artwork)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS artwork_metadata (
+        artwork_id INTEGER PRIMARY KEY,
+        prompt TEXT,
+        negative_prompt TEXT,
+        model TEXT,
+        seed TEXT,
+        steps TEXT,
+        cfg_scale TEXT,
+        sampler TEXT,
+        generation_size TEXT,
+        format TEXT,
+        size TEXT,
+        extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+    # Durable queue for image processing (see jobs.py)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        artwork_id INTEGER,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        payload TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)')
+    conn.commit()
+
+    # Content-addressed uploads (see storage.py): one file per distinct SHA-256,
+    # refcount = number of artworks pointing at it
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        refcount INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+    # CRC-32 of exported files (see export.py), valid while size and mtime match
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS export_checksums (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        crc32 INTEGER NOT NULL
+    )
+    ''')
     conn.commit()
-    conn.close()
\ No newline at end of file
+
+    # Incremented whenever any artwork's dhash appears, changes or goes away,
+    # so similarity.py reloads its in-memory index only then
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS dhash_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO dhash_generation (id, generation) VALUES (1, 0);
+
+    CREATE TRIGGER IF NOT EXISTS artworks_dhash_insert AFTER INSERT ON artworks
+    WHEN new.dhash IS NOT NULL BEGIN
+        UPDATE dhash_generation SET generation = generation + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_dhash_update AFTER UPDATE OF dhash ON artworks
+    WHEN new.dhash IS NOT old.dhash BEGIN
+        UPDATE dhash_generation SET generation = generation + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_dhash_delete AFTER DELETE ON artworks
+    WHEN old.dhash IS NOT NULL BEGIN
+        UPDATE dhash_generation SET generation = generation + 1;
+    END;
+    ''')
+
+    # Lab cell and exact Lab value of each artwork's palette colours, kept in
+    # sync with artworks.palette by triggers so ?color= is answered from this
+    # index alone
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS artwork_colors (
+        artwork_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        share REAL NOT NULL,
+        l REAL NOT NULL,
+        a REAL NOT NULL,
+        b REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_artwork_colors_bucket ON artwork_colors(bucket, artwork_id, share, l, a, b);
+    CREATE INDEX IF NOT EXISTS idx_artwork_colors_artwork ON artwork_colors(artwork_id);
+
+    CREATE TRIGGER IF NOT EXISTS artworks_palette_insert AFTER INSERT ON artworks
+    WHEN new.palette IS NOT NULL BEGIN
+        INSERT INTO artwork_colors (artwork_id, bucket, share, l, a, b)
+        SELECT new.id, json_extract(value, '$.bucket'), json_extract(value, '$.share'),
+               json_extract(value, '$.lab[0]'), json_extract(value, '$.lab[1]'), json_extract(value, '$.lab[2]')
+        FROM json_each(new.palette);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_palette_update AFTER UPDATE OF palette ON artworks
+    WHEN new.palette IS NOT old.palette BEGIN
+        DELETE FROM artwork_colors WHERE artwork_id = new.id;
+        INSERT INTO artwork_colors (artwork_id, bucket, share, l, a, b)
+        SELECT new.id, json_extract(value, '$.bucket'), json_extract(value, '$.share'),
+               json_extract(value, '$.lab[0]'), json_extract(value, '$.lab[1]'), json_extract(value, '$.lab[2]')
+        FROM json_each(new.palette);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_palette_delete AFTER DELETE ON artworks BEGIN
+        DELETE FROM artwork_colors WHERE artwork_id = old.id;
+    END;
+    ''')
+
+    init_search_index(conn)
+
+    from backfill import backfill_dimensions
+    backfill_dimensions(conn)
+    conn.close()
+
+def init_search_index(conn):
+    """
+    Full-text index over title, description and the stored AI prompt.
+    rowid of artworks_fts is the artwork id; triggers keep it in sync.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'artworks_fts'"
+    ).fetchone()
+
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS artworks_fts USING fts5(
+        title,
+        description,
+        prompt,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    ''')
+
+    conn.executescript('''
+    CREATE TRIGGER IF NOT EXISTS artworks_fts_insert AFTER INSERT ON artworks BEGIN
+        INSERT INTO artworks_fts (rowid, title, description, prompt)
+        VALUES (new.id, new.title, new.description,
+                (SELECT prompt FROM artwork_metadata WHERE artwork_id = new.id));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_fts_update AFTER UPDATE OF title, description ON artworks BEGIN
+        UPDATE artworks_fts SET title = new.title, description = new.description
+        WHERE rowid = new.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artworks_fts_delete AFTER DELETE ON artworks BEGIN
+        DELETE FROM artworks_fts WHERE rowid = old.id;
+    END;
+
+    -- INSERT OR REPLACE on artwork_metadata only fires the insert trigger
+    CREATE TRIGGER IF NOT EXISTS artwork_metadata_fts_insert AFTER INSERT ON artwork_metadata BEGIN
+        UPDATE artworks_fts SET prompt = new.prompt WHERE rowid = new.artwork_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artwork_metadata_fts_update AFTER UPDATE OF prompt ON artwork_metadata BEGIN
+        UPDATE artworks_fts SET prompt = new.prompt WHERE rowid = new.artwork_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS artwork_metadata_fts_delete AFTER DELETE ON artwork_metadata BEGIN
+        UPDATE artworks_fts SET prompt = NULL WHERE rowid = old.artwork_id;
+    END;
+    ''')
+
+    # First run on an existing library - index everything once
+    if not exists:
+        conn.execute('''
+            INSERT INTO artworks_fts (rowid, title, description, prompt)
+            SELECT a.id, a.title, a.description, m.prompt
+            FROM artworks a LEFT JOIN artwork_metadata m ON m.artwork_id = a.id
+        ''')
+    conn.commit()
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""
+Streaming gallery export, in constant memory however large the library.
+
+    GET /api/export/artworks?format=ndjson|csv   artworks + stored AI metadata
+    GET /api/export/originals.zip                every original image, resumable
+
+The artwork listing is written row by row from a SQLite cursor. The zip
+holds the distinct files under static/uploads (artworks sharing identical
+bytes share one entry; the listing's image_path names it). It is stored,
+not deflated, since the images are compressed already, so its layout and
+total length are known from file sizes alone before a byte is sent. That is
+what makes Range requests possible: any byte range is produced directly,
+reading only the files it overlaps.
+
+Entries use data descriptors, so a file's CRC-32 is computed while it is
+streamed instead of in a separate pass. CRCs are cached in the
+export_checksums table (keyed by path, size and mtime) for the descriptor
+and central directory parts of later exports and resumed downloads.
+Archives past 4 GiB or 65535 entries get zip64 records.
+"""
+import io
+import os
+import csv
+import json
+import time
+import zlib
+import struct
+import hashlib
+from flask import request, jsonify, Response
+from db import connect, get_db_connection
+from api import AI_METADATA_FIELDS
+from config import EXPORT_READ_SIZE, EXPORT_ROWS_PER_CHUNK
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+# Unix host, zip64-capable spec version: mode bits in external_attr are honoured
+VERSION_MADE_BY = (3 << 8) | 45
+FLAGS = 0x0008 | 0x0800       # sizes/CRC in a data descriptor; UTF-8 names
+FILE_ATTRIBUTES = 0o100644 << 16
+
+EXPORT_SQL = (
+    'SELECT a.*, ' + ', '.join(f'm.{field} AS ai_{field}' for field in AI_METADATA_FIELDS) +
+    ' FROM artworks a LEFT JOIN artwork_metadata m ON m.artwork_id = a.id ORDER BY a.id'
+)
+
+# --- artwork listing --------------------------------------------------------
+
+def _export_rows():
+    """(column names, row iterator) on a connection of its own, closed when the iterator is"""
+    conn = connect()
+    cursor = conn.execute(EXPORT_SQL)
+    columns = [d[0] for d in cursor.description]
+
+    def rows():
+        try:
+            while True:
+                batch = cursor.fetchmany(EXPORT_ROWS_PER_CHUNK)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            conn.close()
+    return columns, rows()
+
+def stream_ndjson():
+    columns, batches = _export_rows()
+    ai_columns = [c for c in columns if c.startswith('ai_')]
+    for batch in batches:
+        lines = []
+        for row in batch:
+            record = {c: row[c] for c in columns if c not in ai_columns}
+            record['ai_metadata'] = {c[3:]: row[c] for c in ai_columns if row[c] is not None}
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield '\n'.join(lines) + '\n'
+
+def stream_csv():
+    columns, batches = _export_rows()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# --- zip archive ------------------------------------------------------------
+
+def _dos_datetime(mtime_ns):
+    t = time.localtime(mtime_ns / 1e9)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+class ZipEntry:
+    __slots__ = ('name', 'path', 'size', 'mtime_ns', 'offset')
+
+    def __init__(self, name, path, size, mtime_ns, offset):
+        self.name = name.encode('utf-8')
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.offset = offset
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP32_LIMIT
+
+    def local_header(self):
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if self.zip64 else b''
+        sizes = ZIP32_LIMIT if self.zip64 else 0
+        dos_time, dos_date = _dos_datetime(self.mtime_ns)
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if self.zip64 else 20, FLAGS, 0,
+                           dos_time, dos_date, 0, sizes, sizes, len(self.name), len(extra)) + self.name + extra
+
+    def local_header_size(self):
+        return 30 + len(self.name) + (20 if self.zip64 else 0)
+
+    def descriptor(self, crc):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, crc, self.size, self.size)
+        return struct.pack('<IIII', 0x08074b50, crc, self.size, self.size)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def _central_extra(self):
+        values = []
+        if self.zip64:
+            values += [self.size, self.size]
+        if self.offset >= ZIP32_LIMIT:
+            values.append(self.offset)
+        return struct.pack(f'<HH{len(values)}Q', 0x0001, 8 * len(values), *values) if values else b''
+
+    def central_header(self, crc):
+        extra = self._central_extra()
+        size = min(self.size, ZIP32_LIMIT)
+        dos_time, dos_date = _dos_datetime(self.mtime_ns)
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, VERSION_MADE_BY, 45 if extra else 20, FLAGS, 0,
+                           dos_time, dos_date, crc, size, size, len(self.name), len(extra), 0, 0, 0,
+                           FILE_ATTRIBUTES, min(self.offset, ZIP32_LIMIT)) + self.name + extra
+
+    def central_header_size(self):
+        return 46 + len(self.name) + len(self._central_extra())
+
+class ZipStream:
+    """
+    Byte-exact layout of a stored zip over files on disk. iter_bytes() yields
+    any range of it; files are read in EXPORT_READ_SIZE chunks, never whole.
+    """
+
+    def __init__(self, files, checksums):
+        """files: [(archive name, path, size, mtime_ns)]; checksums: {(path, size, mtime_ns): crc}"""
+        self.entries = []
+        offset = 0
+        for name, path, size, mtime_ns in files:
+            entry = ZipEntry(name, path, size, mtime_ns, offset)
+            self.entries.append(entry)
+            offset += entry.local_header_size() + size + entry.descriptor_size()
+        self.cd_offset = offset
+        self.cd_size = sum(entry.central_header_size() for entry in self.entries)
+        self.zip64 = (len(self.entries) >= ZIP16_LIMIT or self.cd_offset >= ZIP32_LIMIT
+                      or self.cd_size >= ZIP32_LIMIT)
+        self.size = self.cd_offset + self.cd_size + (56 + 20 if self.zip64 else 0) + 22
+        self.checksums = checksums
+        # Computed during this download, for the caller to save
+        self.new_checksums = {}
+
+    def etag(self):
+        digest = hashlib.sha256()
+        for entry in self.entries:
+            digest.update(b'%s\0%d\0%d\n' % (entry.name, entry.size, entry.mtime_ns))
+        return digest.hexdigest()[:32]
+
+    def _key(self, entry):
+        return (entry.path, entry.size, entry.mtime_ns)
+
+    def _crc(self, entry):
+        key = self._key(entry)
+        if key not in self.checksums:
+            crc = 0
+            for chunk in self._read(entry, 0, entry.size):
+                crc = zlib.crc32(chunk, crc)
+            self._remember(entry, crc)
+        return self.checksums[key]
+
+    def _remember(self, entry, crc):
+        self.checksums[self._key(entry)] = crc
+        self.new_checksums[self._key(entry)] = crc
+
+    def _read(self, entry, start, stop):
+        with open(entry.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            # The length was promised up front; a changed file cannot be sent any more
+            if st.st_size != entry.size or st.st_mtime_ns != entry.mtime_ns:
+                raise IOError(f"{entry.path} changed during the export")
+            f.seek(start)
+            remaining = stop - start
+            while remaining:
+                chunk = f.read(min(EXPORT_READ_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{entry.path} was truncated during the export")
+                remaining -= len(chunk)
+                yield chunk
+
+    def _file_data(self, entry, start, stop):
+        # A whole file checksums itself on the way through
+        if start == 0 and stop == entry.size and self._key(entry) not in self.checksums:
+            crc = 0
+            for chunk in self._read(entry, start, stop):
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+            self._remember(entry, crc)
+        else:
+            yield from self._read(entry, start, stop)
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.zip64:
+            eocd64_offset = self.cd_offset + self.cd_size
+            records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, VERSION_MADE_BY, 45, 0, 0,
+                                   count, count, self.cd_size, self.cd_offset)
+            records += struct.pack('<IIQI', 0x07064b50, 0, eocd64_offset, 1)
+        return records + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP16_LIMIT),
+                                     min(count, ZIP16_LIMIT), min(self.cd_size, ZIP32_LIMIT),
+                                     min(self.cd_offset, ZIP32_LIMIT), 0)
+
+    def _segments(self):
+        """(length, produce) in archive order; produce(lo, hi) yields that slice of the segment"""
+        def fixed(make):
+            return lambda lo, hi: iter((make()[lo:hi],))
+
+        for entry in self.entries:
+            yield entry.local_header_size(), fixed(entry.local_header)
+            yield entry.size, lambda lo, hi, entry=entry: self._file_data(entry, lo, hi)
+            yield entry.descriptor_size(), fixed(lambda entry=entry: entry.descriptor(self._crc(entry)))
+        for entry in self.entries:
+            yield entry.central_header_size(), fixed(lambda entry=entry: entry.central_header(self._crc(entry)))
+        yield self.size - self.cd_offset - self.cd_size, fixed(self._end_records)
+
+    def iter_bytes(self, start=0, stop=None):
+        stop = self.size if stop is None else stop
+        position = 0
+        for length, produce in self._segments():
+            segment_start, position = position, position + length
+            if position <= start or not length:
+                continue
+            if segment_start >= stop:
+                return
+            yield from produce(max(start, segment_start) - segment_start, min(stop, position) - segment_start)
+
+def _load_checksums(conn):
+    return {(row['path'], row['size'], row['mtime_ns']): row['crc32']
+            for row in conn.execute('SELECT path, size, mtime_ns, crc32 FROM export_checksums')}
+
+def save_checksums(checksums):
+    if not checksums:
+        return
+    conn = get_db_connection()
+    conn.executemany(
+        'INSERT OR REPLACE INTO export_checksums (path, size, mtime_ns, crc32) VALUES (?, ?, ?, ?)',
+        [(path, size, mtime_ns, crc) for (path, size, mtime_ns), crc in checksums.items()]
+    )
+    conn.commit()
+
+def originals_archive():
+    """ZipStream over every distinct original, in order of first use"""
+    conn = get_db_connection()
+    files = []
+    for row in conn.execute('SELECT image_path FROM artworks GROUP BY image_path ORDER BY MIN(id)'):
+        try:
+            st = os.stat(row['image_path'])
+        except FileNotFoundError:
+            continue
+        files.append((f"uploads/{os.path.basename(row['image_path'])}", row['image_path'], st.st_size, st.st_mtime_ns))
+    return ZipStream(files, _load_checksums(conn))
+
+def _stream_archive(archive, start, stop):
+    # Checksums learned along the way are saved in batches, not once per file
+    try:
+        for chunk in archive.iter_bytes(start, stop):
+            yield chunk
+            if len(archive.new_checksums) >= 100:
+                save_checksums(archive.new_checksums)
+                archive.new_checksums = {}
+    finally:
+        save_checksums(archive.new_checksums)
+
+def register_export_routes(app):
+    @app.route('/api/export/artworks')
+    def export_artworks():
+        fmt = request.args.get('format', 'ndjson')
+        if fmt == 'ndjson':
+            body, mimetype = stream_ndjson(), 'application/x-ndjson'
+        elif fmt == 'csv':
+            body, mimetype = stream_csv(), 'text/csv'
+        else:
+            return jsonify({'success': False, 'message': 'format must be ndjson or csv'}), 400
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=gallery-artworks.{fmt}'
+        return response
+
+    @app.route('/api/export/originals.zip')
+    def export_originals():
+        archive = originals_archive()
+        etag = archive.etag()
+        start, stop, status = 0, archive.size, 200
+
+        # A resumed download only gets a range of the archive it started on
+        byte_range = request.range
+        if byte_range and ('If-Range' not in request.headers or request.if_range.etag == etag):
+            bounds = byte_range.range_for_length(archive.size)
+            if bounds is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f'bytes */{archive.size}'
+                return response
+            (start, stop), status = bounds, 206
+
+        response = Response(_stream_archive(archive, start, stop), status=status,
+                            mimetype='application/zip', direct_passthrough=True)
+        response.content_length = stop - start
+        if status == 206:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{archive.size}'
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Disposition'] = 'attachment; filename=gallery-originals.zip'
+        response.set_etag(etag)
+        return response
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+from config import TILE_CACHE_MAX_ENTRIES
+
+class TileCache:
+    """
+    Rendered gallery tiles, one per artwork id, tagged with the artwork's
+    revision column (bumped by a trigger in db.py whenever something the tile
+    shows changes). A tile is reused until that revision moves on, so a
+    write re-renders only the artworks it touched. LRU over entry count.
+    """
+
+    def __init__(self, max_entries=TILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, artwork_id, revision):
+        with self._lock:
+            entry = self._entries.get(artwork_id)
+            if entry is None or entry[0] != revision:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(artwork_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, artwork_id, revision, html):
+        with self._lock:
+            self._entries[artwork_id] = (revision, html)
+            self._entries.move_to_end(artwork_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+tile_cache = TileCache()
+
+def render_tile(artwork):
+    """Inner HTML of one gallery tile (templates/tile.html), from the cache when current"""
+    html = tile_cache.get(artwork['id'], artwork['revision'])
+    if html is None:
+        # Straight from the environment: no context processors or signals per tile
+        html = Markup(current_app.jinja_env.get_template('tile.html').render(artwork=artwork))
+        tile_cache.put(artwork['id'], artwork['revision'], html)
+    return html
+
+def init_app(app):
+    app.add_template_global(render_tile)
@@ -0,0 +1,172 @@
+import os
+import json
+import base64
+from config import GALLERY_PAGE_SIZE, GALLERY_MAX_PAGE_SIZE
+from search import build_match_query
+from palette import parse_palette, color_filter_sql
+from image_utils import RENDITION_VERSIONS
+
+# Keyset ordering per sort mode: (sql expression, descending).
+# Every mode is a single sort expression plus id, in one direction, so a page
+# is an index seek on (expression, rowid). Untitled artworks go last in both
+# title orders: a-z maps them to U+10FFFF, z-a to '' (lowest, so last in DESC).
+SORT_KEYS = {
+    'position': [('position', True), ('id', True)],
+    'newest': [('created_at', True), ('id', True)],
+    'oldest': [('created_at', False), ('id', False)],
+    'a-z': [("LOWER(COALESCE(NULLIF(title, ''), char(1114111)))", False), ('id', False)],
+    'z-a': [("LOWER(COALESCE(title, ''))", True), ('id', True)],
+    # Resolution in pixels; unknown sizes (SVG, still processing) go last in both
+    'largest': [('COALESCE(width * height, -1)', True), ('id', True)],
+    'smallest': [('COALESCE(width * height, 9223372036854775807)', False), ('id', False)],
+}
+# The title and resolution expressions are backed by idx_title_az / idx_title_za
+# and idx_pixels_desc / idx_pixels_asc in db.py and must stay textually identical to them.
+
+# ?orientation= conditions on aspect_ratio (width / height)
+ORIENTATIONS = {
+    'landscape': 'aspect_ratio > 1.05',
+    'portrait': 'aspect_ratio < 0.95',
+    'square': 'aspect_ratio BETWEEN 0.95 AND 1.05',
+}
+
+# Image facts on the artwork row (image_utils.describe_dimensions), written by
+# the upload job and backfilled by init_db, so listings never open files
+DIMENSION_COLUMNS = ('width', 'height', 'aspect_ratio', 'file_size', 'format', 'thumb_width', 'thumb_height')
+
+# Rendered tile width per breakpoint, mirrors the .artwork widths in gallery.css
+TILE_SIZES = ('(max-width: 600px) 100vw, (max-width: 900px) 50vw, '
+              '(max-width: 1200px) 33vw, (max-width: 1600px) 25vw, 20vw')
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(sort, values):
+    """Opaque cursor: urlsafe base64 of the sort mode and last row's key"""
+    raw = json.dumps([sort, values], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor')
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != len(SORT_KEYS[sort]):
+        raise InvalidCursor('Cursor does not match sort mode')
+    return values
+
+def format_derivatives(widths):
+    """Derivative widths -> artworks.derivatives column value ('200,400,800')"""
+    return ','.join(str(w) for w in widths) if widths else None
+
+def parse_derivatives(value):
+    return [int(w) for w in value.split(',')] if value else []
+
+def store_dimensions(conn, image_path, dimensions):
+    """Write describe_dimensions() values to every artwork using image_path. Caller commits"""
+    conn.execute(
+        f"UPDATE artworks SET {', '.join(f'{c} = ?' for c in DIMENSION_COLUMNS)} WHERE image_path = ?",
+        [dimensions[c] for c in DIMENSION_COLUMNS] + [image_path]
+    )
+
+def thumbnail_url(filename):
+    """Thumbnail URL under the current rendition version (immutable only with it)"""
+    return f"/thumbnail/{filename}?v={RENDITION_VERSIONS['thumbnails']}"
+
+def derivative_url(width, filename):
+    return f"/image/{width}/{filename}?v={RENDITION_VERSIONS['derivatives']}"
+
+def serialize_artwork(row):
+    """
+    Row -> dict for templates/JSON, with the thumbnail URL added and,
+    once derivatives exist, a srcset/sizes pair and the lightbox URL
+    """
+    art = dict(row)
+    filename = os.path.basename(art['image_path'])
+    art['thumbnail_path'] = thumbnail_url(filename)
+    art['palette'] = parse_palette(art.get('palette'))
+    widths = parse_derivatives(art.get('derivatives'))
+    if widths:
+        art['srcset'] = ', '.join(f"{derivative_url(w, filename)} {w}w" for w in widths)
+        art['sizes'] = TILE_SIZES
+        art['full_path'] = derivative_url(widths[-1], filename)
+    else:
+        art['srcset'] = None
+        art['sizes'] = None
+        art['full_path'] = art['image_path']
+    return art
+
+def fetch_artwork_page(conn, sort='position', cursor=None, limit=GALLERY_PAGE_SIZE, q='', color='',
+                       min_width=None, min_height=None, orientation=None):
+    """
+    One page of artworks using a (sort_key, id) seek instead of OFFSET.
+    Returns (artworks, next_cursor); next_cursor is None on the last page.
+    Raises InvalidCursor for an unknown sort mode, orientation or a bad
+    cursor, palette.InvalidColor for a colour it cannot parse.
+    """
+    if sort not in SORT_KEYS:
+        raise InvalidCursor(f'Unknown sort mode: {sort}')
+    if orientation and orientation not in ORIENTATIONS:
+        raise InvalidCursor(f'Unknown orientation: {orientation}')
+    keys = SORT_KEYS[sort]
+    limit = min(max(int(limit), 1), GALLERY_MAX_PAGE_SIZE)
+    descending = keys[0][1]
+
+    key_columns = ', '.join(f'{expr} AS _k{i}' for i, (expr, _) in enumerate(keys))
+    sql = f'SELECT *, {key_columns} FROM artworks WHERE 1=1'
+    params = []
+
+    match = build_match_query(q)
+    if match:
+        sql += ' AND id IN (SELECT rowid FROM artworks_fts WHERE artworks_fts MATCH ?)'
+        params.append(match)
+
+    if color:
+        color_sql, color_params = color_filter_sql(color)
+        sql += f' AND {color_sql}'
+        params.extend(color_params)
+
+    if min_width:
+        sql += ' AND width >= ?'
+        params.append(min_width)
+    if min_height:
+        sql += ' AND height >= ?'
+        params.append(min_height)
+    if orientation:
+        sql += f' AND {ORIENTATIONS[orientation]}'
+
+    if cursor:
+        values = decode_cursor(cursor, sort)
+        op = '<' if descending else '>'
+        # The redundant bound on the sort expression alone is what lets
+        # SQLite turn the row-value comparison into an index range
+        sql += f' AND {keys[0][0]} {op}= ? AND ({keys[0][0]}, id) {op} (?, ?)'
+        params.extend([values[0]] + values)
+
+    direction = 'DESC' if descending else 'ASC'
+    sql += ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _ in keys)
+    sql += ' LIMIT ?'
+    params.append(limit + 1)
+
+    # Text with no searchable words matches nothing, as in /api/search,
+    # rather than dropping the filter
+    if q and q.strip() and not match:
+        return [], None
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    artworks = []
+    for row in rows:
+        art = serialize_artwork(row)
+        for i in range(len(keys)):
+            art.pop(f'_k{i}')
+        artworks.append(art)
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, [last[f'_k{i}'] for i in range(len(keys))])
+    return artworks, next_cursor
@@ -1,9 +1,43 @@
-from PIL import Image, ExifTags
+from PIL import Image, ExifTags, features
 from PIL.PngImagePlugin import PngInfo
 import io
 import os
+import base64
+import hashlib
+import re
+import json
+import shutil
+import warnings
 from werkzeug.utils import secure_filename
-from config import ALLOWED_EXTENSIONS, MAX_IMAGE_SIZE, IMAGE_QUALITY
+from metrics import StageTimings, record_image_timings
+from palette import extract_palette, format_palette
+from config import (ALLOWED_EXTENSIONS, MAX_IMAGE_SIZE, THUMBNAIL_SIZE, IMAGE_QUALITY, MAX_IMAGE_PIXELS,
+                    DERIVATIVE_FOLDER, DERIVATIVE_WIDTHS, DERIVATIVE_QUALITY, DERIVATIVE_AVIF_SPEED,
+                    PALETTE_SAMPLE_SIZE, LQIP_SIZE, LQIP_QUALITY)
+
+# Derivative formats in order of preference, AVIF only when Pillow was built with it.
+# The last entry of each list is the fallback every browser understands.
+MODERN_FORMATS = [('webp', 'image/webp')]
+if features.check('avif'):
+    MODERN_FORMATS.insert(0, ('avif', 'image/avif'))
+FALLBACK_FORMATS = {False: ('jpeg', 'image/jpeg'), True: ('png', 'image/png')}
+
+# Settings the regenerable renditions depend on. backfill.py redoes a kind when
+# its signature changes; the hash goes into the URLs as ?v= (gallery.thumbnail_url),
+# so clients holding the old files as immutable fetch the new ones.
+RENDITION_SIGNATURES = {
+    'thumbnails': [list(THUMBNAIL_SIZE)],
+    'derivatives': [list(DERIVATIVE_WIDTHS), DERIVATIVE_QUALITY, [ext for ext, _ in MODERN_FORMATS]],
+}
+RENDITION_VERSIONS = {
+    kind: hashlib.sha256(json.dumps(signature, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    for kind, signature in RENDITION_SIGNATURES.items()
+}
+
+# Decompression-bomb guard, also in the job worker processes that import this module.
+# Pillow only warns between 1x and 2x the limit; make that an error too.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+warnings.simplefilter('error', Image.DecompressionBombWarning)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -44,6 +78,413 @@ def extract_all_metadata(img):
     
     return exif_bytes, pnginfo
 
+def read_ai_metadata(img):
+    """
+    Extract AI-generation-specific metadata (prompt, model, seed...) from the
+    PNG text chunks and EXIF of an opened PIL Image. Only reads headers.
+    """
+    metadata = {}
+
+    # PNG parameters
+    if img.format == 'PNG' and img.info:
+        params = None
+        if 'parameters' in img.info:
+            params = img.info['parameters']
+        for key in ['prompt', 'Prompt', 'Description', 'Comment']:
+            if key in img.info:
+                metadata['prompt'] = img.info[key]
+        # Try JSON parse first
+        if params:
+            try:
+                data = json.loads(params)
+                sui = data.get('sui_image_params')
+                if sui:
+                    metadata.update({
+                        'prompt': sui.get('prompt',''),
+                        'negative_prompt': sui.get('negativeprompt',''),
+                        'model': sui.get('model',''),
+                        'seed': str(sui.get('seed','')),
+                        'steps': str(sui.get('steps','')),
+                        'cfg_scale': str(sui.get('cfgscale','')),
+                        'sampler': sui.get('sampler','')
+                    })
+                    if 'width' in sui and 'height' in sui:
+                        metadata['generation_size'] = f"{sui['width']}x{sui['height']}"
+            except json.JSONDecodeError:
+                metadata.update(parse_sd_parameters(params))
+
+    # EXIF tags
+    try:
+        exif_obj = img.getexif()
+        for tid, val in exif_obj.items():
+            tag = ExifTags.TAGS.get(tid, tid)
+            if tag in ('ImageDescription','UserComment'):
+                text = val.decode('utf-8',errors='ignore') if isinstance(val, bytes) else str(val)
+                metadata.update(parse_sd_parameters(text))
+    except:
+        pass
+
+    return metadata
+
+def parse_sd_parameters(params_text):
+    """
+    Parse SD WebUI parameter strings into a dict of keys.
+    """
+    metadata = {}
+    if not params_text or not isinstance(params_text, str):
+        return metadata
+
+    lines = params_text.strip().split('\n')
+    # Prompt before 'Negative prompt:'
+    neg = params_text.find('Negative prompt:')
+    if neg > 0:
+        metadata['prompt'] = params_text[:neg].strip()
+    elif lines:
+        metadata['prompt'] = lines[0].strip()
+
+    # Negative prompt
+    if 'Negative prompt:' in params_text:
+        neg_start = neg + len('Negative prompt:')
+        neg_end = params_text.find('\n', neg_start) or len(params_text)
+        metadata['negative_prompt'] = params_text[neg_start:neg_end].strip()
+
+    # Parameter regex
+    patterns = [
+        (r'Steps:\s*(\d+)', 'steps'),
+        (r'Sampler:\s*([^,\n]+)', 'sampler'),
+        (r'CFG [Ss]cale:\s*([\d.]+)', 'cfg_scale'),
+        (r'Seed:\s*(\d+)', 'seed'),
+        (r'Model:\s*([^,\n]+)', 'model'),
+        (r'Size:\s*(\d+x\d+)', 'generation_size'),
+    ]
+    for pat, key in patterns:
+        m = re.search(pat, params_text)
+        if m:
+            metadata[key] = m.group(1).strip()
+    return metadata
+
+def fit_size(size, box):
+    """Size of an image scaled down (never up) to fit inside box, keeping aspect ratio"""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def describe_dimensions(size, image_format, file_size, thumb_size=None):
+    """{gallery.DIMENSION_COLUMNS: value}; size and thumb_size are None when unknown (SVG)"""
+    width, height = size or (None, None)
+    thumb_width, thumb_height = thumb_size or (None, None)
+    return {
+        'width': width,
+        'height': height,
+        'aspect_ratio': round(width / height, 4) if width and height else None,
+        'file_size': file_size,
+        'format': image_format,
+        'thumb_width': thumb_width,
+        'thumb_height': thumb_height,
+    }
+
+def image_dimensions(image_path, thumb_path=None, thumb_box=THUMBNAIL_SIZE):
+    """
+    describe_dimensions() of a stored upload from file headers only; None if
+    it is missing. Thumbnails not created yet are assumed to fit thumb_box.
+    """
+    try:
+        file_size = os.path.getsize(image_path)
+    except OSError:
+        return None
+    if image_path.lower().endswith('.svg'):
+        return describe_dimensions(None, 'SVG', file_size)
+    try:
+        # Image.open reads the header; no pixels are decoded
+        with Image.open(image_path) as img:
+            size, image_format = img.size, img.format
+        thumb_size = fit_size(size, thumb_box)
+        if thumb_path and os.path.exists(thumb_path):
+            with Image.open(thumb_path) as thumb:
+                thumb_size = thumb.size
+    except Exception as e:
+        print(f"❌ Could not read dimensions of {image_path}: {e}")
+        return None
+    return describe_dimensions(size, image_format, file_size, thumb_size)
+
+# dHash grid (DHASH_SIZE x DHASH_SIZE bits) and the size JPEGs are drafted to for it
+DHASH_SIZE = 8
+DHASH_DRAFT_SIZE = 64
+
+def _draft(img, box):
+    """
+    For JPEG, ask libjpeg to decode straight at 1/2, 1/4 or 1/8 scale
+    (never below what box needs). No-op for other formats.
+    Must run before the pixels are loaded.
+    """
+    img.draft(img.mode, fit_size(img.size, box))
+
+def compute_dhash(img):
+    """
+    64-bit difference hash: the image shrunk to 9x8 grey levels, one bit per
+    pair of horizontal neighbours (set when the left one is brighter).
+    Re-encodes, resizes and small edits land a few bits apart.
+    Signed, because that is what fits a SQLite INTEGER.
+    """
+    if img.mode not in ('L', 'RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('P', 'PA', 'LA') else 'RGB')
+    pixels = img.resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX).convert('L').tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            i = row * (DHASH_SIZE + 1) + col
+            value = (value << 1) | (pixels[i] > pixels[i + 1])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def image_dhash(image_path):
+    """compute_dhash() of a file, decoded at reduced size where the format allows; None if unreadable"""
+    if image_path.lower().endswith('.svg'):
+        return None
+    try:
+        with Image.open(image_path) as img:
+            _draft(img, (DHASH_DRAFT_SIZE, DHASH_DRAFT_SIZE))
+            return compute_dhash(img)
+    except Exception as e:
+        print(f"❌ Could not hash {image_path}: {e}")
+        return None
+
+def compute_lqip(img):
+    """Low-quality image placeholder: a tiny WebP of img as a data: URI"""
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('P', 'PA', 'LA') else 'RGB')
+    small = img.resize(fit_size(img.size, (LQIP_SIZE, LQIP_SIZE)), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    small.save(buffer, format='WEBP', quality=LQIP_QUALITY, method=6)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def image_lqip(image_path):
+    """compute_lqip() of a file, decoded at reduced size where the format allows; None if unreadable"""
+    if image_path.lower().endswith('.svg'):
+        return None
+    try:
+        with Image.open(image_path) as img:
+            _draft(img, (LQIP_SIZE, LQIP_SIZE))
+            return compute_lqip(img)
+    except Exception as e:
+        print(f"❌ Could not create placeholder for {image_path}: {e}")
+        return None
+
+def image_palette(image_path):
+    """format_palette(extract_palette()) of a file, decoded at reduced size; None if unreadable"""
+    if image_path.lower().endswith('.svg'):
+        return None
+    try:
+        with Image.open(image_path) as img:
+            _draft(img, (PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE))
+            return format_palette(extract_palette(img))
+    except Exception as e:
+        print(f"❌ Could not extract palette of {image_path}: {e}")
+        return None
+
+def _prepare_for_save(img, original_format):
+    """
+    Flatten transparency onto white unless the image stays PNG.
+    Returns (img, keep_png)
+    """
+    # Handle transparency properly
+    needs_transparency = img.mode in ('RGBA', 'LA', 'P') and original_format == 'PNG'
+    keep_png = needs_transparency or original_format == 'PNG'
+
+    if img.mode in ('RGBA', 'LA') and not needs_transparency:
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'RGBA':
+            background.paste(img, mask=img.split()[-1])
+        else:  # LA
+            background.paste(img)
+        img = background
+    elif not keep_png and img.mode not in ('RGB', 'L', 'CMYK'):
+        # Palette GIF/WebP and friends cannot be written as JPEG directly
+        img = img.convert('RGB')
+
+    return img, keep_png
+
+def _save_kwargs(keep_png, quality, exif_bytes, pnginfo):
+    save_kwargs = {'optimize': True}
+
+    # Determine output format and apply metadata
+    if keep_png:
+        # Keep as PNG to preserve transparency and PNG-specific metadata
+        save_kwargs.update({
+            'format': 'PNG',
+            'compress_level': 6  # Good compression without quality loss
+        })
+        if pnginfo:
+            save_kwargs['pnginfo'] = pnginfo
+    else:
+        # Save as JPEG with EXIF
+        save_kwargs.update({
+            'format': 'JPEG',
+            'quality': quality
+        })
+        if exif_bytes:
+            save_kwargs['exif'] = exif_bytes
+
+    return save_kwargs
+
+def derivative_dir(image_path):
+    """static/uploads/<stem>.<ext> -> static/derivatives/<stem>"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(DERIVATIVE_FOLDER, stem)
+
+def derivative_widths(source_width, widths=DERIVATIVE_WIDTHS):
+    """Ladder widths for a source, never upscaled; a narrow source tops out at its own width"""
+    ladder = [w for w in sorted(widths) if w <= source_width]
+    if source_width < max(widths) and source_width not in ladder:
+        ladder.append(source_width)
+    return ladder
+
+def write_derivatives(img, dest_dir, widths=DERIVATIVE_WIDTHS, timed=None):
+    """
+    Write <width>.<ext> for every ladder width in every derivative format.
+    Scales down progressively from the largest width, so each step resizes
+    the previous (smaller) result instead of the full image.
+    Files are written into a temp dir that replaces dest_dir at the end.
+    Returns the list of widths written.
+    """
+    timed = timed or StageTimings()
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    with timed('derivative', 'resize'):
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    formats = [ext for ext, _ in MODERN_FORMATS] + [FALLBACK_FORMATS[has_alpha][0]]
+
+    tmp_dir = f"{dest_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    ladder = derivative_widths(img.width, widths)
+    for width in reversed(ladder):
+        if width != img.width:
+            height = max(1, round(img.height * width / img.width))
+            with timed('derivative', 'resize'):
+                img = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        for ext in formats:
+            save_kwargs = {'quality': DERIVATIVE_QUALITY.get(ext, IMAGE_QUALITY)}
+            if ext == 'avif':
+                save_kwargs['speed'] = DERIVATIVE_AVIF_SPEED
+            elif ext == 'webp':
+                save_kwargs['method'] = 4
+            elif ext == 'png':
+                save_kwargs = {'optimize': True, 'compress_level': 6}
+            else:
+                save_kwargs.update({'optimize': True, 'progressive': True})
+            with timed('derivative', 'encode'):
+                img.save(os.path.join(tmp_dir, f"{width}.{ext}"), format=ext.upper(), **save_kwargs)
+
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    os.replace(tmp_dir, dest_dir)
+    return ladder
+
+def create_derivatives(image_path, widths=DERIVATIVE_WIDTHS):
+    """Build the derivative ladder for an already stored upload. Returns the widths, or None on error"""
+    timed = StageTimings()
+    try:
+        with Image.open(image_path) as img:
+            with timed('derivative', 'decode'):
+                _draft(img, (max(widths), img.height))
+                img.load()
+            ladder = write_derivatives(img, derivative_dir(image_path), widths, timed)
+        print(f"✅ Derivatives created: {image_path} {ladder}")
+        return ladder
+    except Exception as e:
+        print(f"❌ Derivative creation error: {e}")
+        return None
+    finally:
+        record_image_timings(timed.timings)
+
+def process_image(source_path, dest_path=None, thumb_path=None, max_size=MAX_IMAGE_SIZE,
+                  thumb_size=THUMBNAIL_SIZE, quality=IMAGE_QUALITY, derivatives_dir=None, raise_errors=False):
+    """
+    Single-decode upload pipeline: open the image once and produce the
+    optimized original (dest_path, default in place), the derivative ladder,
+    the thumbnail and the AI metadata from the same in-memory image.
+    Returns {'ai_metadata': {...}, 'derivatives': [widths] or None,
+    'dhash': compute_dhash() or None, 'palette': format_palette() or None,
+    'lqip': compute_lqip() or None, 'dimensions': describe_dimensions() or None,
+    'timings': StageTimings.timings};
+    format/size in the metadata describe
+    the optimized file. Timings are returned rather than recorded because
+    this usually runs in a job worker process.
+    A failure is logged and the partial results returned, unless
+    raise_errors is set (the job queue, which retries and then fails it).
+    """
+    dest_path = dest_path or source_path
+    tmp_path = f"{dest_path}.tmp"
+    ai_metadata = {}
+    derivatives = None
+    dhash = None
+    palette = None
+    lqip = None
+    dimensions = None
+    timed = StageTimings()
+
+    try:
+        with Image.open(source_path) as img:
+            original_format = img.format
+
+            # Metadata lives in the headers - read it before any pixels are decoded.
+            # Counted as decode: PNG getexif() loads the image to reach chunks after IDAT.
+            with timed('upload', 'decode'):
+                exif_bytes, pnginfo = extract_all_metadata(img)
+                ai_metadata = read_ai_metadata(img)
+                ai_metadata.update({'format': original_format, 'size': f"{img.width}x{img.height}"})
+
+                _draft(img, max_size)
+                img.load()
+            with timed('upload', 'resize'):
+                img, keep_png = _prepare_for_save(img, original_format)
+
+                # Resize if too large; reducing_gap lets Pillow reduce() by an integer
+                # factor first and only run LANCZOS over the last step
+                if img.width > max_size[0] or img.height > max_size[1]:
+                    img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+            save_kwargs = _save_kwargs(keep_png, quality, exif_bytes, pnginfo)
+            with timed('upload', 'encode'):
+                img.save(tmp_path, **save_kwargs)
+            os.replace(tmp_path, dest_path)
+            ai_metadata.update({'format': save_kwargs['format'], 'size': f"{img.width}x{img.height}"})
+            stored_size, file_size = img.size, os.path.getsize(dest_path)
+            print(f"✅ Image optimized: {original_format} → {save_kwargs['format']}, metadata preserved")
+
+            with timed('upload', 'hash'):
+                dhash = compute_dhash(img)
+            with timed('upload', 'palette'):
+                palette = format_palette(extract_palette(img))
+            with timed('upload', 'placeholder'):
+                lqip = compute_lqip(img)
+
+            if derivatives_dir:
+                derivatives = write_derivatives(img, derivatives_dir, timed=timed)
+
+            if thumb_path:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                # Downscale from the optimized pixels already in memory
+                with timed('thumbnail', 'resize'):
+                    img.thumbnail(thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                # Write-then-rename: /thumbnail serves an existing file as immutable
+                with timed('thumbnail', 'encode'):
+                    img.save(f"{thumb_path}.tmp", **_save_kwargs(keep_png, 85, exif_bytes, pnginfo))
+                os.replace(f"{thumb_path}.tmp", thumb_path)
+                print(f"✅ Thumbnail created with metadata: {thumb_path}")
+            dimensions = describe_dimensions(stored_size, save_kwargs['format'], file_size,
+                                             img.size if thumb_path else fit_size(stored_size, thumb_size))
+
+    except Exception as e:
+        print(f"❌ Image processing error: {e}")
+        for path in (tmp_path, f"{thumb_path}.tmp" if thumb_path else None):
+            if path and os.path.exists(path):
+                os.remove(path)
+        if raise_errors:
+            raise
+
+    return {'ai_metadata': ai_metadata, 'derivatives': derivatives, 'dhash': dhash, 'palette': palette,
+            'lqip': lqip, 'dimensions': dimensions, 'timings': timed.timings}
+
 def optimize_image_with_metadata(file_stream, max_size=MAX_IMAGE_SIZE, quality=IMAGE_QUALITY):
     """
     Optimized version that properly preserves ALL metadata
@@ -58,17 +499,8 @@ def optimize_image_with_metadata(file_stream, max_size=MAX_IMAGE_SIZE, quality=I
         # Extract ALL metadata BEFORE any modifications
         exif_bytes, pnginfo = extract_all_metadata(img)
         
-        # Handle transparency properly
-        needs_transparency = img.mode in ('RGBA', 'LA', 'P') and img.format == 'PNG'
-        
-        if img.mode in ('RGBA', 'LA') and not needs_transparency:
-            # Only convert to RGB if not PNG or if user explicitly wants JPEG
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'RGBA':
-                background.paste(img, mask=img.split()[-1])
-            else:  # LA
-                background.paste(img)
-            img = background
+        _draft(img, max_size)
+        img, keep_png = _prepare_for_save(img, original_format)
         
         # Resize if too large
         if img.width > max_size[0] or img.height > max_size[1]:
@@ -76,25 +508,7 @@ def optimize_image_with_metadata(file_stream, max_size=MAX_IMAGE_SIZE, quality=I
         
         # Prepare output
         output = io.BytesIO()
-        save_kwargs = {'optimize': True}
-        
-        # Determine output format and apply metadata
-        if needs_transparency or original_format == 'PNG':
-            # Keep as PNG to preserve transparency and PNG-specific metadata
-            save_kwargs.update({
-                'format': 'PNG',
-                'compress_level': 6  # Good compression without quality loss
-            })
-            if pnginfo:
-                save_kwargs['pnginfo'] = pnginfo
-        else:
-            # Save as JPEG with EXIF
-            save_kwargs.update({
-                'format': 'JPEG',
-                'quality': quality
-            })
-            if exif_bytes:
-                save_kwargs['exif'] = exif_bytes
+        save_kwargs = _save_kwargs(keep_png, quality, exif_bytes, pnginfo)
         
         img.save(output, **save_kwargs)
         output.seek(0)
@@ -108,7 +522,7 @@ def optimize_image_with_metadata(file_stream, max_size=MAX_IMAGE_SIZE, quality=I
         file_stream.seek(original_position)
         return file_stream
 
-def create_thumbnail_with_metadata(original_path, thumb_size=(400, 400)):
+def create_thumbnail_with_metadata(original_path, thumb_size=THUMBNAIL_SIZE, overwrite=False):
     """
     Create thumbnail preserving ALL metadata
     """
@@ -118,48 +532,32 @@ def create_thumbnail_with_metadata(original_path, thumb_size=(400, 400)):
         os.makedirs(os.path.dirname(thumb_dir), exist_ok=True)
         
         # Skip if thumbnail exists
-        if os.path.exists(thumb_dir):
+        if os.path.exists(thumb_dir) and not overwrite:
             return thumb_dir
             
+        timed = StageTimings()
         img = Image.open(original_path)
         original_format = img.format
         
-        # Extract metadata from original
-        exif_bytes, pnginfo = extract_all_metadata(img)
-        
-        # Handle transparency
-        needs_transparency = img.mode in ('RGBA', 'LA', 'P') and original_format == 'PNG'
-        
-        if img.mode in ('RGBA', 'LA') and not needs_transparency:
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'RGBA':
-                background.paste(img, mask=img.split()[-1])
-            else:
-                background.paste(img)
-            img = background
+        with timed('thumbnail', 'decode'):
+            # Extract metadata from original
+            exif_bytes, pnginfo = extract_all_metadata(img)
+            
+            _draft(img, thumb_size)
+            img.load()
+        with timed('thumbnail', 'resize'):
+            img, keep_png = _prepare_for_save(img, original_format)
             
-        # Create thumbnail
-        img.thumbnail(thumb_size, Image.Resampling.LANCZOS)
+            # Create thumbnail
+            img.thumbnail(thumb_size, Image.Resampling.LANCZOS)
         
         # Save with metadata
-        save_kwargs = {'optimize': True}
-        
-        if needs_transparency or original_format == 'PNG':
-            save_kwargs.update({
-                'format': 'PNG',
-                'compress_level': 6
-            })
-            if pnginfo:
-                save_kwargs['pnginfo'] = pnginfo
-        else:
-            save_kwargs.update({
-                'format': 'JPEG',
-                'quality': 85
-            })
-            if exif_bytes:
-                save_kwargs['exif'] = exif_bytes
-        
-        img.save(thumb_dir, **save_kwargs)
+        # Write-then-rename so an interrupted run never leaves a half thumbnail
+        tmp_path = f"{thumb_dir}.tmp"
+        with timed('thumbnail', 'encode'):
+            img.save(tmp_path, **_save_kwargs(keep_png, 85, exif_bytes, pnginfo))
+        os.replace(tmp_path, thumb_dir)
+        record_image_timings(timed.timings)
         print(f"✅ Thumbnail created with metadata: {thumb_dir}")
         
         return thumb_dir
@@ -169,7 +567,7 @@ def create_thumbnail_with_metadata(original_path, thumb_size=(400, 400)):
         return None
 
 def ensure_thumbnails_exist():
-    """Generate thumbnails for existing images"""
+    """Generate thumbnails for existing images (serial; see backfill.py for the parallel version)"""
     import glob
     uploads = glob.glob('static/uploads/*')
     
@@ -182,6 +580,6 @@ def optimize_image(file_stream, max_size=MAX_IMAGE_SIZE, quality=IMAGE_QUALITY):
     """Backward compatibility - redirects to optimize_image_with_metadata"""
     return optimize_image_with_metadata(file_stream, max_size, quality)
 
-def create_thumbnail(original_path, thumb_size=(400, 400)):
+def create_thumbnail(original_path, thumb_size=THUMBNAIL_SIZE):
     """Backward compatibility - redirects to create_thumbnail_with_metadata"""
     return create_thumbnail_with_metadata(original_path, thumb_size)
\ No newline at end of file
@@ -0,0 +1,44 @@
+import re
+import tempfile
+from flask import Request
+from config import UPLOAD_SPOOL_SIZE
+
+# Leading bytes -> stored extension
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+SNIFF_BYTES = 1024
+
+class SpooledRequest(Request):
+    """
+    Request whose multipart file parts are written to a SpooledTemporaryFile:
+    up to UPLOAD_SPOOL_SIZE in memory, the rest on disk. Together with
+    MAX_CONTENT_LENGTH (enforced by werkzeug while the body is read) this
+    bounds the memory a single upload can take.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE, mode='rb+')
+
+def sniff_image_format(stream):
+    """
+    Detect an image format from its leading bytes, ignoring the filename.
+    Returns 'png', 'jpg', 'gif', 'webp', 'svg' or None. Rewinds the stream.
+    """
+    stream.seek(0)
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+
+    for magic, ext in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    # SVG is text: optional BOM/XML prolog/doctype/comments, then an <svg> element
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if text.startswith(b'<') and re.search(rb'<svg[\s>]', head):
+        return 'svg'
+    return None
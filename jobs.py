@@ -0,0 +1,346 @@
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from config import JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_LEASE_SECONDS, JOB_POLL_INTERVAL
+from db import get_db_connection
+from gallery import format_derivatives, store_dimensions
+from revision import bump_revision
+from metrics import jobs_finished, job_duration, record_image_timings
+
+# Job kinds
+PROCESS_UPLOAD = 'process_upload'
+
+def process_upload(image_path):
+    """
+    Runs in a worker process: optimize the raw upload in place, create its
+    thumbnail and extract AI metadata. Never touches SQLite - the result is
+    written back by the dispatcher in the web process.
+    """
+    from image_utils import process_image, derivative_dir, image_dimensions
+
+    if image_path.lower().endswith('.svg'):
+        return {'ai_metadata': {}, 'derivatives': None, 'dhash': None, 'palette': None, 'lqip': None,
+                'dimensions': image_dimensions(image_path)}
+
+    thumb_path = image_path.replace('/uploads/', '/thumbnails/')
+    return process_image(image_path, thumb_path=thumb_path, derivatives_dir=derivative_dir(image_path),
+                         raise_errors=True)
+
+JOB_HANDLERS = {
+    PROCESS_UPLOAD: lambda payload: process_upload(payload['image_path']),
+}
+
+def run_job(kind, payload):
+    return JOB_HANDLERS[kind](payload)
+
+def enqueue_job(conn, kind, payload, artwork_id=None):
+    """Add a job to the queue; caller commits, then calls job_queue.notify()"""
+    cursor = conn.execute(
+        'INSERT INTO jobs (artwork_id, kind, payload) VALUES (?, ?, ?)',
+        (artwork_id, kind, json.dumps(payload))
+    )
+    return cursor.lastrowid
+
+def get_job(conn, job_id):
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+def complete_upload_job(conn, job, result):
+    """
+    Apply a finished process_upload job to every artwork still pointing at
+    the processed image (duplicates share one blob); artworks that moved on
+    to another image are left alone
+    """
+    from api import store_ai_metadata
+
+    image_path = job['payload']['image_path']
+    artworks = conn.execute('SELECT id FROM artworks WHERE image_path = ?', (image_path,)).fetchall()
+    for artwork in artworks:
+        store_ai_metadata(conn, artwork['id'], result['ai_metadata'])
+    conn.execute(
+        "UPDATE artworks SET status = 'ready', derivatives = ?, dhash = COALESCE(?, dhash), "
+        "palette = COALESCE(?, palette), lqip = COALESCE(?, lqip) WHERE image_path = ?",
+        (format_derivatives(result.get('derivatives')), result.get('dhash'), result.get('palette'),
+         result.get('lqip'), image_path)
+    )
+    if result.get('dimensions'):
+        store_dimensions(conn, image_path, result['dimensions'])
+
+JOB_COMPLETERS = {
+    PROCESS_UPLOAD: complete_upload_job,
+}
+
+def requeue_failed_uploads(conn):
+    """
+    Give failed upload jobs whose image was never processed a fresh set of
+    attempts and mark their artworks 'processing' again. Run when the
+    dispatcher starts, so uploads that failed for reasons outside the image
+    (a dying pool, a full disk) are retried after a restart. Caller commits.
+    Returns the number of jobs requeued.
+    """
+    rows = conn.execute(
+        """
+        UPDATE jobs SET status = 'queued', attempts = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'failed' AND kind = ? AND EXISTS (
+            SELECT 1 FROM artworks
+            WHERE image_path = json_extract(jobs.payload, '$.image_path') AND status = 'failed'
+        )
+        RETURNING payload
+        """,
+        (PROCESS_UPLOAD,)
+    ).fetchall()
+    for row in rows:
+        conn.execute(
+            "UPDATE artworks SET status = 'processing' WHERE image_path = ? AND status = 'failed'",
+            (json.loads(row['payload'])['image_path'],)
+        )
+    return len(rows)
+
+class JobQueue:
+    """
+    Dispatcher thread that claims queued jobs from SQLite and runs them on a
+    bounded process pool. Jobs survive restarts: anything still 'running'
+    after JOB_LEASE_SECONDS (its process died) is put back in the queue, and
+    a job the pool refused to take is requeued without using up an attempt.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._atexit_registered = False
+        # At most one job per worker in flight, the rest wait in SQLite
+        self._slots = threading.BoundedSemaphore(workers)
+        # Jobs this process has finished; waited on by wait_for_progress()
+        self._finished = threading.Condition()
+        self.finished_total = 0
+
+    def start(self):
+        # Pool workers import this module too; only the web process dispatches
+        if multiprocessing.parent_process() is not None:
+            return
+        with self._lock:
+            if self._stop.is_set():
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+                self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=JOB_POLL_INTERVAL):
+        """
+        Stop claiming jobs and shut the pool down, letting running jobs
+        finish. Registered with atexit: the daemon dispatcher would otherwise
+        keep claiming jobs that the pool refuses during interpreter shutdown.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._stop.is_set():
+                raise RuntimeError('Job queue is stopped')
+            if self._pool is None:
+                # spawn: never fork a process that holds threads and SQLite handles
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _discard_pool(self):
+        """A worker died hard (OOM, segfault in a decoder): start a fresh pool next time"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def notify(self):
+        """Wake the dispatcher after enqueue_job() was committed"""
+        self.start()
+        self._wakeup.set()
+
+    def wait_for_progress(self, seen, timeout):
+        """
+        Block until this process finishes another job after finished_total
+        was `seen`, or for `timeout` seconds. Jobs finished by other
+        processes only show up once the timeout expires.
+        """
+        with self._finished:
+            self._finished.wait_for(lambda: self.finished_total != seen, timeout)
+
+    def _notify_finished(self):
+        with self._finished:
+            self.finished_total += 1
+            self._finished.notify_all()
+
+    def _claim(self, conn):
+        conn.execute(
+            f"""
+            UPDATE jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+              AND updated_at < datetime('now', '-{int(JOB_LEASE_SECONDS)} seconds')
+            """
+        )
+        row = conn.execute(
+            """
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+            RETURNING id, kind, payload
+            """
+        ).fetchone()
+        conn.commit()
+        return row
+
+    def _requeue_failed_uploads(self):
+        conn = get_db_connection()
+        try:
+            count = requeue_failed_uploads(conn)
+            conn.commit()
+        except Exception as e:
+            print(f"❌ Requeueing failed uploads failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            return
+        if count:
+            bump_revision()
+            print(f"⏳ Requeued {count} failed upload job(s)")
+
+    def _run(self):
+        self._requeue_failed_uploads()
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=JOB_POLL_INTERVAL):
+                continue
+            try:
+                job = self._claim(get_db_connection())
+            except Exception as e:
+                print(f"❌ Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            try:
+                future = self._get_pool().submit(run_job, job['kind'], json.loads(job['payload']))
+            except RuntimeError as e:
+                # Shutting down or a broken pool (BrokenProcessPool is a
+                # RuntimeError): not the job's fault, so no attempt is used
+                self._discard_pool()
+                self._requeue_refused(job['id'], e)
+                self._stop.wait(JOB_POLL_INTERVAL)
+                continue
+            except Exception as e:
+                self._discard_pool()
+                self._finish_failed_submit(job['id'], e)
+                continue
+            future.add_done_callback(partial(self._finish, job['id'], time.perf_counter()))
+
+    def _requeue(self, conn, job_id):
+        """Put a claimed job back in the queue and give back the attempt the claim counted"""
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (job_id,)
+        )
+
+    def _requeue_refused(self, job_id, error):
+        conn = get_db_connection()
+        try:
+            self._requeue(conn, job_id)
+            conn.commit()
+            print(f"⏳ Job {job_id} put back in the queue: {error}")
+        except Exception as e:
+            print(f"❌ Job {job_id} requeue failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            self._slots.release()
+
+    def _finish_failed_submit(self, job_id, error):
+        conn = get_db_connection()
+        try:
+            job = get_job(conn, job_id)
+            self._fail(conn, job, error)
+            jobs_finished.inc(job['kind'], 'error')
+            conn.commit()
+            bump_revision()
+        finally:
+            self._slots.release()
+            self._notify_finished()
+
+    def _finish(self, job_id, submitted, future):
+        conn = get_db_connection()
+        try:
+            job = get_job(conn, job_id)
+            if future.cancelled():
+                # stop() cancelled it before a worker picked it up
+                self._requeue(conn, job_id)
+                conn.commit()
+                return
+            job_duration.observe(time.perf_counter() - submitted, job['kind'])
+            try:
+                result = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._discard_pool()
+                self._fail(conn, job, e)
+                jobs_finished.inc(job['kind'], 'error')
+            else:
+                # Pillow stage timings measured in the worker process
+                record_image_timings(result.get('timings'))
+                jobs_finished.inc(job['kind'], 'done')
+                JOB_COMPLETERS[job['kind']](conn, job, result)
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (json.dumps(result), job_id)
+                )
+                print(f"✅ Job {job_id} ({job['kind']}) done")
+            conn.commit()
+            bump_revision()
+        except Exception as e:
+            print(f"❌ Job {job_id} bookkeeping failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+            self._notify_finished()
+
+    def _fail(self, conn, job, error):
+        retry = job['attempts'] < JOB_MAX_ATTEMPTS
+        conn.execute(
+            'UPDATE jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            ('queued' if retry else 'failed', str(error), job['id'])
+        )
+        if not retry and job['artwork_id'] is not None:
+            conn.execute("UPDATE artworks SET status = 'failed' WHERE id = ?", (job['artwork_id'],))
+            # Duplicates that adopted this upload while it was processing
+            conn.execute(
+                "UPDATE artworks SET status = 'failed' WHERE image_path = ? AND status = 'processing'",
+                (job['payload'].get('image_path'),)
+            )
+        print(f"❌ Job {job['id']} ({job['kind']}) failed (attempt {job['attempts']}): {error}")
+
+job_queue = JobQueue()
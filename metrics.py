@@ -0,0 +1,211 @@
+"""
+In-process metrics, exposed at /api/metrics in the Prometheus text format.
+
+Recorded per web process: request counts, latency and response size per
+route, SQLite statement time per kind (SELECT, INSERT, ...), Pillow
+decode/resize/encode time per image pipeline, job outcomes, and the
+response cache counters. Image work that runs in job worker processes is
+timed there and reported back in the job result (see StageTimings).
+
+Each Gunicorn worker keeps its own numbers; a scrape sees one worker.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import request, g
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+IMAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+SQL_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA', 'BEGIN', 'CREATE', 'ALTER'}
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_number(total)}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions under a lock"""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (not cumulative) + overflow, then the sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((values, list(counts), total) for values, (counts, total) in self._series.items())
+        for values, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{_format_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'gallery_http_requests_total', 'HTTP requests by route, method and status', ('method', 'route', 'status'))
+http_latency = registry.histogram(
+    'gallery_http_request_duration_seconds', 'Time spent handling a request', ('method', 'route'))
+http_response_size = registry.histogram(
+    'gallery_http_response_size_bytes', 'Response body size', ('method', 'route'), SIZE_BUCKETS)
+sql_duration = registry.histogram(
+    'gallery_sqlite_statement_duration_seconds', 'SQLite statement execution up to the first row',
+    ('statement',), QUERY_BUCKETS)
+image_stage_duration = registry.histogram(
+    'gallery_image_stage_duration_seconds', 'Pillow work per pipeline (upload, thumbnail, derivative) and stage',
+    ('pipeline', 'stage'), IMAGE_BUCKETS)
+jobs_finished = registry.counter(
+    'gallery_jobs_total', 'Background jobs finished by kind and outcome', ('kind', 'outcome'))
+job_duration = registry.histogram(
+    'gallery_job_duration_seconds', 'Job time from submission to the pool until its result is back',
+    ('kind',), IMAGE_BUCKETS)
+
+def _response_cache_metrics():
+    from response_cache import response_cache
+
+    stats = response_cache.stats()
+    lines = []
+    for key, kind, help in (
+        ('hits', 'counter', 'Response cache hits'),
+        ('misses', 'counter', 'Response cache misses'),
+        ('evictions', 'counter', 'Entries evicted to stay within the size bounds'),
+        ('invalidations', 'counter', 'Cache flushes caused by a new gallery revision'),
+        ('entries', 'gauge', 'Cached responses'),
+        ('bytes', 'gauge', 'Bytes held by cached responses'),
+    ):
+        name = f"gallery_response_cache_{key}" + ('_total' if kind == 'counter' else '')
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {stats[key]}"]
+    return lines
+
+registry.collectors.append(_response_cache_metrics)
+
+@lru_cache(maxsize=1024)
+def _statement_kind(sql):
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    return verb if verb in SQL_KINDS else 'OTHER'
+
+def observe_query(sql, seconds):
+    sql_duration.observe(seconds, _statement_kind(sql))
+
+class StageTimings:
+    """
+    Accumulates Pillow stage durations as {pipeline: {stage: seconds}}.
+    Plain dicts, so worker processes can return them in a job result and
+    the web process records them with record_image_timings().
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def __call__(self, pipeline, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self.timings.setdefault(pipeline, {})
+            stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+def record_image_timings(timings):
+    for pipeline, stages in (timings or {}).items():
+        for stage, seconds in stages.items():
+            image_stage_duration.observe(seconds, pipeline, stage)
+
+def init_app(app):
+    """Time every request; register this before other before_request hooks"""
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_latency.observe(time.perf_counter() - started, request.method, route)
+        http_requests.inc(request.method, route, str(response.status_code))
+        # Streamed bodies have no length yet; count what is known up front
+        size = response.content_length
+        if size is not None:
+            http_response_size.observe(size, request.method, route)
+        return response
+
+    @app.route('/api/metrics')
+    def prometheus_metrics():
+        return app.response_class(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,77 @@
+"""
+Service worker for the gallery: precached app shell, runtime image and API caches.
+
+The worker script is templates/sw.js, served from /sw.js so its scope is the
+whole site. Its precache list comes from /api/precache-manifest:
+
+- every fingerprinted bundle and module from the asset build (assets.py),
+  which are immutable, so their URL is their revision;
+- the page itself and the other unhashed files, with a content hash as the
+  revision.
+
+The manifest version (a hash of all entries) is baked into /sw.js, so any
+change to the shell makes the browser install the new worker, which then
+drops the caches of the old one.
+"""
+import json
+import hashlib
+from flask import request, jsonify, render_template, url_for
+from assets import BUNDLES, MODULE_ENTRIES, asset_urls, modulepreload_urls
+from config import ASSET_DIST_FOLDER, SW_IMAGE_CACHE_ENTRIES, SW_API_CACHE_ENTRIES
+
+# Unhashed shell entries: URL endpoint (+ values) -> file whose content is its revision
+SHELL_FILES = [
+    (('index', {}), 'templates/index.html'),
+    (('static', {'filename': 'favicon.png'}), 'static/favicon.png'),
+]
+
+_precache = None
+
+def _file_revision(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def precache_manifest():
+    """{'version', 'entries': [{'url', 'revision'}]}; revision is None for fingerprinted URLs"""
+    global _precache
+
+    # Assets are only rebuilt at startup, so this holds for the life of the process
+    if _precache is None:
+        urls = []
+        for name in [*BUNDLES, *MODULE_ENTRIES]:
+            urls += asset_urls(name)
+        for entry in MODULE_ENTRIES:
+            urls += modulepreload_urls(entry)
+        # Unbuilt sources are not fingerprinted: fall back to content hashes for them too
+        dist = f"/{ASSET_DIST_FOLDER}/"
+        entries = [{'url': url, 'revision': None if url.startswith(dist) else _file_revision(url.lstrip('/'))}
+                   for url in dict.fromkeys(urls)]
+        for (endpoint, values), path in SHELL_FILES:
+            entries.append({'url': url_for(endpoint, **values), 'revision': _file_revision(path)})
+        version = hashlib.sha256(json.dumps(entries, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        _precache = {'version': version, 'entries': entries}
+    return _precache
+
+def init_app(app):
+    @app.route('/sw.js')
+    def service_worker():
+        """Served from the root so the worker's scope covers every page and API call"""
+        response = app.response_class(
+            render_template('sw.js', version=precache_manifest()['version'],
+                            image_cache_entries=SW_IMAGE_CACHE_ENTRIES,
+                            api_cache_entries=SW_API_CACHE_ENTRIES),
+            mimetype='text/javascript')
+        # Browsers check for worker updates themselves; never let an HTTP cache delay that
+        response.cache_control.no_cache = True
+        return response
+
+    @app.route('/api/precache-manifest')
+    def get_precache_manifest():
+        manifest = precache_manifest()
+        response = jsonify(manifest)
+        response.set_etag(manifest['version'])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
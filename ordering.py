@@ -0,0 +1,190 @@
+import threading
+import multiprocessing
+from config import POSITION_STEP, MIN_POSITION_GAP, REBALANCE_INTERVAL
+from db import get_db_connection
+from revision import bump_revision
+
+# Gaps below this are renumbered in the background, well before moves run out of room
+TIGHT_GAP = MIN_POSITION_GAP * 1024
+
+class InvalidMove(ValueError):
+    pass
+
+def next_position(conn):
+    """Position for a newly added artwork (top of the gallery)"""
+    max_pos = conn.execute('SELECT MAX(position) FROM artworks').fetchone()[0] or 0
+    return max_pos + POSITION_STEP
+
+def next_positions(conn, count):
+    """Positions for `count` new artworks added together, the first one on top"""
+    max_pos = conn.execute('SELECT MAX(position) FROM artworks').fetchone()[0] or 0
+    return [max_pos + POSITION_STEP * (count - i) for i in range(count)]
+
+def _as_id(value):
+    """An int or the digit string the templates send (dataset.id); None for no id"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise InvalidMove(f'Invalid artwork id: {value!r}')
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidMove(f'Invalid artwork id: {value!r}')
+
+def _position_of(conn, artwork_id):
+    row = conn.execute('SELECT position FROM artworks WHERE id = ?', (artwork_id,)).fetchone()
+    if row is None:
+        raise InvalidMove(f'Artwork {artwork_id} not found')
+    return row['position']
+
+def _adjacent_position(conn, artwork_id, position, below):
+    """
+    Position of the artwork displayed right after (below) or right before
+    `position` in the whole gallery, ignoring artwork_id; None at the end
+    """
+    if below:
+        sql = 'SELECT MAX(position) FROM artworks WHERE position < ? AND id != ?'
+    else:
+        sql = 'SELECT MIN(position) FROM artworks WHERE position > ? AND id != ?'
+    return conn.execute(sql, (position, artwork_id)).fetchone()[0]
+
+def _end_position(conn, artwork_id, to):
+    """Position past every other artwork: above the first for 'top', below the last for 'bottom'"""
+    if to == 'top':
+        top = conn.execute('SELECT MAX(position) FROM artworks WHERE id != ?', (artwork_id,)).fetchone()[0]
+        return (top or 0) + POSITION_STEP
+    bottom = conn.execute('SELECT MIN(position) FROM artworks WHERE id != ?', (artwork_id,)).fetchone()[0]
+    return (bottom or 0) - POSITION_STEP
+
+def _position_between(before_pos, after_pos):
+    """
+    Gallery is shown by position DESC: the neighbour displayed before the
+    moved tile has the higher position. Returns None when the gap is used up.
+    """
+    if before_pos is None and after_pos is None:
+        return None
+    if before_pos is None:
+        return after_pos + POSITION_STEP
+    if after_pos is None:
+        return before_pos - POSITION_STEP
+    if before_pos - after_pos < 2 * MIN_POSITION_GAP:
+        return None
+    return (before_pos + after_pos) / 2
+
+def move_artwork(conn, artwork_id, before_id=None, after_id=None, to=None):
+    """
+    Place one artwork between two neighbours by writing only its own row.
+    The client only sees the pages it has loaded, so a missing neighbour is
+    looked up in the database: a drop on the last loaded tile lands above the
+    next unloaded one. to='top' or 'bottom' moves past every other artwork.
+    Falls back to a full renumbering when the neighbours have no room left.
+    Returns (new_position, tight) where tight means the gap is getting small.
+    Caller commits.
+    """
+    artwork_id, before_id, after_id = _as_id(artwork_id), _as_id(before_id), _as_id(after_id)
+    if artwork_id is None:
+        raise InvalidMove('A move needs an artwork id')
+    if to is not None:
+        if to not in ('top', 'bottom'):
+            raise InvalidMove(f'Unknown move target: {to!r}')
+        _position_of(conn, artwork_id)
+        new_pos = _end_position(conn, artwork_id, to)
+        conn.execute('UPDATE artworks SET position = ? WHERE id = ?', (new_pos, artwork_id))
+        return new_pos, False
+    if before_id is None and after_id is None:
+        raise InvalidMove('A move needs before_id or after_id')
+    if artwork_id in (before_id, after_id):
+        raise InvalidMove('An artwork cannot be its own neighbour')
+    _position_of(conn, artwork_id)
+
+    def neighbour_positions():
+        before_pos = _position_of(conn, before_id) if before_id is not None else None
+        after_pos = _position_of(conn, after_id) if after_id is not None else None
+        if before_pos is not None and after_pos is not None and before_pos < after_pos:
+            raise InvalidMove('before_id must be displayed before after_id')
+        if after_pos is None:
+            after_pos = _adjacent_position(conn, artwork_id, before_pos, below=True)
+        elif before_pos is None:
+            before_pos = _adjacent_position(conn, artwork_id, after_pos, below=False)
+        return before_pos, after_pos
+
+    new_pos = _position_between(*neighbour_positions())
+    if new_pos is None:
+        rebalance_positions(conn)
+        new_pos = _position_between(*neighbour_positions())
+
+    conn.execute('UPDATE artworks SET position = ? WHERE id = ?', (new_pos, artwork_id))
+
+    before_pos, after_pos = neighbour_positions()
+    gaps = [abs(new_pos - p) for p in (before_pos, after_pos) if p is not None]
+    tight = min(gaps) < TIGHT_GAP
+    return new_pos, tight
+
+def rebalance_positions(conn):
+    """
+    Renumber every artwork POSITION_STEP apart, keeping the displayed order.
+    One executemany in the caller's transaction; caller commits.
+    """
+    ids = [row['id'] for row in conn.execute('SELECT id FROM artworks ORDER BY position DESC, id DESC')]
+    total = len(ids)
+    conn.executemany(
+        'UPDATE artworks SET position = ? WHERE id = ?',
+        ((float(total - i) * POSITION_STEP, artwork_id) for i, artwork_id in enumerate(ids))
+    )
+    print(f"🔢 Rebalanced positions for {total} artworks")
+    return total
+
+def smallest_gap(conn):
+    row = conn.execute('''
+        SELECT MIN(gap) FROM (
+            SELECT position - LEAD(position) OVER (ORDER BY position DESC, id DESC) AS gap
+            FROM artworks
+        )
+    ''').fetchone()
+    return row[0]
+
+class Rebalancer:
+    """
+    Background thread that renumbers positions once the smallest gap drops
+    below TIGHT_GAP. Woken early by request() after a tight move, otherwise
+    checks every REBALANCE_INTERVAL seconds.
+    """
+
+    def __init__(self, interval=REBALANCE_INTERVAL):
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Spawned worker processes import this module too; only the web process rebalances
+        if multiprocessing.parent_process() is not None:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='position-rebalancer', daemon=True)
+                self._thread.start()
+
+    def request(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                conn = get_db_connection()
+                gap = smallest_gap(conn)
+                if gap is not None and gap < TIGHT_GAP:
+                    conn.execute('BEGIN IMMEDIATE')
+                    rebalance_positions(conn)
+                    conn.commit()
+                    bump_revision()
+            except Exception as e:
+                print(f"❌ Position rebalance failed: {e}")
+                conn = get_db_connection()
+                if conn.in_transaction:
+                    conn.rollback()
+
+rebalancer = Rebalancer()
@@ -0,0 +1,175 @@
+"""
+Dominant colours per artwork and the colour index behind ?color=.
+
+extract_palette() shrinks the image to PALETTE_SAMPLE_SIZE, seeds
+PALETTE_COLORS clusters with Pillow's median cut and, when NumPy is
+available, refines them with a few rounds of k-means. The result is stored
+as JSON in artworks.palette, each colour with its share of the image, its
+CIELAB value and its Lab cell (PALETTE_BUCKET_SIZE units per edge). Triggers
+in db.py copy them into artwork_colors. A colour query looks up the cells
+near the requested colour in the index, keeps the colours that really are
+within COLOR_MATCH_DISTANCE, and never touches an image.
+"""
+import re
+import json
+import math
+from PIL import Image, ImageColor
+from config import (PALETTE_COLORS, PALETTE_SAMPLE_SIZE, PALETTE_BUCKET_SIZE,
+                    COLOR_MATCH_DISTANCE, COLOR_MIN_SHARE)
+
+try:
+    import numpy as np
+except ImportError:     # optional: median cut only
+    np = None
+
+KMEANS_ITERATIONS = 10
+MIN_SHARE = 0.01        # smaller clusters are mostly edge blends, not colours of the image
+# Cell coordinates are packed 6 bits each; a* and b* are offset to be non-negative
+_BUCKET_BITS = 6
+_AB_OFFSET = 128
+
+class InvalidColor(ValueError):
+    pass
+
+def rgb_to_lab(rgb):
+    """sRGB (0-255) -> CIELAB (D65)"""
+    def linear(c):
+        c /= 255.0
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+    r, g, b = (linear(float(c)) for c in rgb)
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883
+
+    def f(t):
+        return t ** (1 / 3) if t > 0.008856 else 7.787 * t + 16 / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+def _cell(lab, size=PALETTE_BUCKET_SIZE):
+    l, a, b = lab
+    return (math.floor(l / size), math.floor((a + _AB_OFFSET) / size), math.floor((b + _AB_OFFSET) / size))
+
+def _pack(cell):
+    l, a, b = cell
+    return (l << 2 * _BUCKET_BITS) | (a << _BUCKET_BITS) | b
+
+def lab_bucket(lab, size=PALETTE_BUCKET_SIZE):
+    """Index cell of a Lab colour (artwork_colors.bucket)"""
+    return _pack(_cell(lab, size))
+
+def _sample(img, size=PALETTE_SAMPLE_SIZE):
+    """The image as a small RGB picture, transparency flattened onto white"""
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('P', 'PA') else 'RGB')
+    small = img.resize((min(size, img.width), min(size, img.height)), Image.Resampling.BOX)
+    if small.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', small.size, (255, 255, 255))
+        background.paste(small.convert('RGBA'), mask=small.getchannel('A'))
+        return background
+    return small.convert('RGB')
+
+def _median_cut(small, colors):
+    """[(rgb, pixel count)] from Pillow's median cut, most common first"""
+    quantized = small.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    flat = quantized.getpalette()
+    counts = sorted(quantized.getcolors(colors), reverse=True)
+    return [(tuple(flat[i * 3:i * 3 + 3]), count) for count, i in counts]
+
+def _kmeans(small, seeds):
+    """Lloyd's k-means over the sample pixels, starting from the median-cut colours"""
+    pixels = np.asarray(small, dtype=np.float32).reshape(-1, 3)
+    centroids = np.array([rgb for rgb, _ in seeds], dtype=np.float32)
+    for _ in range(KMEANS_ITERATIONS):
+        labels = ((pixels[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centroids))
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=len(centroids)) for c in range(3)], axis=1)
+        # An emptied cluster keeps its colour and drops out below
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+        converged = np.abs(moved - centroids).max() < 0.5
+        centroids = moved.astype(np.float32)
+        if converged:
+            break
+    labels = ((pixels[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    counts = np.bincount(labels, minlength=len(centroids))
+    return sorted(((tuple(int(round(c)) for c in centroid), int(count))
+                   for centroid, count in zip(centroids.tolist(), counts.tolist()) if count),
+                  key=lambda entry: -entry[1])
+
+def extract_palette(img, colors=PALETTE_COLORS):
+    """[{'color': '#rrggbb', 'share', 'lab', 'bucket'}] of the dominant colours, largest share first"""
+    small = _sample(img)
+    clusters = _median_cut(small, colors)
+    if np is not None and len(clusters) > 1:
+        clusters = _kmeans(small, clusters)
+    total = sum(count for _, count in clusters)
+    palette = []
+    for rgb, count in clusters:
+        if count / total < MIN_SHARE:
+            continue
+        lab = rgb_to_lab(rgb)
+        palette.append({
+            'color': '#{:02x}{:02x}{:02x}'.format(*rgb),
+            'share': round(count / total, 3),
+            'lab': [round(c, 2) for c in lab],
+            'bucket': lab_bucket(lab),
+        })
+    return palette
+
+def format_palette(palette):
+    """extract_palette() result -> artworks.palette column value"""
+    return json.dumps(palette, separators=(',', ':')) if palette else None
+
+def parse_palette(value):
+    """artworks.palette column value -> [{'color', 'share'}] for templates/JSON"""
+    if not value:
+        return []
+    return [{'color': entry['color'], 'share': entry['share']} for entry in json.loads(value)]
+
+def parse_color(text):
+    """CSS colour name or hex (with or without '#') -> RGB. Raises InvalidColor"""
+    text = text.strip()
+    if re.fullmatch(r'[0-9a-fA-F]{3}|[0-9a-fA-F]{6}', text):
+        text = f'#{text}'
+    try:
+        return ImageColor.getrgb(text)[:3]
+    except ValueError:
+        raise InvalidColor(f'Unknown color: {text}')
+
+def color_buckets(rgb, distance=COLOR_MATCH_DISTANCE, size=PALETTE_BUCKET_SIZE):
+    """Every index cell with a point within `distance` (ΔE76) of the colour"""
+    lab = rgb_to_lab(rgb)
+    lows = _cell([c - distance for c in lab], size)
+    highs = _cell([c + distance for c in lab], size)
+    offsets = (0, _AB_OFFSET, _AB_OFFSET)
+    buckets = []
+    for l in range(max(lows[0], 0), highs[0] + 1):
+        for a in range(max(lows[1], 0), highs[1] + 1):
+            for b in range(max(lows[2], 0), highs[2] + 1):
+                # Squared distance from the colour to the nearest point of this cell
+                gap = 0.0
+                for index, value, offset in zip((l, a, b), lab, offsets):
+                    low = index * size - offset
+                    nearest = min(max(value, low), low + size)
+                    gap += (value - nearest) ** 2
+                if gap <= distance * distance:
+                    buckets.append(_pack((l, a, b)))
+    return buckets
+
+def color_filter_sql(color, min_share=COLOR_MIN_SHARE):
+    """
+    (sql, params) restricting artworks.id to those whose palette colours
+    within COLOR_MATCH_DISTANCE (ΔE76) of `color` cover at least min_share
+    of the image. The cells narrow the index scan, the exact distance
+    decides. Raises InvalidColor
+    """
+    rgb = parse_color(color)
+    l, a, b = rgb_to_lab(rgb)
+    buckets = color_buckets(rgb)
+    placeholders = ', '.join('?' * len(buckets))
+    sql = (f'id IN (SELECT artwork_id FROM artwork_colors WHERE bucket IN ({placeholders}) '
+           f'AND (l - ?) * (l - ?) + (a - ?) * (a - ?) + (b - ?) * (b - ?) <= ? '
+           f'GROUP BY artwork_id HAVING SUM(share) >= ?)')
+    return sql, buckets + [l, l, a, a, b, b, COLOR_MATCH_DISTANCE ** 2, min_share]
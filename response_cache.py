@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app
+from config import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES
+from revision import current_revision
+
+class ResponseCache:
+    """
+    In-process LRU of serialized response bodies, bounded by total bytes and
+    entry count. Keys carry the gallery revision, so any write makes every
+    older entry unreachable; they are dropped as soon as a newer revision
+    is seen.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._revision = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_revision(self, revision):
+        if revision != self._revision:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.size = 0
+            self._revision = revision
+
+    def get(self, revision, key):
+        with self._lock:
+            self._sync_revision(revision)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, revision, key, body, content_type):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            # The gallery changed while this response was built; it is already stale
+            if revision != self._revision:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (body, content_type)
+            self.size += len(body)
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+response_cache = ResponseCache()
+
+def cached_response(view):
+    """
+    Serve a GET view's body from response_cache, keyed by endpoint, query
+    string and gallery revision; only 200 responses are stored
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        revision = current_revision()
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        entry = response_cache.get(revision, key)
+        if entry is not None:
+            body, content_type = entry
+            return current_app.response_class(body, status=200, content_type=content_type)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response_cache.put(revision, key, response.get_data(), response.content_type)
+        return response
+    return wrapper
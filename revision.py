@@ -0,0 +1,54 @@
+import os
+import time
+import zlib
+from functools import wraps
+from flask import request, make_response
+from config import GALLERY_REVISION_PATH
+
+def current_revision():
+    """
+    Gallery revision token, read with a single stat() - no SQLite.
+    Shared by every worker process through the file's mtime.
+    """
+    try:
+        return format(os.stat(GALLERY_REVISION_PATH).st_mtime_ns, 'x')
+    except FileNotFoundError:
+        bump_revision()
+        return format(os.stat(GALLERY_REVISION_PATH).st_mtime_ns, 'x')
+
+def bump_revision():
+    """Mark the gallery as changed; call after committing any write that shows up in listings"""
+    now = time.time_ns()
+    try:
+        # Strictly increasing even when two bumps land within the clock's resolution
+        now = max(now, os.stat(GALLERY_REVISION_PATH).st_mtime_ns + 1)
+    except FileNotFoundError:
+        open(GALLERY_REVISION_PATH, 'a').close()
+    os.utime(GALLERY_REVISION_PATH, ns=(now, now))
+
+def revision_etag():
+    """Strong ETag for the current request: gallery revision + full URL (path and query)"""
+    url_hash = zlib.crc32(request.full_path.encode('utf-8'))
+    return f"{current_revision()}-{url_hash:08x}"
+
+def etag_on_revision(view):
+    """
+    Conditional GET for views whose output depends only on the URL and the
+    gallery contents: a matching If-None-Match gets a 304 before the view
+    (and SQLite) runs. Clients must revalidate, so writes show up at once.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Read the revision before the view queries, so a concurrent write
+        # can only make the tag stale, never the body
+        etag = revision_etag()
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
@@ -1,27 +1,60 @@
-from flask import render_template, request, jsonify, url_for, send_file
+from flask import render_template, request, jsonify, url_for, send_file, abort, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
 import os
-import uuid
+import re
+import json
+import time
 from db import get_db_connection
-from image_utils import allowed_file, optimize_image_with_metadata, create_thumbnail_with_metadata
-from config import UPLOAD_FOLDER
-from utils import validate_image_file, cleanup_old_files
+from image_utils import (allowed_file, create_thumbnail_with_metadata, derivative_dir, RENDITION_VERSIONS,
+                         MODERN_FORMATS, FALLBACK_FORMATS)
+from utils import validate_image_file, release_old_files, cleanup_old_files
+from config import (IMMUTABLE_MAX_AGE, MAX_UPLOAD_BYTES, GALLERY_FIRST_PAGE_SIZE, BATCH_MAX_FILES,
+                    BATCH_MAX_CONTENT_LENGTH, BATCH_STREAM_TIMEOUT, JOB_POLL_INTERVAL)
+from revision import bump_revision
+from gallery import fetch_artwork_page, thumbnail_url, InvalidCursor
+from ordering import next_position, next_positions
+from jobs import enqueue_job, job_queue, PROCESS_UPLOAD
+from storage import store_upload, spool_upload, store_spooled, release_blob, adopt_processed_image
+from response_cache import cached_response
+from similarity import near_duplicates, duplicate_warning
+
+# Uploads stored by storage.store_upload are named <sha256>.<ext>
+CONTENT_HASHED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+def cache_forever(response, filename, rendition=None):
+    """
+    Long-lived immutable caching, but only for content-hashed names. Renditions
+    that backfill.py can regenerate in place also need the current ?v= version.
+    """
+    if rendition and request.args.get('v') != RENDITION_VERSIONS[rendition]:
+        return response
+    if CONTENT_HASHED.match(os.path.basename(filename)):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
 
 def register_routes(app):
     @app.route('/')
+    @cached_response
     def index():
+        """Rendered once per gallery revision and query; tiles come from fragments.tile_cache"""
+        q = request.args.get('q', '').strip()
+        sort = request.args.get('sort', 'position')
+        
         conn = get_db_connection()
-        artworks = conn.execute('SELECT * FROM artworks ORDER BY position DESC').fetchall()
+        try:
+            # Only the first screenful is rendered; CursorLoader fetches the rest
+            artworks, next_cursor = fetch_artwork_page(conn, sort=sort, q=q, limit=GALLERY_FIRST_PAGE_SIZE)
+        except InvalidCursor:
+            sort = 'position'
+            artworks, next_cursor = fetch_artwork_page(conn, sort=sort, q=q, limit=GALLERY_FIRST_PAGE_SIZE)
+        total = conn.execute('SELECT COUNT(*) FROM artworks').fetchone()[0]
         conn.close()
-        
-        # Process artworks để thêm thumbnail path
-        processed_artworks = []
-        for artwork in artworks:
-            art_dict = dict(artwork)
-            filename = art_dict['image_path'].split('/')[-1]
-            art_dict['thumbnail_path'] = f"/thumbnail/{filename}"
-            processed_artworks.append(art_dict)
             
-        return render_template('index.html', artworks=processed_artworks)
+        return render_template('index.html', artworks=artworks, next_cursor=next_cursor,
+                               total=total, sort=sort, query=q)
 
     @app.route('/thumbnail/<path:filename>')
     def serve_thumbnail(filename):
@@ -30,12 +63,70 @@ def register_routes(app):
         original_path = f"static/uploads/{filename}"
         
         if not os.path.exists(thumb_path) and os.path.exists(original_path):
-            create_thumbnail_with_metadata(original_path)
+            # Uploads still waiting for their image job get the raw original for now
+            conn = get_db_connection()
+            pending = conn.execute(
+                "SELECT 1 FROM artworks WHERE image_path = ? AND status = 'processing'",
+                (original_path,)
+            ).fetchone()
+            conn.close()
+            if not pending:
+                create_thumbnail_with_metadata(original_path)
             
         if os.path.exists(thumb_path):
-            return send_file(thumb_path)
+            # A thumbnail is only written from the final, optimized image
+            return cache_forever(send_file(thumb_path), filename, 'thumbnails')
+        elif os.path.exists(original_path):
+            # Raw original while the upload is processing: revalidate every time
+            return send_file(original_path, max_age=0)
+        else:
+            abort(404)
+
+    @app.route('/image/<int:width>/<path:filename>')
+    def serve_derivative(width, filename):
+        """
+        Serve the smallest derivative at least `width` wide (or the largest
+        there is) in the best format the client's Accept header lists.
+        Falls back to the thumbnail/original until derivatives exist.
+        """
+        widths = {}
+        try:
+            with os.scandir(derivative_dir(filename)) as entries:
+                for entry in entries:
+                    stem, _, ext = entry.name.partition('.')
+                    if stem.isdigit():
+                        widths.setdefault(int(stem), set()).add(ext)
+        except FileNotFoundError:
+            pass
+
+        if not widths:
+            response = serve_thumbnail(filename)
         else:
-            return send_file(original_path)
+            fits = [w for w in widths if w >= width]
+            chosen = min(fits) if fits else max(widths)
+            # */* would match anything, so only formats the client names explicitly count
+            accepted = {mime for mime, quality in request.accept_mimetypes if quality > 0}
+            candidates = [f for f in MODERN_FORMATS if f[1] in accepted] + list(FALLBACK_FORMATS.values())
+            ext, mimetype = next(f for f in candidates if f[0] in widths[chosen])
+            response = cache_forever(
+                send_file(os.path.join(derivative_dir(filename), f"{chosen}.{ext}"), mimetype=mimetype),
+                filename, 'derivatives'
+            )
+        response.vary.add('Accept')
+        return response
+
+    @app.after_request
+    def upload_cache_policy(response):
+        """
+        Originals under /static/uploads are optimized in place once after
+        upload; a content-hashed one is immutable as soon as its thumbnail
+        exists (the job writes it from the final file)
+        """
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get('filename', '')
+            if filename.startswith('uploads/') and os.path.exists(f"static/thumbnails/{os.path.basename(filename)}"):
+                cache_forever(response, filename)
+        return response
 
     @app.route('/add', methods=['POST'])
     def add_artwork():
@@ -52,21 +143,7 @@ def register_routes(app):
             if not validation_result['valid']:
                 return jsonify({'success': False, 'message': validation_result['message']}), 400
                 
-            filename = file.filename
-            ext = filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{ext}"
-            file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            
-            # Process and save file with metadata preservation
-            if ext != 'svg':
-                optimized = optimize_image_with_metadata(file)
-                with open(file_path, 'wb') as f:
-                    f.write(optimized.read())
-            else:
-                file.save(file_path)
-            
-            # Create thumbnail with metadata
-            create_thumbnail_with_metadata(file_path)
+            ext = validation_result['format']
             
             title = request.form.get('title', '').strip()
             description = request.form.get('description', '').strip()
@@ -74,16 +151,32 @@ def register_routes(app):
                 description = "No description provided"
             
             conn = get_db_connection()
-            max_pos = conn.execute('SELECT MAX(position) FROM artworks').fetchone()[0] or 0
-            new_pos = max_pos + 1
+            
+            # Stored under its content hash; a re-upload of known bytes reuses
+            # the existing blob and skips processing
+            file_path, is_new = store_upload(conn, file, ext)
+            unique_filename = os.path.basename(file_path)
+            new_pos = next_position(conn)
             
             # ✅ FIXED: Get the new artwork ID and return artwork data
             cursor = conn.execute(
-                'INSERT INTO artworks (title, description, image_path, position) VALUES (?, ?, ?, ?)',
-                (title if title else None, description, f"static/uploads/{unique_filename}", new_pos)
+                "INSERT INTO artworks (title, description, image_path, position, status) VALUES (?, ?, ?, ?, 'processing')",
+                (title if title else None, description, file_path, new_pos)
             )
             new_id = cursor.lastrowid
+            status = None if is_new else adopt_processed_image(conn, new_id, file_path)
+            job_id = None
+            if status is None:
+                # Optimization, thumbnail and AI metadata extraction run in the background job queue
+                job_id = enqueue_job(conn, PROCESS_UPLOAD, {'image_path': file_path}, artwork_id=new_id)
+                status = 'processing'
             conn.commit()
+            bump_revision()
+            if job_id:
+                job_queue.notify()
+            # A duplicate blob already has its sibling's hash; new images are hashed
+            # by the job and report near-duplicates through /api/jobs/<id>
+            similar = [] if job_id else near_duplicates(conn, new_id)
             conn.close()
             
             # ✅ FIXED: Return complete artwork data for frontend animation
@@ -91,29 +184,185 @@ def register_routes(app):
                 'id': new_id,
                 'title': title if title else None,
                 'description': description,
-                'image_path': f"static/uploads/{unique_filename}",
-                'thumbnail_path': f"/thumbnail/{unique_filename}",
-                'position': new_pos
+                'image_path': file_path,
+                'thumbnail_path': thumbnail_url(unique_filename),
+                'position': new_pos,
+                'status': status
             }
             
-            print(f"✅ Artwork added with metadata preserved: {unique_filename}")
+            if job_id:
+                print(f"✅ Artwork added, processing queued as job {job_id}: {unique_filename}")
+            else:
+                print(f"✅ Artwork added as duplicate of stored image: {unique_filename}")
             
-            return jsonify({
+            result = {
                 'success': True,
                 'message': 'Artwork added successfully!',
                 'artwork': artwork_data,  # ✅ NEW: Include artwork data
+                'job_id': job_id,
+                'similar': similar,
+                'warning': duplicate_warning(similar),
                 'redirect': url_for('index')
-            })
+            }
+            return jsonify(result)
             
+        except HTTPException:
+            # e.g. 413 from MAX_CONTENT_LENGTH while the body is parsed
+            raise
         except Exception as e:
             print(f"❌ Error adding artwork: {e}")
-            if 'file_path' in locals() and os.path.exists(file_path):
+            # The blob reference is rolled back with the transaction; only a
+            # blob this request created has no other owner
+            if locals().get('is_new') and os.path.exists(file_path):
                 try:
                     os.remove(file_path)
                 except:
                     pass
             return jsonify({'success': False, 'message': f'Failed to add artwork: {str(e)}'}), 500
 
+    @app.route('/api/artworks/batch', methods=['POST'])
+    def add_artworks_batch():
+        """
+        Add many artworks in one request: repeated 'images' file fields, with
+        optional 'title'/'description' lists matched to them by index.
+        Every file is validated and spooled first; one transaction then takes
+        the blob references, inserts all artworks with a single INSERT and
+        queues their image jobs, which the job pool runs in parallel.
+        The response is NDJSON, one line per event as it happens:
+          {"event": "rejected", "index", "filename", "message"}
+          {"event": "added", "index", "filename", "artwork", "job_id"}
+          {"event": "processed", "index", "id", "status", "similar", "warning"}
+                                                      ready, failed or deleted; similar
+                                                      lists near-duplicates once hashed
+          {"event": "done", "added", "rejected", "ready", "failed", "pending"}
+        """
+        # Must be set before the body is parsed: a batch may be bigger than one upload
+        request.max_content_length = BATCH_MAX_CONTENT_LENGTH
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({'success': False, 'message': 'No images selected'}), 400
+        if len(files) > BATCH_MAX_FILES:
+            return jsonify({'success': False, 'message': f'Too many images ({len(files)}). Max per batch: {BATCH_MAX_FILES}'}), 400
+        titles = request.form.getlist('title')
+        descriptions = request.form.getlist('description')
+
+        events = []
+        spooled = []
+        stored = []
+        conn = get_db_connection()
+        try:
+            for index, file in enumerate(files):
+                validation_result = validate_image_file(file)
+                if not validation_result['valid']:
+                    events.append({'event': 'rejected', 'index': index, 'filename': file.filename,
+                                   'message': validation_result['message']})
+                    continue
+                title = titles[index].strip() if index < len(titles) else ''
+                description = descriptions[index].strip() if index < len(descriptions) else ''
+                tmp_path, digest = spool_upload(file)
+                spooled.append((index, file.filename, title or None, description or "No description provided",
+                                validation_result['format'], tmp_path, digest))
+
+            if spooled:
+                positions = next_positions(conn, len(spooled))
+                while spooled:
+                    index, filename, title, description, ext, tmp_path, digest = spooled.pop(0)
+                    file_path, is_new = store_spooled(conn, tmp_path, digest, ext)
+                    stored.append((index, filename, title, description, file_path, is_new, positions[len(stored)]))
+
+                # One statement for the whole batch; positions are distinct, so they identify the rows
+                rows = conn.execute(
+                    "INSERT INTO artworks (title, description, image_path, position, status) VALUES "
+                    + ', '.join(["(?, ?, ?, ?, 'processing')"] * len(stored)) + " RETURNING id, position",
+                    [value for _, _, title, description, file_path, _, position in stored
+                     for value in (title, description, file_path, position)]
+                ).fetchall()
+                ids = {row['position']: row['id'] for row in rows}
+
+                jobs_queued = 0
+                for index, filename, title, description, file_path, is_new, position in stored:
+                    new_id = ids[position]
+                    status = None if is_new else adopt_processed_image(conn, new_id, file_path)
+                    job_id = None
+                    if status is None:
+                        job_id = enqueue_job(conn, PROCESS_UPLOAD, {'image_path': file_path}, artwork_id=new_id)
+                        status = 'processing'
+                        jobs_queued += 1
+                    events.append({'event': 'added', 'index': index, 'filename': filename, 'job_id': job_id,
+                                   'artwork': {
+                                       'id': new_id,
+                                       'title': title,
+                                       'description': description,
+                                       'image_path': file_path,
+                                       'thumbnail_path': thumbnail_url(os.path.basename(file_path)),
+                                       'position': position,
+                                       'status': status
+                                   }})
+                conn.commit()
+                bump_revision()
+                if jobs_queued:
+                    job_queue.notify()
+                print(f"✅ Batch: {len(stored)} artworks added, {jobs_queued} processing jobs queued")
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"❌ Error adding batch: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            # Rolled back with the transaction: blobs this request created have no other owner
+            for *_, tmp_path, _ in spooled:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            for _, _, _, _, file_path, is_new, _ in stored:
+                if is_new and os.path.exists(file_path):
+                    os.remove(file_path)
+            return jsonify({'success': False, 'message': f'Failed to add artworks: {str(e)}'}), 500
+
+        events.sort(key=lambda event: event['index'])
+        pending = {event['artwork']['id']: event['index'] for event in events
+                   if event['event'] == 'added' and event['artwork']['status'] == 'processing'}
+
+        def stream():
+            counts = {'added': len(stored), 'rejected': len(events) - len(stored), 'ready': 0, 'failed': 0}
+            for event in events:
+                if event['event'] == 'added' and event['artwork']['status'] != 'processing':
+                    counts['ready' if event['artwork']['status'] == 'ready' else 'failed'] += 1
+                    # Adopted an already processed blob, so its hash is known now
+                    event['similar'] = near_duplicates(get_db_connection(), event['artwork']['id'])
+                    event['warning'] = duplicate_warning(event['similar'])
+                yield json.dumps(event) + '\n'
+
+            deadline = time.monotonic() + BATCH_STREAM_TIMEOUT
+            while pending:
+                seen = job_queue.finished_total
+                placeholders = ', '.join('?' * len(pending))
+                statuses = {row['id']: row['status'] for row in get_db_connection().execute(
+                    f'SELECT id, status FROM artworks WHERE id IN ({placeholders})', list(pending)
+                )}
+                for artwork_id in list(pending):
+                    status = statuses.get(artwork_id, 'deleted')
+                    if status == 'processing':
+                        continue
+                    if status in counts:
+                        counts[status] += 1
+                    similar = near_duplicates(get_db_connection(), artwork_id) if status == 'ready' else []
+                    yield json.dumps({'event': 'processed', 'index': pending.pop(artwork_id),
+                                      'id': artwork_id, 'status': status, 'similar': similar,
+                                      'warning': duplicate_warning(similar)}) + '\n'
+                if not pending or time.monotonic() >= deadline:
+                    break
+                # Woken by jobs finishing in this process; other workers' jobs are polled
+                job_queue.wait_for_progress(seen, JOB_POLL_INTERVAL)
+
+            counts['pending'] = len(pending)
+            yield json.dumps({'event': 'done', **counts}) + '\n'
+
+        response = Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+        # Progress has to reach the client line by line, not once the batch is over
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
     @app.route('/edit/<int:id>', methods=['POST'])
     def edit_artwork(id):
         try:
@@ -130,6 +379,9 @@ def register_routes(app):
             
             new_image_path = None
             new_unique_filename = None
+            new_status = None
+            job_id = None
+            released_path = None
             
             if 'image' in request.files and request.files['image'].filename != '':
                 file = request.files['image']
@@ -138,33 +390,42 @@ def register_routes(app):
                 if not validation_result['valid']:
                     return jsonify({'success': False, 'message': validation_result['message']}), 400
                 
-                filename = file.filename
-                ext = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"{uuid.uuid4()}.{ext}"
+                ext = validation_result['format']
+                
+                # Take the reference on the new blob before dropping the old one,
+                # so re-uploading the same image never deletes it
+                file_path, is_new = store_upload(conn, file, ext)
+                unique_filename = os.path.basename(file_path)
                 new_unique_filename = unique_filename
-                file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+                new_image_path = file_path
                 
-                # Process with metadata preservation
-                if ext != 'svg':
-                    optimized = optimize_image_with_metadata(file)
-                    with open(file_path, 'wb') as f:
-                        f.write(optimized.read())
+                old_image = artwork['image_path']
+                if file_path == old_image:
+                    # Same bytes as the current image: drop the extra reference, nothing to redo
+                    release_blob(conn, file_path)
+                    conn.execute(
+                        'UPDATE artworks SET title = ?, description = ? WHERE id = ?',
+                        (title if title else None, description, id)
+                    )
+                    print(f"✅ Artwork metadata updated, image unchanged: {id}")
                 else:
-                    file.save(file_path)
+                    # The old files go once this update is committed
+                    released_path = release_old_files(conn, old_image)
                     
-                create_thumbnail_with_metadata(file_path)
-                new_image_path = f"static/uploads/{unique_filename}"
-                
-                # Cleanup old files
-                old_image = artwork['image_path']
-                cleanup_old_files(old_image)
-                
-                conn.execute(
-                    'UPDATE artworks SET title = ?, description = ?, image_path = ? WHERE id = ?',
-                    (title if title else None, description, new_image_path, id)
-                )
-                
-                print(f"✅ Artwork updated with metadata preserved: {unique_filename}")
+                    conn.execute(
+                        "UPDATE artworks SET title = ?, description = ?, image_path = ?, status = 'processing' WHERE id = ?",
+                        (title if title else None, description, new_image_path, id)
+                    )
+                    # Metadata of the old image no longer applies; the job stores the new one
+                    conn.execute('DELETE FROM artwork_metadata WHERE artwork_id = ?', (id,))
+                    new_status = None if is_new else adopt_processed_image(conn, id, new_image_path)
+                    if new_status is None:
+                        # Raw upload now, processing in the background job queue
+                        job_id = enqueue_job(conn, PROCESS_UPLOAD, {'image_path': file_path}, artwork_id=id)
+                        new_status = 'processing'
+                        print(f"✅ Artwork updated, processing queued as job {job_id}: {unique_filename}")
+                    else:
+                        print(f"✅ Artwork updated to duplicate of stored image: {unique_filename}")
             else:
                 conn.execute(
                     'UPDATE artworks SET title = ?, description = ? WHERE id = ?',
@@ -174,6 +435,11 @@ def register_routes(app):
             
             conn.commit()
             conn.close()
+            bump_revision()
+            if released_path:
+                cleanup_old_files(released_path)
+            if job_id:
+                job_queue.notify()
             
             # ✅ FIXED: Return updated artwork data
             artwork_data = {
@@ -181,20 +447,25 @@ def register_routes(app):
                 'title': title if title else None,
                 'description': description,
                 'image_path': new_image_path if new_image_path else artwork['image_path'],
-                'thumbnail_path': f"/thumbnail/{new_unique_filename}" if new_unique_filename else f"/thumbnail/{artwork['image_path'].split('/')[-1]}",
-                'position': artwork['position']
+                'thumbnail_path': thumbnail_url(new_unique_filename or artwork['image_path'].split('/')[-1]),
+                'position': artwork['position'],
+                'status': new_status or artwork['status']
             }
             
             return jsonify({
                 'success': True,
                 'message': 'Artwork updated successfully!',
                 'artwork': artwork_data,  # ✅ NEW: Include updated artwork data
+                'job_id': job_id,
                 'redirect': url_for('index')
             })
             
+        except HTTPException:
+            # e.g. 413 from MAX_CONTENT_LENGTH while the body is parsed
+            raise
         except Exception as e:
             print(f"❌ Error updating artwork: {e}")
-            if 'file_path' in locals() and os.path.exists(file_path):
+            if locals().get('is_new') and os.path.exists(file_path):
                 try:
                     os.remove(file_path)
                 except:
@@ -210,12 +481,16 @@ def register_routes(app):
             if not artwork:
                 return jsonify({'success': False, 'message': 'Artwork not found'}), 404
             
-            img_path = artwork['image_path']
-            cleanup_old_files(img_path)
+            released_path = release_old_files(conn, artwork['image_path'])
             
             conn.execute('DELETE FROM artworks WHERE id = ?', (id,))
+            conn.execute('DELETE FROM artwork_metadata WHERE artwork_id = ?', (id,))
             conn.commit()
             conn.close()
+            bump_revision()
+            # Only now that no row points at them
+            if released_path:
+                cleanup_old_files(released_path)
             
             print(f"✅ Artwork deleted: {id}")
             
@@ -229,6 +504,12 @@ def register_routes(app):
             return jsonify({'success': False, 'message': f'Failed to delete artwork: {str(e)}'}), 500
 
     # Error handlers
+    @app.errorhandler(413)
+    def request_too_large(error):
+        # Raised by werkzeug while reading a body over MAX_CONTENT_LENGTH
+        max_mb = MAX_UPLOAD_BYTES // 1024 // 1024
+        return jsonify({'success': False, 'message': f'Upload too large. Max size: {max_mb}MB'}), 413
+
     @app.errorhandler(404)
     def not_found_error(error):
         return render_template('error.html', 
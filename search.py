@@ -0,0 +1,31 @@
+import re
+from markupsafe import escape
+
+# bm25 column weights: title, description, prompt
+BM25_WEIGHTS = (10.0, 5.0, 2.0)
+
+# Private-use markers so user text can be HTML-escaped before highlighting
+_HIGHLIGHT_START = '\ue000'
+_HIGHLIGHT_END = '\ue001'
+
+SNIPPET_SQL = (
+    f"snippet(artworks_fts, -1, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', '…', 12)"
+)
+RANK_SQL = f"bm25(artworks_fts, {', '.join(str(w) for w in BM25_WEIGHTS)})"
+
+def build_match_query(q):
+    """
+    Turn free text from the search box into an FTS5 MATCH expression.
+    Every word becomes a quoted prefix term, all terms must match.
+    Returns None when the text has no searchable words.
+    """
+    terms = re.findall(r'\w+', q or '', re.UNICODE)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def highlight_snippet(raw):
+    """Escape an FTS snippet and turn the match markers into <mark> tags"""
+    if not raw:
+        return ''
+    return str(escape(raw)).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
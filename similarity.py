@@ -0,0 +1,117 @@
+"""
+Near-duplicate lookup over artworks.dhash (see image_utils.compute_dhash).
+
+All hashes sit in memory as one packed uint64 array next to an id array; a
+query XORs the whole array with the probe and counts the differing bits,
+which NumPy does over 100k hashes in well under a millisecond. Without NumPy
+the same scan runs on Python ints (int.bit_count) in tens of milliseconds.
+
+The arrays are reloaded only when dhash_generation moves, i.e. when a hash
+was added, changed or removed (triggers in db.py); other writes leave the
+index alone.
+"""
+import threading
+from config import SIMILAR_MAX_DISTANCE, SIMILAR_LIMIT, DUPLICATE_WARN_DISTANCE
+from gallery import serialize_artwork
+
+try:
+    import numpy as np
+except ImportError:     # optional: pure-Python scan
+    np = None
+
+MASK64 = (1 << 64) - 1
+
+if np is not None:
+    if hasattr(np, 'bitwise_count'):
+        def _popcount(values):
+            return np.bitwise_count(values)
+    else:
+        # NumPy < 2.0: popcount per byte from a table, summed over the 8 bytes
+        _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+        def _popcount(values):
+            return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+class HashIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._ids = None
+        self._hashes = None
+
+    def _current(self, conn):
+        generation = conn.execute('SELECT generation FROM dhash_generation').fetchone()[0]
+        with self._lock:
+            if generation == self._generation:
+                return self._ids, self._hashes
+        rows = conn.execute('SELECT id, dhash FROM artworks WHERE dhash IS NOT NULL').fetchall()
+        if np is not None:
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            hashes = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+        else:
+            ids = [row[0] for row in rows]
+            hashes = [row[1] & MASK64 for row in rows]
+        with self._lock:
+            self._generation, self._ids, self._hashes = generation, ids, hashes
+        return ids, hashes
+
+    def search(self, conn, dhash, max_distance=SIMILAR_MAX_DISTANCE, limit=SIMILAR_LIMIT, exclude=None):
+        """[(artwork id, distance)] within max_distance bits of dhash, closest first"""
+        ids, hashes = self._current(conn)
+        if np is not None:
+            distances = _popcount(hashes ^ np.uint64(dhash & MASK64))
+            hits = np.flatnonzero(distances <= max_distance)
+            hits = hits[np.lexsort((ids[hits], distances[hits]))]
+            matches = zip(ids[hits].tolist(), distances[hits].tolist())
+        else:
+            probe = dhash & MASK64
+            scored = ((artwork_id, (h ^ probe).bit_count()) for artwork_id, h in zip(ids, hashes))
+            matches = sorted((m for m in scored if m[1] <= max_distance), key=lambda m: (m[1], m[0]))
+        results = []
+        for artwork_id, distance in matches:
+            if artwork_id != exclude:
+                results.append((artwork_id, distance))
+                if len(results) >= limit:
+                    break
+        return results
+
+hash_index = HashIndex()
+
+def find_similar(conn, dhash, max_distance=SIMILAR_MAX_DISTANCE, limit=SIMILAR_LIMIT, exclude=None):
+    if dhash is None:
+        return []
+    return hash_index.search(conn, dhash, max_distance, limit, exclude)
+
+def similar_artworks(conn, matches):
+    """find_similar() results -> serialized artworks with a 'distance' key, in the same order"""
+    if not matches:
+        return []
+    placeholders = ', '.join('?' * len(matches))
+    rows = {row['id']: row for row in conn.execute(
+        f'SELECT * FROM artworks WHERE id IN ({placeholders})', [artwork_id for artwork_id, _ in matches]
+    )}
+    artworks = []
+    for artwork_id, distance in matches:
+        if artwork_id in rows:
+            art = serialize_artwork(rows[artwork_id])
+            art['distance'] = distance
+            artworks.append(art)
+    return artworks
+
+def near_duplicates(conn, artwork_id):
+    """
+    similar_artworks() within DUPLICATE_WARN_DISTANCE of a stored artwork.
+    Empty until its upload job has hashed it; call only after committing,
+    so the index never loads rows that could still roll back.
+    """
+    row = conn.execute('SELECT dhash FROM artworks WHERE id = ?', (artwork_id,)).fetchone()
+    if row is None:
+        return []
+    return similar_artworks(conn, find_similar(conn, row['dhash'], DUPLICATE_WARN_DISTANCE, exclude=artwork_id))
+
+def duplicate_warning(similar):
+    """Toast text for near_duplicates(), None when there are none"""
+    if not similar:
+        return None
+    closest = similar[0]['title'] or f"#{similar[0]['id']}"
+    return f'Looks like a near-duplicate of "{closest}"' + (f" and {len(similar) - 1} more" if len(similar) > 1 else '')
@@ -5,7 +5,7 @@ import { ToastManager } from './toast.js';
 import { LazyImageLoader } from './lazy_image.js';
 import { NetworkMonitor, enhancedFetch } from './network.js';
 import { AnimationManager, LoadingManager } from './animation.js';
-import { VirtualScroll } from './virtual-scroll.js';
+import { VirtualScroll, CursorLoader } from './virtual-scroll.js';
 import { ModalManager, FileHandler, FormHandler } from './components.js';
 
 class ArtGalleryApp {
@@ -34,7 +34,7 @@ class ArtGalleryApp {
       window.networkMonitor = this.managers.network;
       
       // Skip traditional lazy loader if using virtual scroll
-      if (document.querySelectorAll('.artwork').length < this.config.VIRTUAL_SCROLL_THRESHOLD) {
+      if (this.getGalleryTotal() < this.config.VIRTUAL_SCROLL_THRESHOLD) {
         this.managers.lazyLoader = new LazyImageLoader();
         window.lazyLoader = this.managers.lazyLoader;
       }
@@ -47,6 +47,7 @@ class ArtGalleryApp {
       // Initialize features in optimized order
       this.initImageCounter();
       await this.initVirtualScroll(); // Now async for better control
+      this.initCursorLoader();
       this.initSortable();
       this.initEventListeners();
       this.initErrorHandling();
@@ -74,6 +75,24 @@ class ArtGalleryApp {
     }
   }
 
+  // Whole gallery size; only the first page is in the DOM
+  getGalleryTotal() {
+    const gallery = document.getElementById('gallery');
+    const total = gallery ? Number(gallery.dataset.total) : NaN;
+    return Number.isNaN(total) ? document.querySelectorAll('.artwork').length : total;
+  }
+
+  initCursorLoader() {
+    const gallery = document.getElementById('gallery');
+    if (!gallery) return;
+    
+    this.managers.cursorLoader = new CursorLoader({
+      container: '#gallery',
+      virtualScroll: this.virtualScroll
+    });
+    window.galleryPager = this.managers.cursorLoader;
+  }
+
   initLazyLoading() {
     if (!this.managers.lazyLoader) return;
     
@@ -82,7 +101,9 @@ class ArtGalleryApp {
   }
 
   initImageCounter() {
-    const totalImages = document.querySelectorAll('.gallery .artwork').length;
+    const totalImages = this.getGalleryTotal();
+    // Artworks not yet loaded into the DOM (pages still behind the cursor)
+    const unloadedOffset = totalImages - document.querySelectorAll('.gallery .artwork').length;
     const counter = document.getElementById('image-total');
     
     if (counter) {
@@ -112,7 +133,9 @@ class ArtGalleryApp {
 
     // Update counter function with animation
     this.updateImageCounter = debounce(() => {
-      const currentTotal = document.querySelectorAll('.gallery .artwork:not(.artwork-skeleton)').length;
+      const appended = this.managers.cursorLoader ? this.managers.cursorLoader.appendedCount : 0;
+      const currentTotal = document.querySelectorAll('.gallery .artwork:not(.artwork-skeleton)').length
+        + unloadedOffset - appended;
       if (counter) {
         counter.style.transform = 'scale(1.2)';
         counter.textContent = currentTotal;
@@ -122,7 +145,7 @@ class ArtGalleryApp {
   }
 
   async initVirtualScroll() {
-    const artworkCount = document.querySelectorAll('.artwork').length;
+    const artworkCount = this.getGalleryTotal();
     
     console.log(`📊 Gallery has ${artworkCount} artworks (threshold: ${this.config.VIRTUAL_SCROLL_THRESHOLD})`);
     
@@ -209,9 +232,11 @@ initAnimations() {
           if (window.toast) window.toast.info('Reordering artworks...');
           gallery.classList.add('is-sorting');
         },
-        onEnd: () => {
+        onEnd: (evt) => {
           gallery.classList.remove('is-sorting');
-          this.handleOrderUpdate();
+          if (evt.oldIndex !== evt.newIndex) {
+            this.handleOrderUpdate(evt.item);
+          }
         }
       });
       
@@ -224,32 +249,25 @@ initAnimations() {
     }
   }
 
-  async handleOrderUpdate() {
+  // Send only the moved tile and its new neighbours; the server writes one row
+  async handleOrderUpdate(item) {
     try {
-      const gallery = document.getElementById('gallery');
-      const artworks = Array.from(gallery.children);
-      const totalCount = artworks.length;
-      
-      const order = artworks.map((el, idx) => ({
-        id: el.dataset.id,
-        position: totalCount - idx
-      }));
+      const before = item.previousElementSibling;
+      const after = item.nextElementSibling;
       
-      const result = await enhancedFetch('/update-order', {
+      const result = await enhancedFetch('/api/artworks/reorder', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ order })
+        body: JSON.stringify({
+          id: item.dataset.id,
+          before_id: before ? before.dataset.id : null,
+          after_id: after ? after.dataset.id : null
+        })
       });
       
-      if (result.success && window.toast) {
-        window.toast.success('Order updated successfully!');
-        
-        // Pulse effect on reordered items
-        artworks.forEach((artwork, idx) => {
-          setTimeout(() => {
-            AnimationManager.animateUpdate(artwork);
-          }, idx * 50);
-        });
+      if (result.success) {
+        item.dataset.position = result.positions[0].position;
+        if (window.toast) window.toast.success('Order updated successfully!');
       }
     } catch (error) {
       console.error('Update order error:', error);
@@ -595,34 +613,6 @@ initAnimations() {
       performanceMonitoring: this.config.ENABLE_PERFORMANCE_MONITORING
     };
   }
- 	async handleOrderUpdate() {
-		try {
-			const gallery = document.getElementById('gallery');
-			const artworks = Array.from(gallery.children);
-			const totalCount = artworks.length;
-			
-			const order = artworks.map((el, idx) => ({
-				id: el.dataset.id,
-				position: totalCount - idx
-			}));
-			
-			const result = await enhancedFetch('/update-order', {
-				method: 'POST',
-				headers: { 'Content-Type': 'application/json' },
-				body: JSON.stringify({ order })
-			});
-			
-			if (result.success && window.toast) {
-				window.toast.success('Order updated successfully!');
-				
-				// ✅ FIXED: KHÔNG animate tất cả
-				// Animation đã được xử lý bởi SortableJS
-			}
-		} catch (error) {
-			console.error('Update order error:', error);
-			if (window.toast) window.toast.error('Failed to update order');
-		}
-	}	 
 }
 
 // Initialize when DOM ready
@@ -365,6 +365,8 @@ export class FormHandler {
       
       if (result.success) {
         if (window.toast) window.toast.success(result.message);
+        if (result.warning && window.toast) window.toast.warning(result.warning);
+        if (result.job_id) this.watchForDuplicates(result.job_id);
         
         // ✅ FIXED: Create new artwork element in-place instead of reload
         if (result.artwork) {
@@ -477,11 +479,31 @@ export class FormHandler {
     }
   }
 
+  // The upload job hashes the image; warn once it reports near-duplicates
+  async watchForDuplicates(jobId, interval = 2000, attempts = 60) {
+    for (let i = 0; i < attempts; i++) {
+      await new Promise(resolve => setTimeout(resolve, interval));
+      try {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) return;
+        const result = await response.json();
+        if (result.job.status === 'failed') return;
+        if (result.job.status === 'done') {
+          if (result.warning && window.toast) window.toast.warning(result.warning);
+          return;
+        }
+      } catch (error) {
+        return;
+      }
+    }
+  }
+
   // ✅ NEW: Create artwork element from data
   createArtworkElement(artwork) {
     const div = document.createElement('div');
     div.className = 'artwork';
     div.dataset.id = artwork.id;
+    div.dataset.position = artwork.position;
     
     div.innerHTML = `
       <div class="artwork-container">
@@ -332,7 +332,7 @@ class EditModeManager {
         otherElements.forEach(el => gallery.appendChild(el));
         
         // Update server
-        await this.updateServerOrder();
+        await this.updateServerOrder(selectedElements, 'top');
         
         this.clearAllSelections();
         
@@ -367,7 +367,7 @@ class EditModeManager {
         selectedElements.forEach(el => gallery.appendChild(el));
         
         // Update server
-        await this.updateServerOrder();
+        await this.updateServerOrder(selectedElements, 'bottom');
         
         this.clearAllSelections();
         
@@ -429,23 +429,45 @@ class EditModeManager {
         }
     }
     
-    async updateServerOrder() {
-        const gallery = document.getElementById('gallery');
-        const artworks = Array.from(gallery.children);
-        const totalCount = artworks.length;
-        
-        const order = artworks.map((el, idx) => ({
-            id: el.dataset.id,
-            position: totalCount - idx
-        }));
+    // Only the moved tiles are sent. Moves are applied in DOM order, so each one
+    // sits after the tile before it (already placed) and before the next unmoved tile.
+    // With `to` ('top' or 'bottom') the first tile goes past every artwork on the
+    // server, including pages that were never loaded, and the rest follow it.
+    async updateServerOrder(movedElements, to = null) {
+        const moved = new Set(movedElements);
+        const moves = [];
+        
+        movedElements.forEach((el, index) => {
+            if (to && index === 0) {
+                moves.push({ id: el.dataset.id, to });
+                return;
+            }
+            const before = el.previousElementSibling;
+            let after = el.nextElementSibling;
+            while (after && moved.has(after)) {
+                after = after.nextElementSibling;
+            }
+            moves.push({
+                id: el.dataset.id,
+                before_id: before ? before.dataset.id : null,
+                after_id: after ? after.dataset.id : null
+            });
+        });
         
         try {
-            const response = await fetch('/update-order', {
+            const response = await fetch('/api/artworks/reorder', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ order })
+                body: JSON.stringify({ moves })
             });
             
+            const result = await response.json();
+            if (result.success) {
+                result.positions.forEach(({ id, position }) => {
+                    const el = document.querySelector(`.artwork[data-id="${id}"]`);
+                    if (el) el.dataset.position = position;
+                });
+            }
             return response.ok;
         } catch (error) {
             console.error('Update order error:', error);
@@ -569,43 +591,65 @@ class EditModeManager {
         
         let successCount = 0;
         
-        for (let i = 0; i < this.batchFiles.length; i++) {
-            const file = this.batchFiles[i];
+        const progressFills = this.batchFiles.map(file => {
             const progressItem = document.createElement('div');
             progressItem.className = 'progress-item';
             progressItem.innerHTML = `
-                <p>${file.name}</p>
+                <p></p>
                 <div class="progress-bar">
                     <div class="progress-fill" style="width: 0%"></div>
                 </div>
             `;
+            progressItem.querySelector('p').textContent = file.name;
             progressContainer.appendChild(progressItem);
-            
-            const progressFill = progressItem.querySelector('.progress-fill');
-            
+            return progressItem.querySelector('.progress-fill');
+        });
+        
+        const setProgress = (fill, state) => {
+            if (state === 'stored') {
+                fill.style.width = '50%';
+                return;
+            }
+            fill.style.width = '100%';
+            fill.style.background = state === 'ready'
+                ? 'linear-gradient(135deg, #10b981 0%, #059669 100%)'
+                : 'linear-gradient(135deg, #ef4444 0%, #dc2626 100%)';
+        };
+        
+        // One request per chunk instead of one per file. Each response streams a
+        // line per file when it is stored and again when its processing is done;
+        // the next chunk uploads while the server processes the previous one.
+        const streams = [];
+        for (const chunk of this.batchChunks()) {
             try {
                 const formData = new FormData();
-                formData.append('image', file);
-                formData.append('title', '');
-                formData.append('description', '');
+                chunk.forEach(i => formData.append('images', this.batchFiles[i]));
                 
-                const response = await fetch('/add', {
+                const response = await fetch('/api/artworks/batch', {
                     method: 'POST',
                     body: formData
                 });
-                
-                if (response.ok) {
-                    successCount++;
-                    progressFill.style.width = '100%';
-                    progressFill.style.background = 'linear-gradient(135deg, #10b981 0%, #059669 100%)';
-                } else {
+                if (!response.ok) {
                     throw new Error('Upload failed');
                 }
+                
+                streams.push(this.readBatchEvents(response, event => {
+                    const fill = progressFills[chunk[event.index]];
+                    if (event.warning && window.toast) window.toast.warning(event.warning);
+                    if (event.event === 'added') {
+                        successCount++;
+                        setProgress(fill, event.artwork.status === 'processing' ? 'stored' : event.artwork.status);
+                    } else if (event.event === 'processed') {
+                        setProgress(fill, event.status);
+                    } else if (event.event === 'rejected') {
+                        setProgress(fill, 'failed');
+                    }
+                }).catch(error => console.error('Batch progress stream ended early:', error)));
             } catch (error) {
-                progressFill.style.width = '100%';
-                progressFill.style.background = 'linear-gradient(135deg, #ef4444 0%, #dc2626 100%)';
+                chunk.forEach(i => setProgress(progressFills[i], 'failed'));
             }
         }
+        await Promise.all(streams);
         
         if (window.toast) {
             window.toast.success(`Uploaded ${successCount} of ${this.batchFiles.length} images!`);
@@ -627,6 +671,39 @@ class EditModeManager {
         }
     }
     
+    // File indexes grouped to stay well under the server's per-batch limits
+    batchChunks(maxFiles = 50, maxBytes = 200 * 1024 * 1024) {
+        const chunks = [];
+        let chunk = [];
+        let bytes = 0;
+        this.batchFiles.forEach((file, i) => {
+            if (chunk.length && (chunk.length >= maxFiles || bytes + file.size > maxBytes)) {
+                chunks.push(chunk);
+                chunk = [];
+                bytes = 0;
+            }
+            chunk.push(i);
+            bytes += file.size;
+        });
+        if (chunk.length) chunks.push(chunk);
+        return chunks;
+    }
+    
+    // Calls onEvent for every NDJSON line of a batch response as it arrives
+    async readBatchEvents(response, onEvent) {
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+        }
+        if (buffer.trim()) onEvent(JSON.parse(buffer));
+    }
+    
     disableVirtualScroll() {
         const gallery = document.getElementById('gallery');
         if (window.artGalleryApp?.virtualScroll) {
@@ -4,6 +4,8 @@ export class LazyImageLoader {
       entries.forEach(entry => {
         if (entry.isIntersecting) {
           const img = entry.target;
+          // srcset first so the browser never fetches the fallback src as well
+          if (img.dataset.srcset) img.srcset = img.dataset.srcset;
           img.src = img.dataset.src;
           img.classList.remove('lazy');
           img.classList.add('lazy-loaded');
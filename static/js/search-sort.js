@@ -6,8 +6,8 @@ class SearchSort {
         this.resultsText = document.getElementById('results-text');
         this.gallery = document.getElementById('gallery');
         
-        this.currentQuery = '';
-        this.currentSort = 'newest';
+        this.currentQuery = this.searchInput.value.trim();
+        this.currentSort = this.sortSelect.value;
         this.debounceTimer = null;
         
         this.init();
@@ -55,7 +55,16 @@ class SearchSort {
             
             if (data.success) {
                 this.renderResults(data.artworks);
-                this.updateResultsText(data.count);
+                this.updateResultsText(data.count, Boolean(data.next));
+                
+                // Let the cursor loader continue from this first page
+                if (window.galleryPager) {
+                    window.galleryPager.reset({
+                        next: data.next,
+                        sort: this.currentSort,
+                        query: this.currentQuery
+                    });
+                }
                 
                 // Save sort preference
                 localStorage.setItem('gallerySort', this.currentSort);
@@ -99,9 +108,12 @@ class SearchSort {
     
     createArtworkHTML(artwork) {
         return `
-            <div class="artwork" data-id="${artwork.id}">
-                <div class="artwork-container">
+            <div class="artwork" data-id="${artwork.id}" data-position="${artwork.position}">
+                <div class="artwork-container"${artwork.lqip ? ` style="--lqip: url('${artwork.lqip}')"` : ''}>
                     <img data-src="${artwork.thumbnail_path}" 
+                         ${artwork.thumb_width ? `width="${artwork.thumb_width}" height="${artwork.thumb_height}"` : ''}
+                         ${artwork.srcset ? `data-srcset="${artwork.srcset}" sizes="${artwork.sizes}"` : ''}
+                         data-full-src="${artwork.full_path || artwork.image_path}" 
                          alt="${artwork.title || ''}" 
                          class="lazy">
                     <div class="artwork-actions">
@@ -128,11 +140,14 @@ class SearchSort {
         `;
     }
     
-    updateResultsText(count) {
+    updateResultsText(count, hasMore = false) {
+        // Results are paginated: with more pages behind the cursor, count is a lower bound
+        const shown = hasMore ? `${count}+` : `${count}`;
+        const plural = hasMore || count !== 1 ? 's' : '';
         if (this.currentQuery) {
-            this.resultsText.textContent = `Found ${count} result${count !== 1 ? 's' : ''} for "${this.currentQuery}"`;
+            this.resultsText.textContent = `Found ${shown} result${plural} for "${this.currentQuery}"`;
         } else {
-            this.resultsText.textContent = `Showing all ${count} artwork${count !== 1 ? 's' : ''}`;
+            this.resultsText.textContent = `Showing ${shown} artwork${plural}`;
         }
     }
 }
@@ -141,9 +156,12 @@ class SearchSort {
 document.addEventListener('DOMContentLoaded', () => {
     window.searchSort = new SearchSort();
     
-    // Load saved sort preference
+    // Load saved sort preference (the server renders the first page in URL/default order)
     const savedSort = localStorage.getItem('gallerySort');
-    if (savedSort) {
+    const urlSort = new URLSearchParams(window.location.search).get('sort');
+    if (savedSort && !urlSort && savedSort !== window.searchSort.currentSort) {
         document.getElementById('sort-select').value = savedSort;
+        window.searchSort.currentSort = savedSort;
+        window.searchSort.updateGallery();
     }
 });
\ No newline at end of file
@@ -124,6 +124,7 @@ export class VirtualScroll {
                     // Lazy load images
                     const img = entry.target.querySelector('img.lazy');
                     if (img && img.dataset.src && !img.src) {
+                        if (img.dataset.srcset) img.srcset = img.dataset.srcset;
                         img.src = img.dataset.src;
                         img.classList.remove('lazy');
                         img.classList.add('lazy-loaded');
@@ -406,6 +407,28 @@ export class VirtualScroll {
         }, 500);
     }
     
+    // Append a page of artworks fetched by CursorLoader
+    appendArtworks(artworks) {
+        artworks.forEach(artworkData => {
+            this.artworks.push({
+                id: String(artworkData.id),
+                html: this.createArtworkHTML(artworkData),
+                index: this.artworks.length,
+                element: null,
+                isVisible: false,
+                isRendered: false
+            });
+        });
+        
+        // Recalculate height
+        const totalRows = Math.ceil(this.artworks.length / this.itemsPerRow);
+        this.totalHeight = totalRows * this.itemHeight;
+        this.spacer.style.height = `${this.totalHeight}px`;
+        
+        this.calculateVisibleRange();
+        this.render();
+    }
+    
     // Remove artwork with animation
     async removeArtwork(artworkId) {
         const artworkIndex = this.artworks.findIndex(a => a.id === artworkId);
@@ -439,9 +462,12 @@ export class VirtualScroll {
     
     createArtworkHTML(artwork) {
         return `
-            <div class="artwork" data-id="${artwork.id}">
-                <div class="artwork-container">
+            <div class="artwork" data-id="${artwork.id}" data-position="${artwork.position}">
+                <div class="artwork-container"${artwork.lqip ? ` style="--lqip: url('${artwork.lqip}')"` : ''}>
                     <img data-src="${artwork.thumbnail_path}" 
+                         ${artwork.thumb_width ? `width="${artwork.thumb_width}" height="${artwork.thumb_height}"` : ''}
+                         ${artwork.srcset ? `data-srcset="${artwork.srcset}" sizes="${artwork.sizes}"` : ''}
+                         data-full-src="${artwork.full_path || artwork.image_path}" 
                          alt="${artwork.title || ''}" 
                          class="lazy">
                     <div class="artwork-actions">
@@ -539,4 +565,105 @@ export class VirtualScroll {
         
         console.log('🔍 Debug mode disabled');
     }
-}
\ No newline at end of file
+}
+
+// Follows the opaque `next` cursor returned by /api/artworks to load further
+// pages as the user nears the end of the gallery
+export class CursorLoader {
+    constructor(options) {
+        this.container = document.querySelector(options.container);
+        this.virtualScroll = options.virtualScroll || null;
+        this.pageSize = options.pageSize || 60;
+        
+        this.next = this.container.dataset.nextCursor || null;
+        this.sort = this.container.dataset.sort || 'position';
+        this.query = this.container.dataset.query || '';
+        this.loading = false;
+        this.appendedCount = 0;
+        
+        // Sentinel after the gallery triggers the next page
+        this.sentinel = document.createElement('div');
+        this.sentinel.className = 'gallery-sentinel';
+        this.container.after(this.sentinel);
+        
+        this.observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                this.loadMore();
+            }
+        }, { root: null, rootMargin: '800px 0px' });
+        
+        this.observer.observe(this.sentinel);
+    }
+    
+    // Called by search/sort after it replaced the first page
+    reset({ next, sort, query }) {
+        this.next = next || null;
+        this.appendedCount = 0;
+        this.sort = sort;
+        this.query = query;
+        this.loadMoreIfVisible();
+    }
+    
+    async loadMore() {
+        if (this.loading || !this.next) return;
+        this.loading = true;
+        
+        try {
+            const params = new URLSearchParams({
+                q: this.query,
+                sort: this.sort,
+                cursor: this.next,
+                limit: this.pageSize
+            });
+            
+            const response = await fetch(`/api/artworks?${params}`);
+            const data = await response.json();
+            
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+            
+            this.next = data.next;
+            this.appendedCount += data.artworks.length;
+            
+            if (this.virtualScroll) {
+                this.virtualScroll.appendArtworks(data.artworks);
+            } else {
+                this.appendToGallery(data.artworks);
+            }
+        } catch (error) {
+            console.error('Load more error:', error);
+            this.next = null;
+        } finally {
+            this.loading = false;
+        }
+        
+        // The observer only fires on changes, so keep going while the sentinel stays in range
+        this.loadMoreIfVisible();
+    }
+    
+    loadMoreIfVisible() {
+        if (!this.next) return;
+        const rect = this.sentinel.getBoundingClientRect();
+        if (rect.top < window.innerHeight + 800) {
+            this.loadMore();
+        }
+    }
+    
+    appendToGallery(artworks) {
+        const template = document.createElement('template');
+        template.innerHTML = artworks.map(artwork => VirtualScroll.prototype.createArtworkHTML(artwork)).join('');
+        const newElements = Array.from(template.content.children);
+        
+        this.container.append(...newElements);
+        
+        newElements.forEach(element => {
+            const img = element.querySelector('img.lazy');
+            if (img && window.lazyLoader) {
+                window.lazyLoader.observe([img]);
+            }
+        });
+        
+        AnimationManager.initPageAnimations(newElements);
+    }
+}
@@ -1,13 +0,0 @@
-// Basic Service Worker
-self.addEventListener('install', (event) => {
-  console.log('Service Worker installing...');
-});
-
-self.addEventListener('activate', (event) => {
-  console.log('Service Worker activated');
-});
-
-self.addEventListener('fetch', (event) => {
-  // Simple pass-through for now
-  event.respondWith(fetch(event.request));
-});
\ No newline at end of file
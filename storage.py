@@ -0,0 +1,114 @@
+import os
+import uuid
+import hashlib
+from config import UPLOAD_FOLDER
+from api import AI_METADATA_FIELDS
+from gallery import DIMENSION_COLUMNS
+
+# Read uploads in 1 MiB chunks while hashing
+CHUNK_SIZE = 1024 * 1024
+
+def spool_upload(file):
+    """
+    Copy an uploaded FileStorage to a temp file next to the blobs, hashing
+    as it streams. Returns (tmp_path, sha256 hex) for store_spooled().
+    """
+    tmp_path = os.path.join(UPLOAD_FOLDER, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    stream = file.stream
+    stream.seek(0)
+    try:
+        with open(tmp_path, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+def store_upload(conn, file, ext):
+    """
+    Store an upload under its SHA-256 (static/uploads/<hash>.<ext>) and take
+    a reference on the blob. Caller commits.
+    Returns (image_path, is_new): is_new is False when identical bytes are
+    already stored, in which case nothing needs processing.
+    """
+    tmp_path, digest = spool_upload(file)
+    return store_spooled(conn, tmp_path, digest, ext)
+
+def store_spooled(conn, tmp_path, digest, ext):
+    """
+    store_upload() for a file already spooled by spool_upload(). Takes the
+    temp file over: it is moved into place or removed. Batch uploads spool
+    everything first, so the write transaction only covers the renames.
+    """
+    try:
+        # Upsert serializes concurrent uploads of the same bytes on SQLite's write lock
+        row = conn.execute(
+            '''
+            INSERT INTO blobs (hash, path, refcount) VALUES (?, ?, 1)
+            ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1
+            RETURNING path, refcount
+            ''',
+            (digest, f"static/uploads/{digest}.{ext}")
+        ).fetchone()
+        image_path = row['path']
+        is_new = row['refcount'] == 1 or not os.path.exists(image_path)
+        if is_new:
+            os.replace(tmp_path, image_path)
+        else:
+            os.remove(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return image_path, is_new
+
+def release_blob(conn, image_path):
+    """
+    Drop one reference to a stored image. Returns True when the caller
+    should delete the files (last reference gone, or a pre-hashing upload
+    that was never shared). Caller commits.
+    """
+    row = conn.execute(
+        'UPDATE blobs SET refcount = refcount - 1 WHERE path = ? RETURNING refcount',
+        (image_path,)
+    ).fetchone()
+    if row is None:
+        return True
+    if row['refcount'] <= 0:
+        conn.execute('DELETE FROM blobs WHERE path = ?', (image_path,))
+        return True
+    return False
+
+def adopt_processed_image(conn, artwork_id, image_path):
+    """
+    Give a duplicate upload the processing state of another artwork that
+    already uses the same blob. Returns the adopted status, or None when no
+    other artwork references it (the caller should process it then).
+    """
+    sibling = conn.execute(
+        'SELECT id, status, derivatives, dhash, palette, lqip FROM artworks WHERE image_path = ? AND id != ? ORDER BY id LIMIT 1',
+        (image_path, artwork_id)
+    ).fetchone()
+    if sibling is None or sibling['status'] == 'failed':
+        return None
+    conn.execute(
+        'UPDATE artworks SET status = ?, derivatives = ?, dhash = COALESCE(?, dhash), '
+        'palette = COALESCE(?, palette), lqip = COALESCE(?, lqip) WHERE id = ?',
+        (sibling['status'], sibling['derivatives'], sibling['dhash'], sibling['palette'], sibling['lqip'],
+         artwork_id)
+    )
+    conn.execute(
+        f"UPDATE artworks SET ({', '.join(DIMENSION_COLUMNS)}) = "
+        f"(SELECT {', '.join(DIMENSION_COLUMNS)} FROM artworks WHERE id = ?) WHERE id = ?",
+        (sibling['id'], artwork_id)
+    )
+    conn.execute(
+        f"INSERT OR REPLACE INTO artwork_metadata (artwork_id, {', '.join(AI_METADATA_FIELDS)}) "
+        f"SELECT ?, {', '.join(AI_METADATA_FIELDS)} FROM artwork_metadata WHERE artwork_id = ?",
+        (artwork_id, sibling['id'])
+    )
+    return sibling['status']
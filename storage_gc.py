@@ -0,0 +1,205 @@
+"""
+Incremental garbage collector for files no artwork references.
+
+    python storage_gc.py [--dry-run] [--grace SECONDS] [--batch N]
+    flask --app app gc [same options]
+
+Walks uploads, thumbnails and derivative directories with os.scandir in
+batches and checks each batch against SQLite with chunked IN queries, so
+memory stays bounded by the batch size however large the tree is. Anything
+modified within the grace period is left alone (uploads in flight are
+written before their artwork row is committed).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+from config import (UPLOAD_FOLDER, THUMBNAIL_FOLDER, DERIVATIVE_FOLDER, ALLOWED_EXTENSIONS,
+                    GC_GRACE_SECONDS, GC_BATCH_SIZE)
+
+# Stay well below SQLite's bound-parameter limit per query
+QUERY_CHUNK = 500
+
+class GCReport:
+    """Counts and bytes per storage area"""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.removed = {'uploads': 0, 'thumbnails': 0, 'derivatives': 0}
+        self.bytes = {'uploads': 0, 'thumbnails': 0, 'derivatives': 0}
+        self.errors = 0
+
+    def add(self, area, size):
+        self.removed[area] += 1
+        self.bytes[area] += size
+
+    def summary(self):
+        from utils import get_file_size_formatted
+
+        verb, reclaimed = ('Would remove', 'would be reclaimed') if self.dry_run else ('Removed', 'reclaimed')
+        parts = [f"{area} {self.removed[area]} ({get_file_size_formatted(self.bytes[area])})" for area in self.removed]
+        total = get_file_size_formatted(sum(self.bytes.values()))
+        return (f"{verb}: {', '.join(parts)}; {total} {reclaimed} "
+                f"({self.scanned} entries past the grace period checked, {self.errors} errors)")
+
+def _batches(folder, batch_size, cutoff):
+    """Yield lists of DirEntry older than cutoff, batch_size at a time"""
+    batch = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    except FileNotFoundError:
+        return
+    if batch:
+        yield batch
+
+def _referenced(conn, image_paths):
+    """Subset of image_paths some artwork points at, in chunked IN queries"""
+    image_paths = list(image_paths)
+    found = set()
+    for start in range(0, len(image_paths), QUERY_CHUNK):
+        chunk = image_paths[start:start + QUERY_CHUNK]
+        rows = conn.execute(
+            f"SELECT image_path FROM artworks WHERE image_path IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ).fetchall()
+        found.update(row['image_path'] for row in rows)
+    return found
+
+def _tree_size(path):
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+def _remove(path, is_dir):
+    if is_dir:
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def _collect_files(conn, report, area, folder, batch_size, cutoff, upload_path_for):
+    """
+    Orphans in a flat folder. upload_path_for(name) maps a file name to the
+    artworks.image_path that would own it, or None for leftovers (.part, .tmp).
+    """
+    for batch in _batches(folder, batch_size, cutoff):
+        report.scanned += len(batch)
+        files = [e for e in batch if e.is_file(follow_symlinks=False)]
+        owners = {e.name: upload_path_for(e.name) for e in files}
+        candidates = [e for e in files if owners[e.name] is None]
+        referenced = _referenced(conn, {p for p in owners.values() if p})
+        candidates += [e for e in files if owners[e.name] and owners[e.name] not in referenced]
+        if not candidates:
+            continue
+
+        if report.dry_run:
+            for entry in candidates:
+                report.add(area, entry.stat(follow_symlinks=False).st_size)
+            continue
+
+        # Re-check under the write lock: a duplicate upload adopting a blob
+        # (storage.store_upload) waits for us, then finds it gone and re-stores it
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            still_referenced = _referenced(conn, {owners[e.name] for e in candidates if owners[e.name]})
+            for entry in candidates:
+                owner = owners[entry.name]
+                if owner in still_referenced:
+                    continue
+                try:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    os.remove(entry.path)
+                    report.add(area, size)
+                except OSError as e:
+                    print(f"❌ GC could not remove {entry.path}: {e}")
+                    report.errors += 1
+                    continue
+                if area == 'uploads' and owner:
+                    conn.execute('DELETE FROM blobs WHERE path = ?', (owner,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _collect_derivatives(conn, report, batch_size, cutoff):
+    """Orphan derivative directories: static/derivatives/<stem> with no upload <stem>.<ext> in use"""
+    extensions = sorted(ALLOWED_EXTENSIONS)
+    for batch in _batches(DERIVATIVE_FOLDER, batch_size, cutoff):
+        report.scanned += len(batch)
+        candidates = []
+        stems = {}
+        for entry in batch:
+            # Leftover temp dirs from an interrupted write_derivatives()
+            if entry.name.endswith('.tmp'):
+                candidates.append(entry)
+            else:
+                stems[entry.name] = entry
+        owners = {f"{UPLOAD_FOLDER}/{stem}.{ext}": stem for stem in stems for ext in extensions}
+        in_use = {owners[p] for p in _referenced(conn, owners)}
+        candidates += [entry for stem, entry in stems.items() if stem not in in_use]
+
+        for entry in candidates:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            size = _tree_size(entry.path) if is_dir else entry.stat(follow_symlinks=False).st_size
+            if not report.dry_run:
+                try:
+                    _remove(entry.path, is_dir)
+                except OSError as e:
+                    print(f"❌ GC could not remove {entry.path}: {e}")
+                    report.errors += 1
+                    continue
+            report.add('derivatives', size)
+
+def _upload_owner(name):
+    return None if name.startswith('.') else f"{UPLOAD_FOLDER}/{name}"
+
+def _thumbnail_owner(name):
+    return None if name.endswith('.tmp') else f"{UPLOAD_FOLDER}/{name}"
+
+def collect_garbage(dry_run=False, grace_seconds=GC_GRACE_SECONDS, batch_size=GC_BATCH_SIZE):
+    """Remove unreferenced uploads, thumbnails and derivatives. Returns a GCReport"""
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    report = GCReport(dry_run)
+    cutoff = time.time() - grace_seconds
+
+    _collect_files(conn, report, 'uploads', UPLOAD_FOLDER, batch_size, cutoff, _upload_owner)
+    _collect_files(conn, report, 'thumbnails', THUMBNAIL_FOLDER, batch_size, cutoff, _thumbnail_owner)
+    _collect_derivatives(conn, report, batch_size, cutoff)
+
+    print(f"{'🔍' if dry_run else '🧹'} {report.summary()}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remove stored files no artwork references')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    parser.add_argument('--grace', type=int, default=GC_GRACE_SECONDS,
+                        help='Skip files modified in the last SECONDS (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=GC_BATCH_SIZE, help='Directory entries per batch')
+    args = parser.parse_args(argv)
+
+    from db import init_db
+    init_db()
+    report = collect_garbage(dry_run=args.dry_run, grace_seconds=args.grace, batch_size=args.batch)
+    return 1 if report.errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
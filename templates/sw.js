@@ -0,0 +1,143 @@
+// Gallery service worker, rendered by offline.py (served as /sw.js)
+//
+// - App shell (bundles, modules, page, favicon): precached per version, cache-first
+// - Thumbnails and derivatives: cache-first, LRU-limited, immutable responses only
+// - /api/artworks: stale-while-revalidate, dropped after any write
+// - Pages: network-first, falling back to the cached shell when offline
+const VERSION = {{ version|tojson }};
+const SHELL_CACHE = `gallery-shell-${VERSION}`;
+const API_CACHE = `gallery-api-${VERSION}`;
+// Content-addressed URLs stay valid across versions
+const IMAGE_CACHE = 'gallery-images-v1';
+const CURRENT_CACHES = [SHELL_CACHE, API_CACHE, IMAGE_CACHE];
+const LIMITS = {
+  [IMAGE_CACHE]: {{ image_cache_entries|tojson }},
+  [API_CACHE]: {{ api_cache_entries|tojson }},
+};
+
+self.addEventListener('install', (event) => {
+  event.waitUntil((async () => {
+    const response = await fetch('/api/precache-manifest', { cache: 'no-cache' });
+    const manifest = await response.json();
+    const cache = await caches.open(SHELL_CACHE);
+    // Fingerprinted files may come from the HTTP cache; anything else must be current
+    await cache.addAll(manifest.entries.map(
+      (entry) => new Request(entry.url, { cache: entry.revision ? 'no-cache' : 'default' })
+    ));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil((async () => {
+    for (const name of await caches.keys()) {
+      if (name.startsWith('gallery-') && !CURRENT_CACHES.includes(name)) {
+        await caches.delete(name);
+      }
+    }
+    await self.clients.claim();
+  })());
+});
+
+// Cache keys are kept in insertion order, so re-putting an entry marks it most
+// recently used and the oldest keys are the ones to evict
+const trimming = {};
+function trim(cacheName) {
+  trimming[cacheName] = (trimming[cacheName] || Promise.resolve()).then(async () => {
+    const cache = await caches.open(cacheName);
+    const keys = await cache.keys();
+    for (const key of keys.slice(0, Math.max(0, keys.length - LIMITS[cacheName]))) {
+      await cache.delete(key);
+    }
+  }).catch(() => {});
+  return trimming[cacheName];
+}
+
+async function store(cacheName, request, response) {
+  const cache = await caches.open(cacheName);
+  await cache.delete(request);
+  await cache.put(request, response);
+  await trim(cacheName);
+}
+
+function isImmutable(response) {
+  return response.ok && /\bimmutable\b/.test(response.headers.get('Cache-Control') || '');
+}
+
+async function imageFirst(event) {
+  const cache = await caches.open(IMAGE_CACHE);
+  const cached = await cache.match(event.request);
+  if (cached) {
+    event.waitUntil(store(IMAGE_CACHE, event.request, cached.clone()));
+    return cached;
+  }
+  const response = await fetch(event.request);
+  // Uploads still being processed are served raw and revalidated; never pin those
+  if (isImmutable(response)) {
+    event.waitUntil(store(IMAGE_CACHE, event.request, response.clone()));
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event) {
+  const cache = await caches.open(API_CACHE);
+  const cached = await cache.match(event.request);
+  const refresh = fetch(event.request).then(async (response) => {
+    if (response.ok) {
+      await store(API_CACHE, event.request, response.clone());
+    }
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(refresh.catch(() => {}));
+    return cached;
+  }
+  return refresh;
+}
+
+async function shellFirst(event) {
+  const cached = await caches.match(event.request, { cacheName: SHELL_CACHE });
+  return cached || fetch(event.request);
+}
+
+async function networkFirst(event) {
+  try {
+    const response = await fetch(event.request);
+    const url = new URL(event.request.url);
+    if (response.ok && url.pathname === '/' && !url.search) {
+      const cache = await caches.open(SHELL_CACHE);
+      event.waitUntil(cache.put('/', response.clone()));
+    }
+    return response;
+  } catch (error) {
+    const cached = await caches.match(event.request, { cacheName: SHELL_CACHE })
+      || await caches.match('/', { cacheName: SHELL_CACHE });
+    if (cached) return cached;
+    throw error;
+  }
+}
+
+async function passWrite(event) {
+  const response = await fetch(event.request);
+  // Any write may change what the listings return; the page usually refetches right away
+  await caches.delete(API_CACHE);
+  return response;
+}
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (event.request.method !== 'GET') {
+    event.respondWith(passWrite(event));
+  } else if (event.request.mode === 'navigate') {
+    event.respondWith(networkFirst(event));
+  } else if (url.pathname.startsWith('/thumbnail/') || url.pathname.startsWith('/image/')) {
+    event.respondWith(imageFirst(event));
+  } else if (url.pathname === '/api/artworks') {
+    event.respondWith(staleWhileRevalidate(event));
+  } else if (url.pathname.startsWith('/static/')) {
+    event.respondWith(shellFirst(event));
+  }
+  // Everything else goes straight to the network
+});
@@ -0,0 +1,47 @@
+"""
+Tests run against a scratch library. config.py resolves the database and
+static folders when first imported, so point them at a temp dir before
+anything imports it (as benchmarks/__main__.py does).
+"""
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='gallery-tests-')
+os.environ['GALLERY_DATABASE'] = os.path.join(WORKDIR, 'database.db')
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
+
+import config
+from db import init_db, get_db_connection, close_db_connection
+
+def pytest_sessionfinish(session):
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """This thread's connection to a fresh, initialised database"""
+    monkeypatch.setattr(config, 'DATABASE_PATH', str(tmp_path / 'gallery.db'))
+    init_db()
+    conn = get_db_connection()
+    yield conn
+    close_db_connection()
+
+def add_artworks(conn, count, **columns):
+    """Insert `count` bare artworks, first one on top; returns their ids in display order"""
+    ids = []
+    for i in range(count):
+        values = {'title': f'Artwork {i}', 'description': '', 'image_path': f'static/uploads/{i}.png',
+                  'position': (count - i) * config.POSITION_STEP}
+        values.update({name: value(i) if callable(value) else value for name, value in columns.items()})
+        cursor = conn.execute(
+            f"INSERT INTO artworks ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+            list(values.values())
+        )
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    return ids
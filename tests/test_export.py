@@ -0,0 +1,117 @@
+import io
+import os
+import json
+import zlib
+import zipfile
+import pytest
+from flask import Flask
+from conftest import add_artworks
+from export import register_export_routes, ZipStream, ZIP32_LIMIT
+
+@pytest.fixture
+def client(conn):
+    app = Flask(__name__)
+    register_export_routes(app)
+    return app.test_client()
+
+@pytest.fixture
+def originals(conn):
+    """Three distinct files, the last one shared by two artworks; returns {archive name: bytes}"""
+    contents = {}
+    paths = []
+    for i, size in enumerate((10, 70000, 3)):
+        path = f'static/uploads/export-{i}.bin'
+        data = os.urandom(size)
+        with open(path, 'wb') as f:
+            f.write(data)
+        contents[f'uploads/export-{i}.bin'] = data
+        paths.append(path)
+    paths.append(paths[-1])
+    add_artworks(conn, len(paths), image_path=lambda i: paths[i])
+    return contents
+
+class ArchiveReader(io.RawIOBase):
+    """Seekable file over a ZipStream that only produces the ranges zipfile reads"""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.position = 0
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.archive.size}[whence] + offset
+        return self.position
+
+    def read(self, size=-1):
+        stop = self.archive.size if size is None or size < 0 else min(self.position + size, self.archive.size)
+        data = b''.join(self.archive.iter_bytes(self.position, stop))
+        self.position += len(data)
+        return data
+
+def test_originals_zip_is_readable(client, originals):
+    response = client.get('/api/export/originals.zip')
+    assert response.status_code == 200
+    assert response.content_length == len(response.data)
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(originals)
+        for name, data in originals.items():
+            assert archive.read(name) == data
+
+def test_range_request_resumes_the_download(client, originals):
+    full = client.get('/api/export/originals.zip')
+    etag = full.headers['ETag']
+
+    resumed = client.get('/api/export/originals.zip', headers={'Range': 'bytes=1000-', 'If-Range': etag})
+    assert resumed.status_code == 206
+    assert resumed.headers['Content-Range'] == f'bytes 1000-{len(full.data) - 1}/{len(full.data)}'
+    assert resumed.data == full.data[1000:]
+
+    # Spans the end of a file, its data descriptor and the next local header
+    middle = client.get('/api/export/originals.zip', headers={'Range': 'bytes=70100-70199'})
+    assert middle.status_code == 206
+    assert middle.data == full.data[70100:70200]
+
+    # The archive changed since: the whole new one, not a range of it
+    stale = client.get('/api/export/originals.zip', headers={'Range': 'bytes=1000-', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == full.data
+
+def test_unsatisfiable_range(client, originals):
+    size = len(client.get('/api/export/originals.zip').data)
+    response = client.get('/api/export/originals.zip', headers={'Range': f'bytes={size}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{size}'
+
+def test_large_file_gets_zip64_records(tmp_path):
+    big = tmp_path / 'big.bin'
+    try:
+        with open(big, 'wb') as f:
+            f.truncate(ZIP32_LIMIT + 1)     # sparse: nothing is written
+    except OSError:
+        pytest.skip('no sparse files here')
+    small = tmp_path / 'small.bin'
+    small.write_bytes(b'after the big one')
+    files = [(f'uploads/{p.name}', str(p), p.stat().st_size, p.stat().st_mtime_ns) for p in (big, small)]
+    # The big file is never read: its CRC comes from the checksum cache
+    checksums = {(str(big), ZIP32_LIMIT + 1, big.stat().st_mtime_ns): 0}
+    archive = ZipStream(files, checksums)
+
+    with zipfile.ZipFile(ArchiveReader(archive)) as reader:
+        big_info, small_info = reader.infolist()
+        assert big_info.file_size == ZIP32_LIMIT + 1
+        assert small_info.header_offset > ZIP32_LIMIT
+        assert reader.read('uploads/small.bin') == b'after the big one'
+        assert small_info.CRC == zlib.crc32(b'after the big one')
+
+def test_ndjson_export_lists_every_artwork(client, originals):
+    response = client.get('/api/export/artworks?format=ndjson')
+    rows = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [row['image_path'] for row in rows] == [f'static/uploads/export-{i}.bin' for i in (0, 1, 2, 2)]
@@ -0,0 +1,83 @@
+import pytest
+from conftest import add_artworks
+from config import GALLERY_MAX_PAGE_SIZE
+from gallery import SORT_KEYS, fetch_artwork_page, encode_cursor, decode_cursor, InvalidCursor
+
+TITLES = ['banana', 'Apple', None, '', 'apple', 'cherry', 'banana', None, 'Date', 'cherry', 'elder', '', 'fig']
+# (width, height): ties, and unknown sizes as for SVGs or images still processing
+SIZES = [(800, 600), (600, 800), (None, None), (1024, 1024), (800, 600), (480, 320), (None, None),
+         (1920, 1080), (600, 800), (1024, 1024), (320, 480), (800, 600), (None, None)]
+# Several artworks share a timestamp, as a batch upload does
+CREATED = ['2024-01-0%d 12:00:00' % (1 + i // 3) for i in range(len(TITLES))]
+
+def pixels(art):
+    return art['width'] * art['height'] if art['width'] is not None else None
+
+# Expected display order per sort mode, worked out in Python from the rows
+EXPECTED = {
+    'position': lambda arts: sorted(arts, key=lambda a: (a['position'], a['id']), reverse=True),
+    'newest': lambda arts: sorted(arts, key=lambda a: (a['created_at'], a['id']), reverse=True),
+    'oldest': lambda arts: sorted(arts, key=lambda a: (a['created_at'], a['id'])),
+    'a-z': lambda arts: sorted(arts, key=lambda a: (not a['title'], (a['title'] or '').lower(), a['id'])),
+    'z-a': lambda arts: sorted(arts, key=lambda a: ((a['title'] or '').lower(), a['id']), reverse=True),
+    'largest': lambda arts: sorted(arts, key=lambda a: (pixels(a) if pixels(a) is not None else -1, a['id']),
+                                   reverse=True),
+    'smallest': lambda arts: sorted(arts, key=lambda a: (pixels(a) is None, pixels(a) or 0, a['id'])),
+}
+
+@pytest.fixture
+def library(conn):
+    add_artworks(conn, len(TITLES), title=lambda i: TITLES[i], created_at=lambda i: CREATED[i],
+                 width=lambda i: SIZES[i][0], height=lambda i: SIZES[i][1],
+                 aspect_ratio=lambda i: SIZES[i][0] / SIZES[i][1] if SIZES[i][0] else None)
+    return conn
+
+def all_pages(conn, sort, limit, **filters):
+    ids, cursor = [], None
+    while True:
+        artworks, cursor = fetch_artwork_page(conn, sort=sort, cursor=cursor, limit=limit, **filters)
+        assert len(artworks) <= limit
+        ids += [art['id'] for art in artworks]
+        if cursor is None:
+            return ids
+
+def test_every_sort_mode_has_an_expected_order():
+    assert set(EXPECTED) == set(SORT_KEYS)
+
+@pytest.mark.parametrize('sort', sorted(SORT_KEYS))
+@pytest.mark.parametrize('limit', [1, 3, 4])
+def test_pages_concatenate_to_the_full_listing(library, sort, limit):
+    full, cursor = fetch_artwork_page(library, sort=sort, limit=GALLERY_MAX_PAGE_SIZE)
+    assert cursor is None
+    assert [art['id'] for art in full] == [art['id'] for art in EXPECTED[sort](full)]
+    assert all_pages(library, sort, limit) == [art['id'] for art in full]
+
+@pytest.mark.parametrize('sort', sorted(SORT_KEYS))
+def test_last_full_page_has_no_cursor(library, sort):
+    artworks, cursor = fetch_artwork_page(library, sort=sort, limit=len(TITLES))
+    assert len(artworks) == len(TITLES) and cursor is None
+
+@pytest.mark.parametrize('sort', ['position', 'a-z', 'largest'])
+def test_pages_with_a_filter(library, sort):
+    full, _ = fetch_artwork_page(library, sort=sort, limit=GALLERY_MAX_PAGE_SIZE, orientation='landscape')
+    assert full and all(art['aspect_ratio'] > 1.05 for art in full)
+    assert all_pages(library, sort, 2, orientation='landscape') == [art['id'] for art in full]
+
+@pytest.mark.parametrize('sort', sorted(SORT_KEYS))
+def test_cursor_round_trip(sort):
+    values = [None, 'Ünïcode / title', 12.5, 7][:len(SORT_KEYS[sort])]
+    cursor = encode_cursor(sort, values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, sort) == values
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor('newest', [1]), encode_cursor('a-z', ['x', 1])])
+def test_cursor_that_does_not_fit_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 'newest')
+
+def test_unknown_sort_mode(conn):
+    with pytest.raises(InvalidCursor):
+        fetch_artwork_page(conn, sort='random')
+
+def test_text_without_searchable_words_matches_nothing(library):
+    assert fetch_artwork_page(library, q='!!!') == ([], None)
@@ -0,0 +1,104 @@
+import os
+import time
+import pytest
+from PIL import Image
+from concurrent.futures.process import BrokenProcessPool
+import jobs
+from jobs import JobQueue, PROCESS_UPLOAD, enqueue_job, get_job, requeue_failed_uploads
+
+def add_upload(conn, name, status='processing'):
+    """An artwork waiting for its process_upload job; returns (artwork id, job id)"""
+    path = f'static/uploads/{name}.png'
+    Image.new('RGB', (640, 480), (200, 40, 40)).save(path)
+    cursor = conn.execute(
+        "INSERT INTO artworks (title, description, image_path, status, position) VALUES (?, '', ?, ?, 1)",
+        (name, path, status)
+    )
+    job_id = enqueue_job(conn, PROCESS_UPLOAD, {'image_path': path}, artwork_id=cursor.lastrowid)
+    conn.commit()
+    return cursor.lastrowid, job_id
+
+def artwork_status(conn, artwork_id):
+    return conn.execute('SELECT status FROM artworks WHERE id = ?', (artwork_id,)).fetchone()[0]
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1)
+    yield queue
+    queue.stop()
+
+def test_job_left_running_by_a_dead_process_is_resumed(conn, queue):
+    artwork_id, job_id = add_upload(conn, 'resumed')
+    # What a crash mid-job leaves behind: claimed, attempt counted, lease long expired
+    conn.execute("UPDATE jobs SET status = 'running', attempts = 1, updated_at = datetime('now', '-1 day') WHERE id = ?",
+                 (job_id,))
+    conn.commit()
+    queue.start()
+    assert wait_for(lambda: get_job(conn, job_id)['status'] == 'done')
+    assert get_job(conn, job_id)['attempts'] == 2
+    assert artwork_status(conn, artwork_id) == 'ready'
+    assert os.path.exists('static/thumbnails/resumed.png')
+
+def test_shutdown_leaves_unstarted_jobs_queued(conn, queue):
+    uploads = [add_upload(conn, f'shutdown{i}') for i in range(3)]
+    queue.start()
+    queue.stop()
+    for artwork_id, job_id in uploads:
+        job = get_job(conn, job_id)
+        assert (job['status'], job['attempts']) in (('queued', 0), ('done', 1))
+        assert artwork_status(conn, artwork_id) in ('processing', 'ready')
+
+def test_refused_submit_does_not_use_an_attempt(conn, queue, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_POLL_INTERVAL', 0.05)
+    refusals = []
+
+    def refuse():
+        refusals.append(1)
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+    monkeypatch.setattr(queue, '_get_pool', refuse)
+    artwork_id, job_id = add_upload(conn, 'refused')
+    queue.start()
+    assert wait_for(lambda: len(refusals) > jobs.JOB_MAX_ATTEMPTS)
+    queue.stop()
+    job = get_job(conn, job_id)
+    assert (job['status'], job['attempts']) == ('queued', 0)
+    assert artwork_status(conn, artwork_id) == 'processing'
+
+def test_failed_uploads_are_requeued_after_restart(conn, queue):
+    stranded_id, stranded_job = add_upload(conn, 'stranded', status='failed')
+    moved_id, moved_job = add_upload(conn, 'moved-on', status='failed')
+    conn.execute("UPDATE jobs SET status = 'failed', attempts = ? WHERE id IN (?, ?)",
+                 (jobs.JOB_MAX_ATTEMPTS, stranded_job, moved_job))
+    # This artwork has since been given another image: its old job stays failed
+    conn.execute("UPDATE artworks SET image_path = 'static/uploads/other.png', status = 'ready' WHERE id = ?",
+                 (moved_id,))
+    conn.commit()
+
+    assert requeue_failed_uploads(conn) == 1
+    conn.commit()
+    assert (get_job(conn, stranded_job)['status'], get_job(conn, stranded_job)['attempts']) == ('queued', 0)
+    assert artwork_status(conn, stranded_id) == 'processing'
+    assert get_job(conn, moved_job)['status'] == 'failed'
+
+    queue.start()
+    assert wait_for(lambda: get_job(conn, stranded_job)['status'] == 'done')
+    assert artwork_status(conn, stranded_id) == 'ready'
+
+def test_bad_image_fails_after_its_attempts(conn, queue):
+    artwork_id, job_id = add_upload(conn, 'truncated')
+    path = get_job(conn, job_id)['payload']['image_path']
+    with open(path, 'r+b') as f:
+        f.truncate(100)
+    queue.start()
+    assert wait_for(lambda: get_job(conn, job_id)['status'] == 'failed')
+    assert get_job(conn, job_id)['attempts'] == jobs.JOB_MAX_ATTEMPTS
+    assert artwork_status(conn, artwork_id) == 'failed'
@@ -0,0 +1,86 @@
+import pytest
+from conftest import add_artworks
+from config import POSITION_STEP, MIN_POSITION_GAP
+from gallery import fetch_artwork_page
+from ordering import move_artwork, InvalidMove, TIGHT_GAP
+
+def displayed(conn):
+    return [row['id'] for row in conn.execute('SELECT id FROM artworks ORDER BY position DESC, id DESC')]
+
+def position(conn, artwork_id):
+    return conn.execute('SELECT position FROM artworks WHERE id = ?', (artwork_id,)).fetchone()[0]
+
+def loaded_page(conn, limit):
+    artworks, _ = fetch_artwork_page(conn, limit=limit)
+    return [art['id'] for art in artworks]
+
+def test_drop_on_last_loaded_tile_lands_above_the_next_unloaded_one(conn):
+    ids = add_artworks(conn, 10)
+    page = loaded_page(conn, 4)
+    # The client drags the top tile below the last one it has loaded
+    move_artwork(conn, page[0], before_id=page[-1], after_id=None)
+    assert displayed(conn) == ids[1:4] + [ids[0]] + ids[4:]
+    assert position(conn, ids[4]) < position(conn, ids[0]) < position(conn, ids[3])
+
+def test_missing_before_neighbour_is_looked_up_above(conn):
+    ids = add_artworks(conn, 10)
+    move_artwork(conn, ids[9], before_id=None, after_id=ids[5])
+    assert displayed(conn) == ids[:5] + [ids[9]] + ids[5:9]
+
+def test_repeated_drops_below_the_loaded_page_stay_distinct(conn):
+    ids = add_artworks(conn, 10)
+    for _ in range(3):
+        page = loaded_page(conn, 4)
+        move_artwork(conn, page[0], before_id=page[-1], after_id=None)
+    positions = [position(conn, i) for i in ids]
+    assert len(set(positions)) == len(positions)
+    assert displayed(conn) == ids[3:4] + ids[:3] + ids[4:]
+
+def test_move_to_bottom_goes_past_unloaded_pages(conn):
+    ids = add_artworks(conn, 10)
+    move_artwork(conn, ids[1], to='bottom')
+    move_artwork(conn, ids[0], before_id=ids[1], after_id=None)
+    assert displayed(conn) == ids[2:] + [ids[1], ids[0]]
+    assert position(conn, ids[1]) == position(conn, ids[9]) - POSITION_STEP
+
+def test_move_to_top(conn):
+    ids = add_artworks(conn, 5)
+    move_artwork(conn, ids[3], to='top')
+    assert displayed(conn) == [ids[3]] + ids[:3] + ids[4:]
+    assert position(conn, ids[3]) == position(conn, ids[0]) + POSITION_STEP
+
+def test_move_to_the_real_bottom_of_the_gallery(conn):
+    ids = add_artworks(conn, 4)
+    move_artwork(conn, ids[0], before_id=ids[3], after_id=None)
+    assert displayed(conn) == ids[1:] + [ids[0]]
+    assert position(conn, ids[0]) == position(conn, ids[3]) - POSITION_STEP
+
+def test_exhausted_gap_rebalances_and_keeps_the_order(conn):
+    ids = add_artworks(conn, 4)
+    conn.execute('UPDATE artworks SET position = ? WHERE id = ?', (position(conn, ids[1]) - MIN_POSITION_GAP, ids[2]))
+    new_pos, tight = move_artwork(conn, ids[3], before_id=ids[1], after_id=ids[2])
+    assert displayed(conn) == [ids[0], ids[1], ids[3], ids[2]]
+    gaps = [position(conn, a) - position(conn, b) for a, b in zip(displayed(conn), displayed(conn)[1:])]
+    assert min(gaps) >= POSITION_STEP / 2
+    assert not tight
+
+def test_small_gap_is_reported_tight(conn):
+    ids = add_artworks(conn, 3)
+    conn.execute('UPDATE artworks SET position = ? WHERE id = ?', (position(conn, ids[0]) - TIGHT_GAP, ids[1]))
+    _, tight = move_artwork(conn, ids[2], before_id=ids[0], after_id=ids[1])
+    assert tight
+    assert displayed(conn) == [ids[0], ids[2], ids[1]]
+
+@pytest.mark.parametrize('move', [
+    {'id': None, 'before_id': 1},
+    {'id': 1},
+    {'id': 1, 'before_id': 1},
+    {'id': 1, 'to': 'middle'},
+    {'id': 1.5, 'before_id': 2},
+    {'id': 99, 'before_id': 1},
+    {'id': 1, 'before_id': 3, 'after_id': 2},
+])
+def test_invalid_moves(conn, move):
+    add_artworks(conn, 3)
+    with pytest.raises(InvalidMove):
+        move_artwork(conn, move.pop('id'), **move)
@@ -1,29 +1,65 @@
 import os
-from config import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, THUMBNAIL_FOLDER
+import shutil
+from PIL import Image
+from config import (ALLOWED_EXTENSIONS, UPLOAD_FOLDER, THUMBNAIL_FOLDER, DERIVATIVE_FOLDER,
+                    MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS)
+from storage import release_blob
+from intake import sniff_image_format
 
 def validate_image_file(file):
-    """Validate uploaded image file"""
+    """
+    Validate uploaded image file by its content, not its name.
+    On success 'format' holds the extension to store it under.
+    """
     if not file or file.filename == '':
         return {'valid': False, 'message': 'No file selected'}
     
-    # Check file extension
-    if not ('.' in file.filename and 
-            file.filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS):
-        return {'valid': False, 'message': 'Invalid file type. Please select: JPG, PNG, GIF, WebP, SVG'}
-    
-    # Check file size
+    # Check file size (the upload is already spooled, seeking is cheap)
     file.seek(0, 2)  # Go to end of file
     file_length = file.tell()
     file.seek(0)  # Reset to beginning
     
-    max_size = 15 * 1024 * 1024  # 15MB
-    if file_length > max_size:
-        return {'valid': False, 'message': f'File too large ({file_length // 1024 // 1024}MB). Max size: 15MB'}
+    max_mb = MAX_UPLOAD_BYTES // 1024 // 1024
+    if file_length > MAX_UPLOAD_BYTES:
+        return {'valid': False, 'message': f'File too large ({file_length // 1024 // 1024}MB). Max size: {max_mb}MB'}
+    
+    # Check file type from the magic bytes
+    image_format = sniff_image_format(file.stream)
+    if image_format not in ALLOWED_EXTENSIONS:
+        return {'valid': False, 'message': 'Invalid file type. Please select: JPG, PNG, GIF, WebP, SVG'}
+    
+    # Check dimensions from the header only - nothing is decoded yet
+    if image_format != 'svg':
+        try:
+            with Image.open(file.stream) as img:
+                width, height = img.size
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+            return {'valid': False, 'message': f'Image too large. Max: {MAX_IMAGE_PIXELS // 1_000_000} megapixels'}
+        except Exception:
+            return {'valid': False, 'message': 'File is not a readable image'}
+        finally:
+            file.stream.seek(0)
+        if width * height > MAX_IMAGE_PIXELS:
+            return {'valid': False, 'message': f'Image too large ({width}x{height}). Max: {MAX_IMAGE_PIXELS // 1_000_000} megapixels'}
     
-    return {'valid': True, 'message': 'File is valid'}
+    return {'valid': True, 'message': 'File is valid', 'format': image_format}
+
+def release_old_files(conn, image_path):
+    """
+    Drop one blob reference to image_path in the caller's transaction, so it
+    rolls back with the row change. Returns the path to pass to
+    cleanup_old_files() once the caller has committed, or None while another
+    artwork still shares the files.
+    """
+    if image_path and release_blob(conn, image_path):
+        return image_path
+    return None
 
 def cleanup_old_files(image_path):
-    """Remove old image and its thumbnail"""
+    """
+    Remove old image, its thumbnail and its derivatives. Only call it after
+    the change that stopped using them is committed (see release_old_files).
+    """
     if image_path and image_path.startswith('static/uploads/') and os.path.exists(image_path):
         try:
             # Remove original image
@@ -33,13 +69,18 @@ def cleanup_old_files(image_path):
             thumb_path = image_path.replace('/uploads/', '/thumbnails/')
             if os.path.exists(thumb_path):
                 os.remove(thumb_path)
+            
+            # Remove responsive derivatives
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            shutil.rmtree(os.path.join(DERIVATIVE_FOLDER, stem), ignore_errors=True)
         except OSError as e:
             print(f"Error removing files: {e}")
 
 def ensure_directories():
-    """Ensure upload and thumbnail directories exist"""
+    """Ensure upload, thumbnail and derivative directories exist"""
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+    os.makedirs(DERIVATIVE_FOLDER, exist_ok=True)
 
 def get_file_size_formatted(size_bytes):
     """Format file size in human readable format"""
@@ -53,36 +94,8 @@ def get_file_size_formatted(size_bytes):
     return f"{size_bytes:.1f}{size_names[i]}"
 
 def cleanup_orphaned_files():
-    """Remove files that don't have corresponding database entries"""
-    from db import get_db_connection
-    import glob
-    
-    # Get all image paths from database
-    conn = get_db_connection()
-    db_paths = set()
-    artworks = conn.execute('SELECT image_path FROM artworks').fetchall()
-    for artwork in artworks:
-        db_paths.add(artwork['image_path'])
-    conn.close()
-    
-    # Check files in upload folder
-    upload_files = glob.glob(os.path.join(UPLOAD_FOLDER, '*'))
-    removed_count = 0
-    
-    for file_path in upload_files:
-        relative_path = file_path.replace('\\', '/')  # Normalize path separators
-        if relative_path not in db_paths:
-            try:
-                os.remove(file_path)
-                removed_count += 1
-                
-                # Also remove corresponding thumbnail
-                filename = os.path.basename(file_path)
-                thumb_path = os.path.join(THUMBNAIL_FOLDER, filename)
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-                    
-            except OSError as e:
-                print(f"Error removing orphaned file {file_path}: {e}")
+    """Remove files that don't have corresponding database entries (see storage_gc.py)"""
+    from storage_gc import collect_garbage
     
-    return removed_count
\ No newline at end of file
+    report = collect_garbage()
+    return sum(report.removed.values())